@@ -0,0 +1,347 @@
+# load_test.py
+
+import argparse
+import os
+import re
+import sys
+import json
+import gzip
+import time
+import random
+import asyncio
+import datetime
+import subprocess
+import urllib.parse
+
+BENCHMARKS_DIR = os.path.dirname(os.path.abspath(__file__))
+ROOT_DIR = os.path.dirname(BENCHMARKS_DIR)
+
+# This loads the puzzle server with simulated visitors, each on its own kept-alive connection, as many at once as
+# asked for, until time is up.  A visit loads the page the way a browser would: the page and what it links to, the
+# menu and its atlas, the textures, the first puzzle at its coarsest level of detail and then in full, and then a few
+# more puzzles, picked with a Zipf distribution so that a few are popular and most aren't.  Some visitors come back,
+# and those ask again only for what they don't already have for good, conditionally, as a browser revalidates its
+# cache.  Every request is timed, and the results are written out as JSON, so that runs against different server
+# configurations can be compared.  Only the standard library is used, so that it runs wherever the server does.
+
+class HttpConnection(object):
+    # Just enough HTTP/1.1 to keep a connection alive and read responses, sized or chunked.
+    def __init__(self, host, port, timeout):
+        self.host = host
+        self.port = port
+        self.timeout = timeout
+        self.reader = None
+        self.writer = None
+
+    async def close(self):
+        if self.writer is not None:
+            self.writer.close()
+            try:
+                await self.writer.wait_closed()
+            except OSError:
+                pass
+        self.reader = None
+        self.writer = None
+
+    async def request(self, path, header_map):
+        # Return the status, the headers, with their names in lower case, and the body, as it came over the wire.
+        for attempt in range(2):
+            if self.writer is None:
+                self.reader, self.writer = await asyncio.wait_for(asyncio.open_connection(self.host, self.port), self.timeout)
+                attempt = 1     # A fresh connection that fails is a real failure.
+            header_text = ''.join(['%s: %s\r\n' % (name, value) for name, value in header_map.items()])
+            self.writer.write(('GET %s HTTP/1.1\r\nHost: %s:%d\r\n%s\r\n' % (path, self.host, self.port, header_text)).encode('latin-1'))
+            try:
+                await self.writer.drain()
+                return await asyncio.wait_for(self._read_response(), self.timeout)
+            except (ConnectionError, asyncio.IncompleteReadError):
+                # The server may have closed a kept-alive connection between requests, so we try once more.
+                await self.close()
+                if attempt > 0:
+                    raise
+
+    async def _read_response(self):
+        status_line = await self.reader.readuntil(b'\r\n')
+        status = int(status_line.split()[1])
+        header_map = {}
+        while True:
+            line = await self.reader.readuntil(b'\r\n')
+            if line == b'\r\n':
+                break
+            name, value = line.decode('latin-1').split(':', 1)
+            header_map[name.strip().lower()] = value.strip()
+        body = b''
+        if status not in (204, 304):
+            if header_map.get('transfer-encoding', '').lower() == 'chunked':
+                chunk_list = []
+                while True:
+                    size = int((await self.reader.readuntil(b'\r\n')).split(b';')[0], 16)
+                    if size == 0:
+                        while (await self.reader.readuntil(b'\r\n')) != b'\r\n':
+                            pass
+                        break
+                    chunk_list.append(await self.reader.readexactly(size))
+                    await self.reader.readexactly(2)
+                body = b''.join(chunk_list)
+            elif 'content-length' in header_map:
+                body = await self.reader.readexactly(int(header_map['content-length']))
+            else:
+                body = await self.reader.read()
+        if header_map.get('connection', '').lower() == 'close':
+            await self.close()
+        return status, header_map, body
+
+class LoadRecorder(object):
+    def __init__(self):
+        self.record_list = []
+        self.error_list = []
+
+    def add(self, kind, status, seconds, byte_count):
+        self.record_list.append((kind, status, seconds, byte_count))
+
+    def add_error(self, kind, error):
+        self.error_list.append((kind, repr(error)))
+
+class Visitor(object):
+    # Remembers what a browser would have cached: the validators of everything it fetched, and what it need never
+    # fetch again, because it was marked immutable.
+    def __init__(self):
+        self.validator_map = {}
+        self.immutable_set = set()
+
+async def fetch(connection, recorder, visitor, kind, path):
+    # Fetch the path as a browser would, conditionally if we've seen it before, and not at all if we have it for good.
+    if path in visitor.immutable_set:
+        return None
+    header_map = {'Accept-Encoding': 'gzip, br', 'Connection': 'keep-alive'}
+    validator = visitor.validator_map.get(path)
+    if validator is not None:
+        if validator[0] is not None:
+            header_map['If-None-Match'] = validator[0]
+        if validator[1] is not None:
+            header_map['If-Modified-Since'] = validator[1]
+    start_time = time.perf_counter()
+    try:
+        status, response_header_map, body = await connection.request(path, header_map)
+    except Exception as error:
+        recorder.add_error(kind, error)
+        await connection.close()
+        return None
+    recorder.add(kind, status, time.perf_counter() - start_time, len(body))
+    if status == 200:
+        visitor.validator_map[path] = (response_header_map.get('etag'), response_header_map.get('last-modified'))
+        if 'immutable' in response_header_map.get('cache-control', ''):
+            visitor.immutable_set.add(path)
+    return status, response_header_map, body
+
+def decode_body(header_map, body):
+    if header_map.get('content-encoding') == 'gzip':
+        return gzip.decompress(body)
+    return body
+
+class SiteModel(object):
+    # What the page fetches, learned from the server itself before the run begins.
+    def __init__(self):
+        self.page_asset_list = []
+        self.menu_asset_list = []
+        self.puzzle_name_list = []
+        self.lod_name_set = set()
+        self.texture_list = ['images/face_texture_%d.jpg' % i for i in range(19)]
+        self.shader_list = []
+        self.initial_puzzle = 'RubiksCube'
+
+async def learn_site(host, port, timeout):
+    connection = HttpConnection(host, port, timeout)
+    recorder = LoadRecorder()
+    visitor = Visitor()
+    site = SiteModel()
+    try:
+        status, header_map, body = await fetch(connection, recorder, visitor, 'page', '/')
+        html = decode_body(header_map, body).decode('utf-8')
+        for path in re.findall(r'(?:src|href)=["\']([^"\']+)["\']', html):
+            if '://' not in path:
+                site.page_asset_list.append('/' + path)
+        if '/bundle/' not in html:
+            site.shader_list = ['/shaders/puzzle_vert_shader.txt', '/shaders/puzzle_frag_shader.txt']
+
+        status, header_map, body = await fetch(connection, recorder, visitor, 'menu', '/puzzle_menu.json')
+        menu = json.loads(decode_body(header_map, body).decode('utf-8'))
+        site.puzzle_name_list = [entry['puzzle_name'] for entry in menu]
+        # The page takes the smallest atlas big enough for an icon, which is the biggest here, or the loose icons.
+        atlas_set = set()
+        for entry in menu:
+            png_atlas_list = [atlas for atlas in entry.get('puzzle_atlas_list', []) if atlas['atlas_format'] == 'png']
+            if len(png_atlas_list) > 0:
+                atlas_set.add('/' + max(png_atlas_list, key=lambda atlas: atlas['atlas_rect'][2])['atlas_image'])
+            else:
+                atlas_set.add('/images/' + entry['puzzle_name'] + '.png')
+        site.menu_asset_list = sorted(atlas_set)
+
+        # A puzzle with levels of detail sends its coarsest first, and the page then asks for the full puzzle.
+        for name in site.puzzle_name_list:
+            status, header_map, body = await fetch(connection, recorder, visitor, 'puzzle', '/puzzle?' + urllib.parse.urlencode({'name': name, 'lod': 0}))
+            if status == 200 and b'"lod"' in decode_body(header_map, body):
+                site.lod_name_set.add(name)
+    finally:
+        await connection.close()
+    if len(recorder.error_list) > 0:
+        raise Exception('Could not learn the site: %s' % recorder.error_list[0][1])
+    return site
+
+def make_zipf_weight_list(count, exponent):
+    return [1.0 / ((rank + 1) ** exponent) for rank in range(count)]
+
+async def load_puzzle(connection, recorder, visitor, site, name):
+    await fetch(connection, recorder, visitor, 'puzzle', '/puzzle?' + urllib.parse.urlencode({'name': name, 'lod': 0}))
+    if name in site.lod_name_set:
+        await fetch(connection, recorder, visitor, 'puzzle', '/puzzle?' + urllib.parse.urlencode({'name': name}))
+
+async def visit(connection, recorder, visitor, site, rng, popularity_list, weight_list, args):
+    await fetch(connection, recorder, visitor, 'page', '/')
+    for path in site.page_asset_list:
+        await fetch(connection, recorder, visitor, 'static', path)
+    await fetch(connection, recorder, visitor, 'menu', '/puzzle_menu.json')
+    for path in site.menu_asset_list:
+        await fetch(connection, recorder, visitor, 'atlas', path)
+    for path in site.shader_list + ['/' + texture for texture in site.texture_list]:
+        await fetch(connection, recorder, visitor, 'static', path)
+    await load_puzzle(connection, recorder, visitor, site, site.initial_puzzle)
+    for i in range(rng.randint(0, args.max_picks)):
+        if args.think_time > 0.0:
+            await asyncio.sleep(rng.expovariate(1.0 / args.think_time))
+        name = rng.choices(popularity_list, weight_list)[0]
+        await load_puzzle(connection, recorder, visitor, site, name)
+
+async def run_user(user_index, site, recorder, deadline, args):
+    # Each user is a stream of visitors, some of them returning, on one connection.
+    rng = random.Random(args.seed * 1000 + user_index)
+    popularity_list = list(site.puzzle_name_list)
+    random.Random(args.seed).shuffle(popularity_list)      # Every user agrees on which puzzles are popular.
+    weight_list = make_zipf_weight_list(len(popularity_list), args.zipf_exponent)
+    connection = HttpConnection(args.host, args.port, args.timeout)
+    visitor = Visitor()
+    visit_count = 0
+    try:
+        while time.perf_counter() < deadline:
+            if rng.random() >= args.repeat_rate:
+                visitor = Visitor()
+            await visit(connection, recorder, visitor, site, rng, popularity_list, weight_list, args)
+            visit_count += 1
+    finally:
+        await connection.close()
+    return visit_count
+
+def calc_percentile(sorted_list, fraction):
+    # The nearest-rank percentile.
+    if len(sorted_list) == 0:
+        return None
+    return sorted_list[min(len(sorted_list) - 1, max(0, int(round(fraction * len(sorted_list) + 0.5)) - 1))]
+
+def summarize_records(record_list, seconds):
+    latency_list = sorted([record[2] for record in record_list])
+    status_map = {}
+    for record in record_list:
+        status_map[str(record[1])] = status_map.get(str(record[1]), 0) + 1
+    byte_count = sum([record[3] for record in record_list])
+    return {
+        'request_count': len(record_list),
+        'requests_per_second': len(record_list) / seconds,
+        'bytes': byte_count,
+        'bytes_per_second': byte_count / seconds,
+        'status_map': status_map,
+        'latency_ms': {
+            'mean': 1000.0 * sum(latency_list) / len(latency_list) if len(latency_list) > 0 else None,
+            'p50': 1000.0 * calc_percentile(latency_list, 0.50) if len(latency_list) > 0 else None,
+            'p95': 1000.0 * calc_percentile(latency_list, 0.95) if len(latency_list) > 0 else None,
+            'p99': 1000.0 * calc_percentile(latency_list, 0.99) if len(latency_list) > 0 else None,
+            'max': 1000.0 * latency_list[-1] if len(latency_list) > 0 else None
+        }
+    }
+
+async def run_load(args):
+    site = await learn_site(args.host, args.port, args.timeout)
+    print('Learned a site of %d puzzles, %d with levels of detail.' % (len(site.puzzle_name_list), len(site.lod_name_set)))
+    recorder = LoadRecorder()
+    start_time = time.perf_counter()
+    deadline = start_time + args.duration
+    visit_count_list = await asyncio.gather(*[run_user(i, site, recorder, deadline, args) for i in range(args.users)])
+    seconds = time.perf_counter() - start_time
+
+    kind_map = {}
+    for record in recorder.record_list:
+        kind_map.setdefault(record[0], []).append(record)
+    error_map = {}
+    for kind, error in recorder.error_list:
+        error_map[error] = error_map.get(error, 0) + 1
+    return {
+        'seconds': seconds,
+        'visit_count': sum(visit_count_list),
+        'total': summarize_records(recorder.record_list, seconds),
+        'kind_map': {kind: summarize_records(record_list, seconds) for kind, record_list in kind_map.items()},
+        'error_count': len(recorder.error_list),
+        'error_map': error_map
+    }
+
+def start_server(args):
+    # Start a server of our own on the given port, and wait until it answers.
+    command = [sys.executable, os.path.join(ROOT_DIR, 'puzzle_server.py'), '--port', str(args.port)] + args.server_args.split()
+    process = subprocess.Popen(command, cwd=ROOT_DIR, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    for i in range(100):
+        try:
+            asyncio.run(HttpConnection(args.host, args.port, 1.0).request('/puzzle_menu.json', {'Connection': 'close'}))
+            return process
+        except (OSError, asyncio.TimeoutError):
+            time.sleep(0.2)
+    process.terminate()
+    raise Exception('The server did not start.')
+
+def print_summary(results):
+    print('')
+    print('%-8s %9s %10s %12s %9s %9s %9s %9s' % ('Kind', 'Requests', 'Req/s', 'MB', 'p50 ms', 'p95 ms', 'p99 ms', '304s'))
+    for kind, summary in sorted(results['kind_map'].items()) + [('total', results['total'])]:
+        latency = summary['latency_ms']
+        print('%-8s %9d %10.1f %12.2f %9.2f %9.2f %9.2f %9d' % (kind, summary['request_count'], summary['requests_per_second'],
+            summary['bytes'] / (1024.0 * 1024.0), latency['p50'], latency['p95'], latency['p99'], summary['status_map'].get('304', 0)))
+    print('')
+    print('%d visits in %.1f seconds, with %d errors.' % (results['visit_count'], results['seconds'], results['error_count']))
+
+def main():
+    arg_parser = argparse.ArgumentParser(description='Load the puzzle server with simulated visitors, and report throughput and latency.')
+    arg_parser.add_argument('--host', help='Host of the server.', type=str, default='127.0.0.1')
+    arg_parser.add_argument('--port', help='Port of the server.', type=int, default=5100)
+    arg_parser.add_argument('--start-server', help='Start a server on the port for the run, and stop it after.', action='store_true')
+    arg_parser.add_argument('--server-args', help='Extra arguments for a server we start, as in "--production --workers 4".', type=str, default='')
+    arg_parser.add_argument('--users', help='Number of simultaneous users, each with a connection of their own.', type=int, default=20)
+    arg_parser.add_argument('--duration', help='Seconds to run for.', type=float, default=20.0)
+    arg_parser.add_argument('--repeat-rate', help='Fraction of visits by returning visitors, who revalidate what they have.', type=float, default=0.5)
+    arg_parser.add_argument('--max-picks', help='Most puzzles picked from the menu in a visit, after the first.', type=int, default=5)
+    arg_parser.add_argument('--zipf-exponent', help='Exponent of the Zipf distribution of puzzle popularity.', type=float, default=1.1)
+    arg_parser.add_argument('--think-time', help='Mean seconds between picks, or 0 to pick as fast as possible.', type=float, default=0.0)
+    arg_parser.add_argument('--timeout', help='Seconds to wait for any one response.', type=float, default=30.0)
+    arg_parser.add_argument('--seed', help='Seed for the random choices, so that runs can be compared.', type=int, default=0)
+    arg_parser.add_argument('--label', help='Label for the server configuration, saved with the results.', type=str, default='')
+    arg_parser.add_argument('--output', help='Write the results as JSON to this file.', type=str, default=os.path.join(BENCHMARKS_DIR, 'load_results.json'))
+    args = arg_parser.parse_args()
+
+    process = start_server(args) if args.start_server else None
+    try:
+        results = asyncio.run(run_load(args))
+    finally:
+        if process is not None:
+            process.terminate()
+            process.wait()
+
+    results['label'] = args.label
+    results['time'] = datetime.datetime.now().isoformat()
+    results['settings'] = {name: value for name, value in vars(args).items() if name != 'output'}
+    results['python_version'] = sys.version
+    results['platform'] = sys.platform
+    print_summary(results)
+
+    with open(args.output, 'w') as handle:
+        handle.write(json.dumps(results, indent=4, separators=(',', ': '), sort_keys=True))
+    print('Wrote %s' % args.output)
+    return 1 if results['error_count'] > 0 else 0
+
+if __name__ == '__main__':
+    sys.exit(main())
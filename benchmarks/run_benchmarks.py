@@ -0,0 +1,215 @@
+# run_benchmarks.py
+
+import argparse
+import os
+import sys
+import json
+import time
+import tempfile
+import statistics
+import subprocess
+
+sys.path.append(r'c:\dev\pyMath3d')
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from puzzle_generator import make_puzzle_class_list, ProfileBlock
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+BENCHMARKS_DIR = os.path.dirname(os.path.abspath(__file__))
+
+def calc_peak_rss():
+    # Note that this is the peak for the whole process, which is why each run gets a process of its own.
+    if resource is None:
+        return None
+    peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if sys.platform == 'darwin':
+        return peak_rss
+    return peak_rss * 1024
+
+def run_puzzle(puzzle_name):
+    # Generate the given puzzle once, in a scratch directory so that the real puzzle files are left alone.
+    puzzle_class = {puzzle_class.__name__: puzzle_class for puzzle_class in make_puzzle_class_list()}[puzzle_name]
+    ProfileBlock.record_list = []
+    puzzle = puzzle_class()
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory() as temp_dir:
+        os.chdir(temp_dir)
+        try:
+            os.makedirs('puzzles')
+            start_time = time.perf_counter()
+            puzzle.generate_puzzle_file()
+            total_seconds = time.perf_counter() - start_time
+        finally:
+            # Leave the scratch directory even if generation fails, so that it can be removed, and later runs and
+            # the results aren't written into it.
+            os.chdir(cwd)
+
+    phase_seconds = {}
+    for label, seconds in ProfileBlock.record_list:
+        phase_seconds[label] = phase_seconds.get(label, 0.0) + seconds
+
+    return {
+        'total_seconds': total_seconds,
+        'phase_seconds': phase_seconds,
+        'cut_pass_list': puzzle.cut_pass_stats_list,
+        'split_count': sum([stats['split_count'] for stats in puzzle.cut_pass_stats_list]),
+        'mesh_count': puzzle.cut_pass_stats_list[-1]['mesh_count'] if len(puzzle.cut_pass_stats_list) > 0 else 0,
+        'triangle_count': puzzle.cut_pass_stats_list[-1]['triangle_count'] if len(puzzle.cut_pass_stats_list) > 0 else 0,
+        'peak_rss': calc_peak_rss()
+    }
+
+def run_puzzle_in_subprocess(puzzle_name, verbose):
+    handle, output_path = tempfile.mkstemp(suffix='.json')
+    os.close(handle)
+    try:
+        args = [sys.executable, os.path.abspath(__file__), '--worker', puzzle_name, '--worker-output', output_path]
+        result = subprocess.run(args, stdout=None if verbose else subprocess.DEVNULL)
+        if result.returncode != 0:
+            return None
+        with open(output_path, 'r') as handle:
+            return json.loads(handle.read())
+    finally:
+        os.remove(output_path)
+
+def summarize_runs(run_list):
+    # Times are noisy, so we take the median over all runs.  Counts should be the same for every run.
+    summary = {
+        'run_count': len(run_list),
+        'total_seconds': statistics.median([run['total_seconds'] for run in run_list]),
+        'phase_seconds': {},
+        'cut_pass_seconds': [],
+        'split_count': run_list[0]['split_count'],
+        'mesh_count': run_list[0]['mesh_count'],
+        'triangle_count': run_list[0]['triangle_count'],
+        'peak_rss': None
+    }
+    for label in run_list[0]['phase_seconds']:
+        summary['phase_seconds'][label] = statistics.median([run['phase_seconds'].get(label, 0.0) for run in run_list])
+    for i in range(len(run_list[0]['cut_pass_list'])):
+        summary['cut_pass_seconds'].append(statistics.median([run['cut_pass_list'][i]['seconds'] for run in run_list]))
+    peak_rss_list = [run['peak_rss'] for run in run_list if run['peak_rss'] is not None]
+    if len(peak_rss_list) > 0:
+        summary['peak_rss'] = max(peak_rss_list)
+    return summary
+
+def flatten_summary(summary):
+    # Flatten a summary into named metrics, each of which is worse when it is larger.
+    metric_map = {
+        'total_seconds': summary['total_seconds'],
+        'split_count': summary['split_count'],
+        'triangle_count': summary['triangle_count'],
+        'peak_rss': summary['peak_rss']
+    }
+    for label, seconds in summary['phase_seconds'].items():
+        metric_map['phase_seconds/' + label] = seconds
+    for i, seconds in enumerate(summary['cut_pass_seconds']):
+        metric_map['cut_pass_seconds/%d' % i] = seconds
+    return metric_map
+
+def compare_with_baseline(results, baseline, tolerance, min_seconds):
+    # A metric regresses if it grows by more than the given fraction of its baseline value.  Times shorter than
+    # the given minimum are too noisy to judge, so they're skipped.
+    regression_list = []
+    for puzzle_name, summary in results['puzzle_map'].items():
+        baseline_summary = baseline['puzzle_map'].get(puzzle_name)
+        if baseline_summary is None:
+            continue
+        metric_map = flatten_summary(summary)
+        baseline_metric_map = flatten_summary(baseline_summary)
+        for name, value in metric_map.items():
+            baseline_value = baseline_metric_map.get(name)
+            if value is None or baseline_value is None:
+                continue
+            if 'seconds' in name and max(value, baseline_value) < min_seconds:
+                continue
+            if value > baseline_value * (1.0 + tolerance):
+                regression_list.append((puzzle_name, name, baseline_value, value))
+    return regression_list
+
+def main():
+    arg_parser = argparse.ArgumentParser(description='Benchmark puzzle generation and check for regressions against a baseline.')
+    arg_parser.add_argument('--puzzle', help='Benchmark only these puzzles.  If not given, all are benchmarked.', type=str, nargs='+')
+    arg_parser.add_argument('--runs', help='Generate each puzzle this many times.', type=int, default=3)
+    arg_parser.add_argument('--output', help='Write the results as JSON to this file.', type=str, default=os.path.join(BENCHMARKS_DIR, 'results.json'))
+    arg_parser.add_argument('--baseline', help='Compare the results against this file.', type=str, default=os.path.join(BENCHMARKS_DIR, 'baseline.json'))
+    arg_parser.add_argument('--tolerance', help='Allowed fractional growth of any metric over its baseline value.', type=float, default=0.1)
+    arg_parser.add_argument('--min-seconds', help='Ignore times shorter than this when comparing.', type=float, default=0.05)
+    arg_parser.add_argument('--update-baseline', help='Write the results to the baseline file instead of comparing against it.', action='store_true')
+    arg_parser.add_argument('--verbose', help='Show the output of the generator.', action='store_true')
+    arg_parser.add_argument('--worker', help=argparse.SUPPRESS, type=str)
+    arg_parser.add_argument('--worker-output', help=argparse.SUPPRESS, type=str)
+    args = arg_parser.parse_args()
+
+    if args.worker is not None:
+        run = run_puzzle(args.worker)
+        with open(args.worker_output, 'w') as handle:
+            handle.write(json.dumps(run))
+        return 0
+
+    results = {
+        'python_version': sys.version,
+        'platform': sys.platform,
+        'run_count': args.runs,
+        'puzzle_map': {}
+    }
+    failure_list = []
+    for puzzle_class in make_puzzle_class_list():
+        puzzle_name = puzzle_class.__name__
+        if args.puzzle is not None and puzzle_name not in args.puzzle:
+            continue
+        run_list = []
+        for i in range(args.runs):
+            print('Benchmarking %s (run %d of %d)...' % (puzzle_name, i + 1, args.runs))
+            run = run_puzzle_in_subprocess(puzzle_name, args.verbose)
+            if run is None:
+                failure_list.append(puzzle_name)
+                break
+            run_list.append(run)
+        if len(run_list) == args.runs:
+            results['puzzle_map'][puzzle_name] = summarize_runs(run_list)
+            results['puzzle_map'][puzzle_name]['run_list'] = run_list
+
+    print('')
+    print('%-22s %10s %10s %10s %12s' % ('Puzzle', 'Seconds', 'Splits', 'Triangles', 'Peak RSS MB'))
+    for puzzle_name, summary in results['puzzle_map'].items():
+        peak_rss = '%12.1f' % (summary['peak_rss'] / (1024.0 * 1024.0)) if summary['peak_rss'] is not None else '%12s' % '-'
+        print('%-22s %10.2f %10d %10d %s' % (puzzle_name, summary['total_seconds'], summary['split_count'], summary['triangle_count'], peak_rss))
+
+    with open(args.output, 'w') as handle:
+        handle.write(json.dumps(results, indent=4, separators=(',', ': '), sort_keys=True))
+
+    if len(failure_list) > 0:
+        print('')
+        print('FAILED: ' + ', '.join(failure_list))
+        return 1
+
+    if args.update_baseline:
+        with open(args.baseline, 'w') as handle:
+            handle.write(json.dumps(results, indent=4, separators=(',', ': '), sort_keys=True))
+        print('Updated baseline: %s' % args.baseline)
+        return 0
+
+    if not os.path.exists(args.baseline):
+        print('No baseline to compare against.  Run with --update-baseline to make one.')
+        return 0
+
+    with open(args.baseline, 'r') as handle:
+        baseline = json.loads(handle.read())
+    regression_list = compare_with_baseline(results, baseline, args.tolerance, args.min_seconds)
+    if len(regression_list) > 0:
+        print('')
+        print('REGRESSIONS:')
+        for puzzle_name, name, baseline_value, value in regression_list:
+            print('%-22s %-40s %14.4f -> %14.4f' % (puzzle_name, name, baseline_value, value))
+        return 1
+
+    print('')
+    print('No regressions beyond a tolerance of %.0f%%.' % (args.tolerance * 100.0))
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,152 @@
+# puzzle_archive.py
+
+import argparse
+import os
+import sys
+import json
+import mmap
+import time
+import struct
+import hashlib
+import threading
+
+# This packs every puzzle file, levels of detail included, into one archive, so that a deployment is one file and
+# the server never has to open a puzzle file per request.  The archive starts with a magic number and the length of
+# a JSON index, followed by the index, which maps each puzzle's name (as in RubiksCube, or RubiksCube.lod0) to the
+# offset, length, encoding, hash and modification time of its payload, followed by the payloads themselves, as they
+# were already compressed.  The server maps the archive into memory once, and serves slices of it, so every worker
+# process shares the same pages of the OS's cache rather than each holding its own copy.  A new archive is written
+# beside the old one and renamed over it, which the server notices and maps in place of the old, without a restart.
+
+ARCHIVE_PATH = 'puzzles/puzzles.pack'
+ARCHIVE_MAGIC = b'PUZPACK1'
+ARCHIVE_HEADER = struct.Struct('<8sI')
+
+def find_puzzle_files(puzzle_dir='puzzles'):
+    # Return the archive's names for the puzzle files, mapped to their paths.
+    path_map = {}
+    for file in os.listdir(puzzle_dir):
+        if file.endswith('.json.gz'):
+            path_map[file[:-len('.json.gz')]] = os.path.join(puzzle_dir, file)
+    return path_map
+
+def build_archive(puzzle_dir='puzzles', archive_path=ARCHIVE_PATH):
+    path_map = find_puzzle_files(puzzle_dir)
+    payload_list = []
+    entry_map = {}
+    offset = 0
+    for name in sorted(path_map):
+        with open(path_map[name], 'rb') as handle:
+            payload = handle.read()
+        entry_map[name] = {
+            'offset': offset,
+            'length': len(payload),
+            'encoding': 'gzip',
+            'hash': hashlib.sha256(payload).hexdigest(),
+            'mtime': os.path.getmtime(path_map[name])
+        }
+        payload_list.append(payload)
+        offset += len(payload)
+
+    # Offsets in the index are from the start of the payloads, so that they don't depend on the index's own length.
+    index_data = json.dumps({'version': 1, 'entry_map': entry_map}, sort_keys=True).encode('utf-8')
+    temp_path = archive_path + '.tmp'
+    with open(temp_path, 'wb') as handle:
+        handle.write(ARCHIVE_HEADER.pack(ARCHIVE_MAGIC, len(index_data)))
+        handle.write(index_data)
+        for payload in payload_list:
+            handle.write(payload)
+        handle.flush()
+        os.fsync(handle.fileno())
+    os.replace(temp_path, archive_path)
+    return entry_map
+
+class PuzzleArchive(object):
+    # The archive at the given path, as it's mapped into memory.  It's checked for replacement at most once every
+    # check_interval seconds.  Lookups, and the archives mapped, are counted for the metrics, as a cache would be.
+    def __init__(self, path, check_interval=1.0):
+        self.path = path
+        self.check_interval = check_interval
+        self.lock = threading.Lock()
+        self.mapping = None
+        self.entry_map = {}
+        self.payload_offset = 0
+        self.key = None
+        self.check_time = None
+        self.hit_count = 0
+        self.miss_count = 0
+        self.eviction_count = 0
+        self.refresh()
+
+    @property
+    def entry_count(self):
+        return len(self.entry_map)
+
+    @property
+    def byte_count(self):
+        return len(self.mapping) if self.mapping is not None else 0
+
+    def refresh(self):
+        # Map the archive anew if it was replaced since we last looked, or drop it if it's gone.  A replaced mapping
+        # isn't closed here, since a request might be reading from it, but goes when the last reference to it does.
+        self.check_time = time.monotonic()
+        try:
+            stat = os.stat(self.path)
+        except OSError:
+            stat = None
+        key = None if stat is None else (stat.st_dev, stat.st_ino, stat.st_mtime_ns, stat.st_size)
+        if key == self.key:
+            return
+        mapping = None
+        entry_map = {}
+        payload_offset = 0
+        if key is not None:
+            with open(self.path, 'rb') as handle:
+                mapping = mmap.mmap(handle.fileno(), 0, access=mmap.ACCESS_READ)
+            magic, index_length = ARCHIVE_HEADER.unpack_from(mapping, 0)
+            if magic != ARCHIVE_MAGIC:
+                raise Exception('%s is not a puzzle archive.' % self.path)
+            payload_offset = ARCHIVE_HEADER.size + index_length
+            entry_map = json.loads(mapping[ARCHIVE_HEADER.size:payload_offset].decode('utf-8'))['entry_map']
+        with self.lock:
+            if self.mapping is not None:
+                self.eviction_count += 1
+            self.mapping, self.entry_map, self.payload_offset, self.key = mapping, entry_map, payload_offset, key
+
+    def get(self, name_list):
+        # Return the payload and index entry of the first of the names that the archive has, or None if it has none.
+        if time.monotonic() - self.check_time >= self.check_interval:
+            self.refresh()
+        with self.lock:
+            mapping, entry_map, payload_offset = self.mapping, self.entry_map, self.payload_offset
+            entry = None
+            for name in name_list:
+                entry = entry_map.get(name)
+                if entry is not None:
+                    break
+            if entry is None:
+                self.miss_count += 1
+                return None
+            self.hit_count += 1
+        # Slicing the mapping copies straight out of the shared pages, which is the one copy WSGI needs to have bytes.
+        start = payload_offset + entry['offset']
+        return mapping[start:start + entry['length']], entry
+
+def main():
+    arg_parser = argparse.ArgumentParser(description='Pack the puzzle files into one archive for serving.')
+    arg_parser.add_argument('--list', help='List what\'s in the archive instead of building it.', action='store_true')
+    args = arg_parser.parse_args()
+
+    if args.list:
+        archive = PuzzleArchive(ARCHIVE_PATH)
+        for name, entry in sorted(archive.entry_map.items()):
+            print('%-32s %10d %10d %s %s' % (name, entry['offset'], entry['length'], entry['encoding'], entry['hash'][:16]))
+        return 0
+
+    start_time = time.perf_counter()
+    entry_map = build_archive()
+    print('Packed %d puzzle files into %s (%d bytes) in %f seconds.' % (len(entry_map), ARCHIVE_PATH, os.path.getsize(ARCHIVE_PATH), time.perf_counter() - start_time))
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,110 @@
+# puzzle_atlas.py
+
+import os
+import math
+import json
+import hashlib
+
+import numpy
+
+from puzzle_raster import read_png, write_png
+
+# This packs the menu thumbnails into sprite atlases, one per cell size, so that the menu can show every puzzle after
+# fetching a single image instead of one full-size thumbnail per puzzle.  Cells are laid out in a grid, in menu order,
+# with a little padding between them so that a scaled-down sprite doesn't pick up its neighbors along its edges.  An
+# atlas is named after a hash of everything that went into it, so a browser can cache it forever, and a WebP copy is
+# made alongside the PNG whenever Pillow is installed with WebP support.
+
+ATLAS_DIR = 'images/atlas'
+
+def can_write_webp():
+    try:
+        from PIL import features
+    except ImportError:
+        return False
+    return features.check('webp')
+
+def write_webp(path, image, quality=90):
+    from PIL import Image
+    Image.fromarray(image).save(path, 'WEBP', quality=quality, method=6)
+
+def resize_image(image, width, height):
+    # Average the source pixels under each destination pixel, using a summed-area table so that any ratio works.
+    source_height, source_width = image.shape[:2]
+    table = numpy.zeros((source_height + 1, source_width + 1, image.shape[2]), dtype=numpy.float64)
+    table[1:, 1:] = numpy.cumsum(numpy.cumsum(image, axis=0, dtype=numpy.float64), axis=1)
+    x = numpy.round(numpy.arange(width + 1) * source_width / float(width)).astype(numpy.int64)
+    y = numpy.round(numpy.arange(height + 1) * source_height / float(height)).astype(numpy.int64)
+    total = table[y[1:]][:, x[1:]] - table[y[:-1]][:, x[1:]] - table[y[1:]][:, x[:-1]] + table[y[:-1]][:, x[:-1]]
+    count = (y[1:] - y[:-1])[:, None, None] * (x[1:] - x[:-1])[None, :, None]
+    return numpy.round(total / count).astype(numpy.uint8)
+
+def calc_atlas_layout(count):
+    columns = max(1, int(math.ceil(math.sqrt(count))))
+    rows = max(1, int(math.ceil(count / float(columns))))
+    return columns, rows
+
+def calc_atlas_key(entry_list, size_list, padding, format_list):
+    # Hash the thumbnails' contents, not just their names, since a thumbnail can be rendered again in place.
+    hasher = hashlib.sha256()
+    for entry in entry_list:
+        with open(entry['puzzle_icon'], 'rb') as handle:
+            hasher.update(entry['puzzle_name'].encode('utf-8'))
+            hasher.update(hashlib.sha256(handle.read()).digest())
+    hasher.update(json.dumps([size_list, padding, format_list]).encode('utf-8'))
+    return hasher.hexdigest()[:16]
+
+def update_atlas_list(entry_list, size_list, padding=2):
+    # Give each menu entry its rectangle in each atlas, writing out whichever atlases don't exist yet and removing any
+    # left over from before.  Return the number of atlas images written.
+    format_list = ['png', 'webp'] if can_write_webp() else ['png']
+    key = calc_atlas_key(entry_list, size_list, padding, format_list)
+    columns, rows = calc_atlas_layout(len(entry_list))
+
+    for entry in entry_list:
+        entry['puzzle_atlas_list'] = []
+    path_set = set()
+    image_map = {}
+    for size in size_list:
+        stride = size + padding * 2
+        for image_format in format_list:
+            path = '%s/atlas_%d.%s.%s' % (ATLAS_DIR, size, key, image_format)
+            path_set.add(path)
+            for i, entry in enumerate(entry_list):
+                entry['puzzle_atlas_list'].append({
+                    'atlas_format': image_format,
+                    'atlas_image': path,
+                    'atlas_size': [columns * stride, rows * stride],
+                    'atlas_rect': [(i % columns) * stride + padding, (i // columns) * stride + padding, size, size]
+                })
+            if not os.path.exists(path):
+                image_map[path] = (size, image_format)
+
+    if len(image_map) > 0:
+        os.makedirs(ATLAS_DIR, exist_ok=True)
+        thumbnail_list = [read_png(entry['puzzle_icon']) for entry in entry_list]
+        for size in size_list:
+            if not any([image_size == size for image_size, image_format in image_map.values()]):
+                continue
+            stride = size + padding * 2
+            atlas = numpy.zeros((rows * stride, columns * stride, 3), dtype=numpy.uint8)
+            for i, thumbnail in enumerate(thumbnail_list):
+                x = (i % columns) * stride + padding
+                y = (i // columns) * stride + padding
+                atlas[y:y + size, x:x + size] = resize_image(thumbnail, size, size)
+            for path, (image_size, image_format) in image_map.items():
+                if image_size != size:
+                    continue
+                if image_format == 'webp':
+                    write_webp(path, atlas)
+                else:
+                    write_png(path, atlas)
+                print('Wrote %s (%d bytes).' % (path, os.path.getsize(path)))
+
+    if os.path.isdir(ATLAS_DIR):
+        for file in os.listdir(ATLAS_DIR):
+            path = ATLAS_DIR + '/' + file
+            if file.startswith('atlas_') and path not in path_set:
+                os.remove(path)
+
+    return len(image_map)
@@ -0,0 +1,105 @@
+# puzzle_border.py
+
+from puzzle_geometry import quantize
+
+def weld_vertices(vertex_list, quantum=1e-6):
+    # Splitting can leave several vertices at what should be the same point, differing only by round-off.
+    # Here we map each vertex to the first vertex found within the given distance of it, hashing positions
+    # on a grid of that size.  Neighboring cells are searched too so that points straddling a cell boundary
+    # still find each other.  Returns the map along with the number of vertices that were welded.
+    cell_map = {}
+    weld_map = []
+    weld_count = 0
+    for i, vertex in enumerate(vertex_list):
+        key = quantize(vertex, quantum)
+        j = _find_nearby_vertex(vertex_list, cell_map, key, vertex, quantum)
+        if j is None:
+            cell_map.setdefault(key, []).append(i)
+            weld_map.append(i)
+        else:
+            weld_map.append(j)
+            weld_count += 1
+    return weld_map, weld_count
+
+def find_border_loops(vertex_list, triangle_list, quantum=1e-6):
+    # Find the boundary loops of the given mesh in time linear in its size.  Each directed edge of each triangle
+    # is hashed, and a directed edge whose twin is missing lies on the boundary.  From the end of each boundary
+    # edge, we rotate through the triangles about that vertex until we reach the next boundary edge, which keeps
+    # loops that touch at a vertex from being spliced together.  Loops are given in terms of the mesh's vertices.
+    # Returns the loops found, the number of vertices that had to be welded, and the number of boundary edges
+    # that could not be closed up into a loop.
+    weld_map, weld_count = weld_vertices(vertex_list, quantum)
+
+    half_edge_map = {}
+    for triangle in triangle_list:
+        triangle = [weld_map[i] for i in triangle]
+        if triangle[0] == triangle[1] or triangle[1] == triangle[2] or triangle[2] == triangle[0]:
+            continue    # Welding collapsed this triangle, so it has no area to bound.
+        for j in range(3):
+            half_edge_map.setdefault((triangle[j], triangle[(j + 1) % 3]), []).append(triangle[(j + 2) % 3])
+
+    # Non-manifold edges may be shared by more than two triangles, so we match edges up by count.
+    outgoing_map = {}
+    boundary_edge_list = []
+    for edge, third_list in half_edge_map.items():
+        count = len(third_list) - len(half_edge_map.get((edge[1], edge[0]), []))
+        for k in range(count):
+            boundary_edge_list.append(edge)
+            outgoing_map.setdefault(edge[0], []).append(edge[1])
+
+    used_set = set()
+    loop_list = []
+    open_count = 0
+    for edge in boundary_edge_list:
+        if edge in used_set:
+            continue
+        loop = [edge[0]]
+        used_set.add(edge)
+        while True:
+            next_edge = _find_next_boundary_edge(half_edge_map, outgoing_map, used_set, edge)
+            if next_edge is None:
+                open_count += len(loop)
+                break
+            if next_edge[1] == loop[0] and next_edge[0] == edge[1]:
+                loop.append(edge[1])
+                used_set.add(next_edge)
+                loop_list.append(loop)
+                break
+            loop.append(edge[1])
+            used_set.add(next_edge)
+            edge = next_edge
+
+    return loop_list, weld_count, open_count
+
+def _find_nearby_vertex(vertex_list, cell_map, key, vertex, quantum):
+    for i in range(-1, 2):
+        for j in range(-1, 2):
+            for k in range(-1, 2):
+                for index in cell_map.get((key[0] + i, key[1] + j, key[2] + k), []):
+                    if (vertex_list[index] - vertex).length() <= quantum:
+                        return index
+    return None
+
+def _find_next_boundary_edge(half_edge_map, outgoing_map, used_set, edge):
+    # Rotate about the end of the given edge, from triangle to triangle across interior edges.
+    a, b = edge
+    third_list = half_edge_map.get(edge)
+    if third_list is not None and len(third_list) == 1:
+        c = third_list[0]
+        for k in range(len(half_edge_map)):
+            twin_list = half_edge_map.get((c, b))
+            if twin_list is None:
+                break
+            if len(twin_list) != 1:
+                c = None    # The fan about this vertex is non-manifold.
+                break
+            c = twin_list[0]
+        else:
+            c = None
+        if c is not None and (b, c) not in used_set and c in outgoing_map.get(b, []):
+            return (b, c)
+    # Failing that, any unused boundary edge leaving the vertex will do.
+    for c in outgoing_map.get(b, []):
+        if (b, c) not in used_set:
+            return (b, c)
+    return None
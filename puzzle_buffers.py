@@ -0,0 +1,305 @@
+# puzzle_buffers.py
+
+import json
+import zlib
+import struct
+
+VERTEX_FORMAT = ['x', 'y', 'z', 'u', 'v', 'nx', 'ny', 'nz']
+
+def make_packed_buffers(mesh_list, quantization_bits=None):
+    # Pack all the given pieces into one vertex buffer and one index buffer so that the page can
+    # bind them once and then draw each piece as a range of the index buffer.  Within each piece, vertices that
+    # agree in position, UV and normal are welded.  Pieces never share vertices, because each moves on its own.
+    # The border lines of every piece follow all the triangles in the index buffer, as pairs of indices.
+    # The buffers are written as lists of numbers, the vertex buffer planar, all of one component before any of the
+    # next, so that recurring values read the same every time they recur, which is what gzip can exploit.  Indices
+    # are written as the zig-zag encoded difference from the previous index, which keeps them small.  Positions are
+    # written exactly, because the page uses them as they are for its tests of which side of a cut a piece is on, whose
+    # tolerance is far finer than single precision.  Everything else is only drawn, so it's rounded to single
+    # precision, which the page would round it to anyway, and which keeps the numbers short.  If bit depths are given
+    # for position, normal and UV, then the buffers are quantized instead, and the vertices of each piece reordered,
+    # wherever that makes them smaller; see _encode_quantized_buffers.  Returns the buffer data for the puzzle file
+    # and the ranges of each piece.
+    piece_list = []
+    for mesh in mesh_list:
+        weld_map = {}
+        key_list = []
+        index_map = []
+        for i, vertex in enumerate(mesh.vertex_list):
+            uv = mesh.uv_list[i] if i < len(mesh.uv_list) else None
+            normal = mesh.normal_list[i] if i < len(mesh.normal_list) else None
+            key = (vertex.x, vertex.y, vertex.z,
+                   uv.x if uv is not None else 0.0, uv.y if uv is not None else 0.0,
+                   normal.x if normal is not None else 0.0, normal.y if normal is not None else 0.0, normal.z if normal is not None else 0.0)
+            index = weld_map.get(key)
+            if index is None:
+                index = len(key_list)
+                weld_map[key] = index
+                key_list.append(key)
+            index_map.append(index)
+        triangle_list = [tuple([index_map[i] for i in triangle]) for triangle in mesh.triangle_list]
+        border_list = []
+        for border_loop in mesh.border_loop_list:
+            if len(border_loop) > 2:
+                for j in range(len(border_loop)):
+                    border_list.append((index_map[border_loop[j]], index_map[border_loop[(j + 1) % len(border_loop)]]))
+        piece_list.append((key_list, triangle_list, border_list))
+
+    buffer_data, range_list = _pack_pieces(piece_list, None)
+    if quantization_bits is not None:
+        # Where positions, UVs and normals take only a few distinct values, as on a puzzle of a few flat stickers, the
+        # numbers already recur as they are, and quantizing them can't make up for the encoding it has to carry.
+        bounds = _calc_bounds([key for key_list, triangle_list, border_list in piece_list for key in key_list])
+        piece_list = [_reorder_piece(key_list, triangle_list, border_list, bounds) for key_list, triangle_list, border_list in piece_list]
+        quantized_buffer_data, quantized_range_list = _pack_pieces(piece_list, quantization_bits)
+        if _compressed_size(quantized_buffer_data) < _compressed_size(buffer_data):
+            buffer_data, range_list = quantized_buffer_data, quantized_range_list
+    return buffer_data, range_list
+
+def _pack_pieces(piece_list, quantization_bits):
+    vertex_list = []
+    triangle_index_list = []
+    border_index_list = []
+    range_list = []
+    for key_list, triangle_list, border_list in piece_list:
+        vertex_offset = len(vertex_list)
+        vertex_list += key_list
+        index_offset = len(triangle_index_list)
+        for triangle in triangle_list:
+            triangle_index_list += [vertex_offset + i for i in triangle]
+        border_offset = len(border_index_list)
+        for edge in border_list:
+            border_index_list += [vertex_offset + i for i in edge]
+        range_list.append({
+            'vertex_range': [vertex_offset, len(key_list)],
+            'index_range': [index_offset, len(triangle_index_list) - index_offset],
+            'border_range': [border_offset, len(border_index_list) - border_offset]
+        })
+
+    # Border ranges are given relative to the whole index buffer, like the triangle ranges.
+    for mesh_range in range_list:
+        mesh_range['border_range'][0] += len(triangle_index_list)
+
+    buffer_data = {
+        'vertex_format': VERTEX_FORMAT,
+        'vertex_count': len(vertex_list),
+        'triangle_index_range': [0, len(triangle_index_list)],
+        'border_index_range': [len(triangle_index_list), len(border_index_list)],
+        'index_buffer': _encode_index_deltas(triangle_index_list + border_index_list)
+    }
+    if quantization_bits is None:
+        single_map = {}
+        vertex_buffer = [key[c] for c in range(3) for key in vertex_list]
+        vertex_buffer += [_round_to_single(key[c], single_map) for c in range(3, len(VERTEX_FORMAT)) for key in vertex_list]
+        buffer_data['vertex_buffer'] = vertex_buffer
+    else:
+        buffer_data.update(_encode_quantized_buffers(vertex_list, quantization_bits))
+    return buffer_data, range_list
+
+def _compressed_size(buffer_data):
+    # Measure the buffers as they'd be written out in a puzzle file.
+    json_text = json.dumps(buffer_data, indent=4, separators=(',', ': '), sort_keys=True)
+    return len(zlib.compress(json_text.encode('utf-8')))
+
+def _encode_quantized_buffers(vertex_list, quantization_bits):
+    # Each component is quantized to the given number of bits over its range in the whole puzzle, and can be
+    # recovered as offset + q * scale.  Normals always range over [-1, 1].  Like unquantized components, they're
+    # written planar, where neighboring vertices put similar values next to each other.  The positions the page gets
+    # back are off by up to half the diagonal of a quantization cell, which it allows for in its tests of which side
+    # of a cut a piece is on.  Pieces are captured by their centers, which are written exactly either way.
+    position_bits, normal_bits, uv_bits = quantization_bits
+    bits_list = [position_bits] * 3 + [uv_bits] * 2 + [normal_bits] * 3
+    if max(bits_list) > 16:
+        raise Exception('Vertex components can be quantized to at most 16 bits.')
+    bounds = _calc_bounds(vertex_list)
+    offset_list = []
+    scale_list = []
+    for c in range(len(VERTEX_FORMAT)):
+        if c >= 5:
+            min_value, max_value = -1.0, 1.0
+        else:
+            min_value, max_value = bounds[0][c], bounds[1][c]
+        offset_list.append(min_value)
+        scale_list.append((max_value - min_value) / float((1 << bits_list[c]) - 1) if max_value > min_value else 1.0)
+    vertex_buffer = []
+    for c in range(len(VERTEX_FORMAT)):
+        for key in vertex_list:
+            q = int(round((key[c] - offset_list[c]) / scale_list[c]))
+            vertex_buffer.append(min(max(q, 0), (1 << bits_list[c]) - 1))
+
+    return {
+        'vertex_encoding': {
+            'bits': bits_list,
+            'offset': offset_list,
+            'scale': scale_list
+        },
+        'vertex_buffer': vertex_buffer
+    }
+
+def _encode_index_deltas(index_list):
+    # Each index is stored as the zig-zag encoded difference from the one before it, which keeps it small.
+    delta_list = []
+    previous = 0
+    for index in index_list:
+        delta = index - previous
+        delta_list.append(delta * 2 if delta >= 0 else -delta * 2 - 1)
+        previous = index
+    return delta_list
+
+def _decode_index_deltas(delta_list):
+    index_list = []
+    previous = 0
+    for delta in delta_list:
+        previous += (delta >> 1) if delta % 2 == 0 else -((delta + 1) >> 1)
+        index_list.append(previous)
+    return index_list
+
+def _round_to_single(value, single_map):
+    # Return the shortest number that reads back as the same single-precision value as the given one does.
+    result = single_map.get(value)
+    if result is None:
+        single = struct.unpack('<f', struct.pack('<f', value))[0]
+        for digit_count in range(1, 10):
+            result = float('%.*g' % (digit_count, single))
+            if struct.unpack('<f', struct.pack('<f', result))[0] == single:
+                break
+        single_map[value] = result
+    return result
+
+def _reorder_piece(key_list, triangle_list, border_list, bounds):
+    # Sort the triangles along a Morton curve through the bounds of the puzzle, then let the vertex cache
+    # optimizer pick from there, falling back on that order whenever it runs out of good candidates.
+    # Finally, number the vertices in the order that the triangles first use them.
+    def morton_code(triangle):
+        code = 0
+        for c in range(3):
+            center = sum([key_list[i][c] for i in triangle]) / 3.0
+            extent = bounds[1][c] - bounds[0][c]
+            q = int((center - bounds[0][c]) / extent * 1023.0) if extent > 0.0 else 0
+            q = min(max(q, 0), 1023)
+            for b in range(10):
+                code |= ((q >> b) & 1) << (3 * b + c)
+        return code
+    triangle_list = sorted(triangle_list, key=morton_code)
+    triangle_list = _optimize_vertex_cache(triangle_list, len(key_list))
+
+    index_map = {}
+    for triangle in triangle_list:
+        for i in triangle:
+            if i not in index_map:
+                index_map[i] = len(index_map)
+    for i in range(len(key_list)):
+        if i not in index_map:
+            index_map[i] = len(index_map)
+    new_key_list = [None] * len(key_list)
+    for i, j in index_map.items():
+        new_key_list[j] = key_list[i]
+    triangle_list = [tuple([index_map[i] for i in triangle]) for triangle in triangle_list]
+    border_list = [tuple([index_map[i] for i in edge]) for edge in border_list]
+    return new_key_list, triangle_list, border_list
+
+def _optimize_vertex_cache(triangle_list, vertex_count, cache_size=32):
+    # This is Tom Forsyth's linear-speed vertex cache optimization.  Each vertex is scored by its position in
+    # a simulated LRU cache and by how many triangles still need it, and we greedily emit the best scoring
+    # triangle among those touching the cache.
+    vertex_triangle_list = [[] for i in range(vertex_count)]
+    for t, triangle in enumerate(triangle_list):
+        for i in triangle:
+            vertex_triangle_list[i].append(t)
+    cache_position_list = [-1] * vertex_count
+
+    def vertex_score(i):
+        remaining = len(vertex_triangle_list[i])
+        if remaining == 0:
+            return -1.0
+        score = 0.0
+        position = cache_position_list[i]
+        if position >= 0:
+            if position < 3:
+                score = 0.75
+            else:
+                score = (1.0 - (position - 3) / float(cache_size - 3)) ** 1.5
+        return score + 2.0 * remaining ** -0.5
+
+    vertex_score_list = [vertex_score(i) for i in range(vertex_count)]
+    triangle_score_list = [sum([vertex_score_list[i] for i in triangle]) for triangle in triangle_list]
+    emitted_list = [False] * len(triangle_list)
+    new_triangle_list = []
+    cache = []
+    cursor = 0
+    best = None
+    while len(new_triangle_list) < len(triangle_list):
+        if best is None:
+            while emitted_list[cursor]:
+                cursor += 1
+            best = cursor
+        triangle = triangle_list[best]
+        emitted_list[best] = True
+        new_triangle_list.append(triangle)
+        for i in triangle:
+            vertex_triangle_list[i].remove(best)
+        cache = list(triangle) + [i for i in cache if i not in triangle]
+        for i in cache[cache_size:]:
+            cache_position_list[i] = -1
+        touched_list = cache
+        cache = cache[:cache_size]
+        for position, i in enumerate(cache):
+            cache_position_list[i] = position
+        best = None
+        best_score = -1.0
+        for i in touched_list:
+            vertex_score_list[i] = vertex_score(i)
+        for i in cache:
+            for t in vertex_triangle_list[i]:
+                score = sum([vertex_score_list[j] for j in triangle_list[t]])
+                triangle_score_list[t] = score
+                if score > best_score:
+                    best_score = score
+                    best = t
+    return new_triangle_list
+
+def _calc_bounds(key_list):
+    if len(key_list) == 0:
+        return [0.0] * len(VERTEX_FORMAT), [0.0] * len(VERTEX_FORMAT)
+    min_list = [min([key[c] for key in key_list]) for c in range(len(VERTEX_FORMAT))]
+    max_list = [max([key[c] for key in key_list]) for c in range(len(VERTEX_FORMAT))]
+    return min_list, max_list
+
+def unpack_puzzle_data(puzzle_data):
+    # Give each piece back its own vertex, triangle, UV, normal and border loop lists, so that tools that read
+    # puzzle files one piece at a time don't need to know whether or not the buffers were packed.
+    buffer_data = puzzle_data.get('packed_buffers')
+    if buffer_data is None:
+        return puzzle_data
+    stride = len(buffer_data['vertex_format'])
+    count = buffer_data['vertex_count']
+    planar_buffer = buffer_data['vertex_buffer']
+    vertex_encoding = buffer_data.get('vertex_encoding')
+    if vertex_encoding is None:
+        vertex_buffer = [planar_buffer[c * count + i] for i in range(count) for c in range(stride)]
+    else:
+        vertex_buffer = [vertex_encoding['offset'][c] + planar_buffer[c * count + i] * vertex_encoding['scale'][c] for i in range(count) for c in range(stride)]
+    index_buffer = _decode_index_deltas(buffer_data['index_buffer'])
+    for mesh_data in puzzle_data['mesh_list']:
+        vertex_offset, vertex_count = mesh_data['vertex_range']
+        values_list = [vertex_buffer[(vertex_offset + i) * stride:(vertex_offset + i + 1) * stride] for i in range(vertex_count)]
+        mesh_data['vertex_list'] = [{'x': values[0], 'y': values[1], 'z': values[2]} for values in values_list]
+        mesh_data['uv_list'] = [{'x': values[3], 'y': values[4], 'z': 0.0} for values in values_list]
+        mesh_data['normal_list'] = [{'x': values[5], 'y': values[6], 'z': values[7]} for values in values_list]
+        index_offset, index_count = mesh_data['index_range']
+        index_list = [index_buffer[i] - vertex_offset for i in range(index_offset, index_offset + index_count)]
+        mesh_data['triangle_list'] = [index_list[i:i + 3] for i in range(0, len(index_list), 3)]
+        # Border loops were flattened into line segments, so here we chain the segments back up into loops.
+        border_offset, border_count = mesh_data['border_range']
+        border_loop_list = []
+        for i in range(border_offset, border_offset + border_count, 2):
+            if len(border_loop_list) == 0 or border_loop_list[-1][0] == border_loop_list[-1][-1]:
+                if len(border_loop_list) > 0:
+                    border_loop_list[-1].pop()
+                border_loop_list.append([index_buffer[i] - vertex_offset])
+            border_loop_list[-1].append(index_buffer[i + 1] - vertex_offset)
+        if len(border_loop_list) > 0:
+            border_loop_list[-1].pop()
+        mesh_data['border_loop_list'] = border_loop_list
+    del puzzle_data['packed_buffers']
+    return puzzle_data
@@ -0,0 +1,263 @@
+# puzzle_bundle.py
+
+import argparse
+import os
+import re
+import sys
+import json
+import gzip
+import time
+import hashlib
+
+# This builds the page into as few files as it takes to start it.  The local scripts that puzzle_page.html loads are
+# joined into one script, along with the shaders, which the page would otherwise fetch separately, and the style
+# sheet goes right into the page.  What's written is minified, named after a hash of its contents so that it can be
+# cached for good, and compressed ahead of time, with gzip always, and with brotli if that module is installed.  The
+# server serves the bundle when it's there and up to date with its sources, and the loose files otherwise.  Scripts
+# from other hosts, like jQuery, are left to load from there.
+
+BUNDLE_DIR = 'bundle'
+BUNDLE_MANIFEST_PATH = BUNDLE_DIR + '/manifest.json'
+SHADER_PATH_LIST = ['shaders/puzzle_vert_shader.txt', 'shaders/puzzle_frag_shader.txt']
+
+def minify_js(source):
+    # Comments and indentation go, along with blank lines, but line breaks are kept so that semicolon insertion works
+    # out just as it did.  Strings, template literals and regular expressions are copied as they are.  Comments
+    # starting with /*! are licenses, so they're kept too.
+    output = []
+    i = 0
+    length = len(source)
+    while i < length:
+        char = source[i]
+        if char in '\'"`':
+            j = _find_string_end(source, i)
+            output.append(source[i:j])
+            i = j
+        elif source.startswith('//', i):
+            while i < length and source[i] != '\n':
+                i += 1
+        elif source.startswith('/*', i):
+            j = source.find('*/', i + 2)
+            j = length if j < 0 else j + 2
+            if source.startswith('/*!', i):
+                output.append(source[i:j])
+            elif '\n' in source[i:j]:
+                output.append('\n')
+            else:
+                output.append(' ')
+            i = j
+        elif char == '/' and _is_regex_start(output):
+            j = _find_regex_end(source, i)
+            output.append(source[i:j])
+            i = j
+        elif char == '\n':
+            while len(output) > 0 and output[-1] in (' ', '\t'):
+                output.pop()
+            if len(output) > 0 and not output[-1].endswith('\n'):
+                output.append('\n')
+            i += 1
+            while i < length and source[i] in ' \t\r':
+                i += 1
+        elif char in ' \t\r':
+            if len(output) > 0 and output[-1] not in (' ', '\n'):
+                output.append(' ')
+            i += 1
+        else:
+            output.append(char)
+            i += 1
+    return ''.join(output).strip() + '\n'
+
+def _find_string_end(source, i):
+    # Return the index just past the string or template literal starting at the given index.  A template's
+    # substitutions are skipped by counting braces, which is enough for the templates we write.
+    quote = source[i]
+    depth = 0
+    i += 1
+    while i < len(source):
+        char = source[i]
+        if char == '\\':
+            i += 2
+            continue
+        if quote == '`':
+            if source.startswith('${', i):
+                depth += 1
+                i += 2
+                continue
+            if char == '}' and depth > 0:
+                depth -= 1
+            elif char == '`' and depth == 0:
+                return i + 1
+        elif char == quote:
+            return i + 1
+        i += 1
+    return i
+
+def _is_regex_start(output):
+    # A slash starts a regular expression rather than dividing wherever a value can't have come just before it.
+    text = ''.join(output[-8:]).rstrip()
+    if len(text) == 0 or text[-1] in '(,=:[!&|?{};+-*%<>~^':
+        return True
+    return re.search(r'(^|[^\w$])(return|typeof|case|in|of|delete|void|throw|new)$', text) is not None
+
+def _find_regex_end(source, i):
+    in_class = False
+    i += 1
+    while i < len(source) and source[i] != '\n':
+        char = source[i]
+        if char == '\\':
+            i += 2
+            continue
+        if char == '[':
+            in_class = True
+        elif char == ']':
+            in_class = False
+        elif char == '/' and not in_class:
+            return i + 1
+        i += 1
+    return i
+
+def minify_css(source):
+    source = re.sub(r'/\*.*?\*/', '', source, flags=re.DOTALL)
+    source = re.sub(r'\s+', ' ', source)
+    # Spaces before a colon can matter in a selector, so only those after one go.
+    source = re.sub(r'\s*([{};,>])\s*', r'\1', source)
+    source = re.sub(r':\s+', ':', source)
+    return source.replace(';}', '}').strip() + '\n'
+
+def find_page_assets(html):
+    # Return the local scripts, in order, and the local style sheets, that the page loads.
+    script_list = [src for src in re.findall(r'<script[^>]*\ssrc=["\']([^"\']+)["\'][^>]*>\s*</script>', html) if '://' not in src]
+    style_list = [href for href in re.findall(r'<link[^>]*\shref=["\']([^"\']+)["\'][^>]*>', html) if '://' not in href and href.endswith('.css')]
+    return script_list, style_list
+
+def read_text(path):
+    with open(path, 'r', encoding='utf-8') as handle:
+        return handle.read()
+
+def calc_source_hash(path_list):
+    # A hash of every source the bundle was made from, in order, so the server can tell whether it's out of date.
+    hasher = hashlib.sha256()
+    for path in path_list:
+        hasher.update(path.encode('utf-8'))
+        with open(path, 'rb') as handle:
+            hasher.update(hashlib.sha256(handle.read()).digest())
+    return hasher.hexdigest()
+
+def find_source_list(html_path='puzzle_page.html'):
+    script_list, style_list = find_page_assets(read_text(html_path))
+    return [html_path] + script_list + style_list + SHADER_PATH_LIST
+
+def read_bundle_manifest():
+    if not os.path.exists(BUNDLE_MANIFEST_PATH):
+        return None
+    with open(BUNDLE_MANIFEST_PATH, 'r') as handle:
+        return json.loads(handle.read())
+
+def is_bundle_current(manifest):
+    if manifest is None:
+        return False
+    try:
+        return manifest['source_hash'] == calc_source_hash(manifest['source_list'])
+    except (OSError, KeyError):
+        return False
+
+def make_script_text(script_list, minify):
+    # A script with an already minified sibling, as with gl-matrix, uses that as it is.
+    part_list = []
+    for script in script_list:
+        min_script = script[:-len('.js')] + '-min.js'
+        if minify and os.path.exists(min_script):
+            part_list.append(read_text(min_script))
+        else:
+            text = read_text(script)
+            part_list.append(minify_js(text) if minify else text)
+    shader_map = {path: read_text(path) for path in SHADER_PATH_LIST}
+    part_list.insert(0, 'var puzzle_shader_source_map = %s;\n' % json.dumps(shader_map, sort_keys=True))
+    return ''.join([part if part.endswith('\n') else part + '\n' for part in part_list])
+
+def write_precompressed(path, data):
+    # Write the file along with the compressed copies of it, returning their sizes.  The gzip header gets no time
+    # stamp, so that building the same bundle twice gives the same bytes.
+    size_map = {}
+    with open(path, 'wb') as handle:
+        handle.write(data)
+    size_map['identity'] = len(data)
+    gzip_data = gzip.compress(data, compresslevel=9, mtime=0)
+    with open(path + '.gz', 'wb') as handle:
+        handle.write(gzip_data)
+    size_map['gzip'] = len(gzip_data)
+    try:
+        import brotli
+    except ImportError:
+        brotli = None
+    if brotli is not None:
+        brotli_data = brotli.compress(data, quality=11)
+        with open(path + '.br', 'wb') as handle:
+            handle.write(brotli_data)
+        size_map['br'] = len(brotli_data)
+    return size_map
+
+def build_bundle(minify=True, html_path='puzzle_page.html'):
+    html = read_text(html_path)
+    script_list, style_list = find_page_assets(html)
+    source_list = find_source_list(html_path)
+
+    script_data = make_script_text(script_list, minify).encode('utf-8')
+    script_name = 'puzzle_page.%s.js' % hashlib.sha256(script_data).hexdigest()[:16]
+
+    style_text = ''.join([read_text(style) for style in style_list])
+    if minify:
+        style_text = minify_css(style_text)
+
+    # Every local script tag goes, and the bundle takes the place of the first.  The style sheets are inlined.
+    first_script = '<script src="%s"></script>' % (BUNDLE_DIR + '/' + script_name)
+    def replace_script(match):
+        nonlocal first_script
+        if '://' in match.group(2):
+            return match.group(0)
+        tag, first_script = first_script, ''
+        return match.group(1) + tag + '\n' if len(tag) > 0 else ''
+    html = re.sub(r'([ \t]*)<script[^>]*\ssrc=["\']([^"\']+)["\'][^>]*>\s*</script>[ \t]*\n?', replace_script, html)
+    html = re.sub(r'([ \t]*)<link[^>]*\shref=["\'][^"\':]+\.css["\'][^>]*>', lambda match: match.group(1) + '<style>%s</style>' % style_text.strip(), html, count=1)
+    html = re.sub(r'[ \t]*<link[^>]*\shref=["\'][^"\':]+\.css["\'][^>]*>[ \t]*\n?', '', html)
+    html_data = html.encode('utf-8')
+
+    os.makedirs(BUNDLE_DIR, exist_ok=True)
+    size_report = {
+        script_name: write_precompressed(BUNDLE_DIR + '/' + script_name, script_data),
+        'puzzle_page.html': write_precompressed(BUNDLE_DIR + '/puzzle_page.html', html_data)
+    }
+
+    keep_set = set(['manifest.json'])
+    for name in size_report:
+        keep_set |= set([name, name + '.gz', name + '.br'])
+    for file in os.listdir(BUNDLE_DIR):
+        if file not in keep_set:
+            os.remove(BUNDLE_DIR + '/' + file)
+
+    manifest = {
+        'html': 'puzzle_page.html',
+        'script': script_name,
+        'source_list': source_list,
+        'source_hash': calc_source_hash(source_list),
+        'minified': minify
+    }
+    with open(BUNDLE_MANIFEST_PATH, 'w') as handle:
+        handle.write(json.dumps(manifest, indent=4, separators=(',', ': '), sort_keys=True))
+    return manifest, size_report
+
+def main():
+    arg_parser = argparse.ArgumentParser(description='Bundle, minify and precompress the page for serving.')
+    arg_parser.add_argument('--no-minify', help='Join the files without minifying them, for debugging.', action='store_true')
+    args = arg_parser.parse_args()
+
+    start_time = time.perf_counter()
+    source_size = sum([os.path.getsize(path) for path in find_source_list()])
+    manifest, size_report = build_bundle(minify=not args.no_minify)
+    for name, size_map in sorted(size_report.items()):
+        print('%s: %s' % (name, ', '.join(['%s %d bytes' % (encoding, size) for encoding, size in sorted(size_map.items())])))
+    print('Bundled %d sources (%d bytes) in %f seconds.' % (len(manifest['source_list']), source_size, time.perf_counter() - start_time))
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
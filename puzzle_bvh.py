@@ -0,0 +1,137 @@
+# puzzle_bvh.py
+
+import math
+
+class TriangleBVH(object):
+    # A bounding volume hierarchy over the triangles of a mesh, built by splitting the triangles at the median of
+    # their centers along the longest axis of their bounds until few enough are left in a node.  It answers two
+    # kinds of questions: which triangles have bounds overlapping a given box, and which side of the mesh a given
+    # point is on.  Positions are kept as plain tuples, because that is a good deal faster than vectors here.
+    def __init__(self, vertex_list, triangle_list, leaf_size=4):
+        self.vertex_count = len(vertex_list)
+        self.triangle_count = len(triangle_list)
+        self.point_list = [(vertex.x, vertex.y, vertex.z) for vertex in vertex_list]
+        self.triangle_list = [tuple(triangle) for triangle in triangle_list]
+        self.bounds_list = [_calc_bounds([self.point_list[i] for i in triangle]) for triangle in self.triangle_list]
+        self.plane_list = [_calc_plane(*[self.point_list[i] for i in triangle]) for triangle in self.triangle_list]
+        self.leaf_size = leaf_size
+        self.root = self._build_node(list(range(len(self.triangle_list)))) if len(self.triangle_list) > 0 else None
+
+    def _build_node(self, index_list):
+        # A node is a tuple of its bounds, either its two children or, for a leaf, None and its triangles, and the
+        # bounds on the normals and offsets of its triangles' planes.
+        bounds = _merge_bounds([self.bounds_list[i] for i in index_list])
+        plane_bounds = _calc_plane_bounds([self.plane_list[i] for i in index_list])
+        if len(index_list) <= self.leaf_size:
+            return (bounds, None, index_list, plane_bounds)
+        extent = [bounds[1][j] - bounds[0][j] for j in range(3)]
+        axis = extent.index(max(extent))
+        index_list = sorted(index_list, key=lambda i: self.bounds_list[i][0][axis] + self.bounds_list[i][1][axis])
+        half = len(index_list) // 2
+        return (bounds, (self._build_node(index_list[:half]), self._build_node(index_list[half:])), None, plane_bounds)
+
+    def is_stale(self, vertex_list, triangle_list):
+        return len(vertex_list) != self.vertex_count or len(triangle_list) != self.triangle_count
+
+    def overlaps_bounds(self, bounds, eps=1e-7):
+        # Tell whether any triangle has bounds overlapping the given box, grown by the given margin.
+        if self.root is None:
+            return False
+        bounds = ((bounds[0][0] - eps, bounds[0][1] - eps, bounds[0][2] - eps), (bounds[1][0] + eps, bounds[1][1] + eps, bounds[1][2] + eps))
+        node_stack = [self.root]
+        while len(node_stack) > 0:
+            node_bounds, child_pair, index_list, plane_bounds = node_stack.pop()
+            if not _bounds_overlap(node_bounds, bounds):
+                continue
+            if child_pair is not None:
+                node_stack += child_pair
+            elif any([_bounds_overlap(self.bounds_list[i], bounds) for i in index_list]):
+                return True
+        return False
+
+    def calc_side(self, point, eps=1e-7, slack=1e-12):
+        # Tell which side of the mesh the given point is on by the largest signed distance from any triangle's plane
+        # to the point, just as pyMath3d and the page do: 1 if that's more than eps, -1 if it's less than -eps, and 0
+        # otherwise.  Rather than measure every plane, we skip any node whose planes can't be far enough in front of
+        # the point to change the answer found so far, by the bounds on their normals and offsets.  The answer is
+        # the same as if we had measured them all.  A degenerate triangle has no plane, so it has no say.
+        side = -1
+        threshold = -eps
+        node_stack = [self.root] if self.root is not None else []
+        while len(node_stack) > 0:
+            node_bounds, child_pair, index_list, plane_bounds = node_stack.pop()
+            if _calc_plane_distance_bound(plane_bounds, point) < threshold - slack:
+                continue
+            if child_pair is not None:
+                node_stack += child_pair
+                continue
+            for i in index_list:
+                if self.plane_list[i][0] == (0.0, 0.0, 0.0):
+                    continue
+                distance = self.calc_plane_distance(i, point)
+                if distance > eps:
+                    return 1
+                if distance >= -eps:
+                    side = 0
+                    threshold = eps
+        return side
+
+    def calc_plane_distance(self, i, point):
+        normal, offset = self.plane_list[i]
+        return normal[0] * point[0] + normal[1] * point[1] + normal[2] * point[2] - offset
+
+def calc_mesh_bounds(mesh):
+    return _calc_bounds([(vertex.x, vertex.y, vertex.z) for vertex in mesh.vertex_list])
+
+def calc_triangle_bounds(mesh, triangle):
+    return _calc_bounds([(mesh.vertex_list[i].x, mesh.vertex_list[i].y, mesh.vertex_list[i].z) for i in triangle])
+
+def _calc_bounds(point_list):
+    return (
+        (min([point[0] for point in point_list]), min([point[1] for point in point_list]), min([point[2] for point in point_list])),
+        (max([point[0] for point in point_list]), max([point[1] for point in point_list]), max([point[2] for point in point_list]))
+    )
+
+def _merge_bounds(bounds_list):
+    return (
+        (min([bounds[0][0] for bounds in bounds_list]), min([bounds[0][1] for bounds in bounds_list]), min([bounds[0][2] for bounds in bounds_list])),
+        (max([bounds[1][0] for bounds in bounds_list]), max([bounds[1][1] for bounds in bounds_list]), max([bounds[1][2] for bounds in bounds_list]))
+    )
+
+def _bounds_overlap(bounds_a, bounds_b):
+    for j in range(3):
+        if bounds_a[1][j] < bounds_b[0][j] or bounds_b[1][j] < bounds_a[0][j]:
+            return False
+    return True
+
+def _calc_plane_bounds(plane_list):
+    # Return the least and greatest of each component of the planes' normals, and the least of their offsets.
+    plane_list = [plane for plane in plane_list if plane[0] != (0.0, 0.0, 0.0)]
+    if len(plane_list) == 0:
+        return (0.0, 0.0, 0.0), (0.0, 0.0, 0.0), float('inf')
+    return (
+        (min([plane[0][0] for plane in plane_list]), min([plane[0][1] for plane in plane_list]), min([plane[0][2] for plane in plane_list])),
+        (max([plane[0][0] for plane in plane_list]), max([plane[0][1] for plane in plane_list]), max([plane[0][2] for plane in plane_list])),
+        min([plane[1] for plane in plane_list])
+    )
+
+def _calc_plane_distance_bound(plane_bounds, point):
+    # No plane within the given bounds is further in front of the point than this.
+    normal_min, normal_max, offset_min = plane_bounds
+    return sum([max(normal_min[j] * point[j], normal_max[j] * point[j]) for j in range(3)]) - offset_min
+
+def _calc_plane(a, b, c):
+    ab = _sub(b, a)
+    ac = _sub(c, a)
+    normal = (ab[1] * ac[2] - ab[2] * ac[1], ab[2] * ac[0] - ab[0] * ac[2], ab[0] * ac[1] - ab[1] * ac[0])
+    length = math.sqrt(_dot(normal, normal))
+    if length == 0.0:
+        return (0.0, 0.0, 0.0), 0.0     # A degenerate triangle has no plane, so no side.
+    normal = (normal[0] / length, normal[1] / length, normal[2] / length)
+    return normal, _dot(normal, a)
+
+def _sub(a, b):
+    return (a[0] - b[0], a[1] - b[1], a[2] - b[2])
+
+def _dot(a, b):
+    return a[0] * b[0] + a[1] * b[1] + a[2] * b[2]
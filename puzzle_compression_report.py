@@ -0,0 +1,105 @@
+# puzzle_compression_report.py
+
+import argparse
+import os
+import sys
+import json
+import gzip
+
+sys.path.append(r'c:\dev\pyMath3d')
+
+from puzzle_generator import ColoredMesh
+from puzzle_buffers import make_packed_buffers, unpack_puzzle_data
+
+def compressed_size(puzzle_data, key_list=None):
+    # Measure the data just as the generator would write it out.  If keys are given, measure only that part of it.
+    if key_list is not None:
+        puzzle_data = {key: puzzle_data[key] for key in key_list if key in puzzle_data}
+    json_text = json.dumps(puzzle_data, indent=4, separators=(',', ': '), sort_keys=True)
+    return len(gzip.compress(json_text.encode('utf-8')))
+
+def measure_puzzle(puzzle_path, quantization_bits):
+    with gzip.open(puzzle_path, 'rb') as handle:
+        puzzle_data = unpack_puzzle_data(json.loads(handle.read().decode('utf-8')))
+
+    mesh_list = [ColoredMesh().from_dict(mesh_data) for mesh_data in puzzle_data['mesh_list']]
+
+    def make_packed_puzzle_data(bits):
+        packed_puzzle_data = dict(puzzle_data)
+        packed_puzzle_data['packed_buffers'], range_list = make_packed_buffers(mesh_list, bits)
+        packed_puzzle_data['mesh_list'] = []
+        for mesh_data, mesh_range in zip(puzzle_data['mesh_list'], range_list):
+            mesh_data = {key: value for key, value in mesh_data.items() if key not in ['vertex_list', 'triangle_list', 'uv_list', 'normal_list', 'border_loop_list']}
+            mesh_data.update(mesh_range)
+            packed_puzzle_data['mesh_list'].append(mesh_data)
+        return packed_puzzle_data
+
+    packed_puzzle_data = make_packed_puzzle_data(None)
+    quantized_puzzle_data = make_packed_puzzle_data(quantization_bits)
+
+    # Make sure that what we wrote decodes back to the same pieces, to within the quantization error.
+    max_error = 0.0
+    decoded_puzzle_data = unpack_puzzle_data(json.loads(json.dumps(quantized_puzzle_data)))
+    for mesh, mesh_data in zip(mesh_list, decoded_puzzle_data['mesh_list']):
+        if len(mesh.triangle_list) != len(mesh_data['triangle_list']):
+            raise Exception('Triangle count mismatch in %s.' % puzzle_path)
+        position_set = set([(vertex.x, vertex.y, vertex.z) for vertex in mesh.vertex_list])
+        for vertex in mesh_data['vertex_list']:
+            max_error = max(max_error, min([max(abs(vertex['x'] - x), abs(vertex['y'] - y), abs(vertex['z'] - z)) for x, y, z in position_set]))
+
+    # The generator surfaces are left as they are, and can dwarf the pieces, so we measure the pieces on their own too.
+    piece_key_list = ['mesh_list', 'packed_buffers']
+    return {
+        'before': compressed_size(puzzle_data),
+        'packed': compressed_size(packed_puzzle_data),
+        'quantized': compressed_size(quantized_puzzle_data),
+        'pieces_before': compressed_size(puzzle_data, piece_key_list),
+        'pieces_packed': compressed_size(packed_puzzle_data, piece_key_list),
+        'pieces_quantized': compressed_size(quantized_puzzle_data, piece_key_list),
+        'max_position_error': max_error,
+        # Quantization is dropped where it wouldn't make the buffers smaller; see make_packed_buffers.
+        'quantization_kept': 'vertex_encoding' in quantized_puzzle_data['packed_buffers']
+    }
+
+def main():
+    arg_parser = argparse.ArgumentParser(description='Compare the compressed size of puzzle files with and without quantized buffers.')
+    arg_parser.add_argument('--puzzle', help='Specify which puzzle to measure.  If not given, all generated puzzles are measured.', type=str)
+    arg_parser.add_argument('--quantize', help='Bits for position, normal and UV components.', type=int, nargs=3, default=[16, 10, 12])
+    arg_parser.add_argument('--output', help='Write the report as JSON to this file.', type=str, default='compression_report.json')
+    args = arg_parser.parse_args()
+
+    report_list = []
+    for file in sorted(os.listdir('puzzles')):
+        name = file[:-len('.json.gz')]
+        if not file.endswith('.json.gz') or '.' in name:
+            continue
+        if args.puzzle is not None and args.puzzle != name:
+            continue
+        print('Measuring: %s' % name)
+        report = measure_puzzle(os.path.join('puzzles', file), args.quantize)
+        report['puzzle_name'] = name
+        report_list.append(report)
+
+    print('')
+    print('%-22s %10s %10s %10s %10s %10s %10s %12s %6s' % ('Puzzle', 'File', 'File', 'File', 'Pieces', 'Pieces', 'Pieces', 'Max error', 'Kept'))
+    print('%-22s %10s %10s %10s %10s %10s %10s %12s %6s' % ('', 'before', 'packed', 'quantized', 'before', 'packed', 'quantized', '', ''))
+    total_report = {}
+    for report in report_list:
+        print('%-22s %10d %10d %10d %10d %10d %10d %12.2e %6s' % (
+            report['puzzle_name'],
+            report['before'], report['packed'], report['quantized'],
+            report['pieces_before'], report['pieces_packed'], report['pieces_quantized'],
+            report['max_position_error'], 'yes' if report['quantization_kept'] else 'no'))
+        for key in ['before', 'packed', 'quantized', 'pieces_before', 'pieces_packed', 'pieces_quantized']:
+            total_report[key] = total_report.get(key, 0) + report[key]
+    if len(report_list) > 0:
+        print('%-22s %10d %10d %10d %10d %10d %10d' % (
+            'Total',
+            total_report['before'], total_report['packed'], total_report['quantized'],
+            total_report['pieces_before'], total_report['pieces_packed'], total_report['pieces_quantized']))
+
+    with open(args.output, 'w') as handle:
+        handle.write(json.dumps({'quantization_bits': args.quantize, 'puzzle_list': report_list}, indent=4, separators=(',', ': '), sort_keys=True))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,101 @@
+# puzzle_cutter_report.py
+
+import argparse
+import os
+import sys
+import json
+import time
+
+sys.path.append(r'c:\dev\pyMath3d')
+
+from puzzle_generator import make_puzzle_class_list
+
+def count_curved_cutters(puzzle_class):
+    # Count the curved cutters as they're made, without cutting anything, so that we can skip puzzles that don't
+    # have any before spending time on them.
+    puzzle = puzzle_class()
+    sphere_count = [0]
+    make_sphere_mesh = puzzle.make_sphere_mesh
+    def counting_make_sphere_mesh(sphere):
+        sphere_count[0] += 1
+        return make_sphere_mesh(sphere)
+    puzzle.make_sphere_mesh = counting_make_sphere_mesh
+    puzzle.cutter_bounds = puzzle.calc_cutter_bounds(puzzle.make_initial_mesh_list())
+    puzzle.make_generator_mesh_list()
+    return sphere_count[0]
+
+def measure_puzzle(puzzle_class, max_chord_error):
+    puzzle = puzzle_class()
+    puzzle.max_chord_error = max_chord_error
+
+    start_time = time.perf_counter()
+    final_mesh_list, initial_mesh_list, generator_mesh_list = puzzle.generate_final_mesh_list()
+    total_seconds = time.perf_counter() - start_time
+
+    return {
+        'cutter_triangle_count': sum([len(mesh.triangle_list) for mesh in generator_mesh_list]),
+        'piece_count': len(final_mesh_list),
+        'piece_triangle_count': sum([len(mesh.triangle_list) for mesh in final_mesh_list]),
+        'seconds': total_seconds
+    }
+
+def main():
+    arg_parser = argparse.ArgumentParser(description='Compare fixed and adaptive tessellation of curved cutters.')
+    arg_parser.add_argument('--puzzle', help='Specify which puzzle to compare.  If not given, all curvy puzzles are compared.', type=str)
+    arg_parser.add_argument('--max-chord-error', help='Chord error budget for puzzles that do not declare their own.', type=float, default=0.01)
+    arg_parser.add_argument('--output', help='Write the report as JSON to this file.', type=str, default='reports/cutter_report.json')
+    args = arg_parser.parse_args()
+
+    report_list = []
+    failure_list = []
+    for puzzle_class in make_puzzle_class_list():
+        if args.puzzle is not None and args.puzzle != puzzle_class.__name__:
+            continue
+        # One puzzle that fails to generate shouldn't cost us the report on all the others.
+        try:
+            sphere_count = count_curved_cutters(puzzle_class)
+            if sphere_count == 0:
+                continue
+            print('Measuring: %s' % puzzle_class.__name__)
+            before = measure_puzzle(puzzle_class, None)
+            budget = puzzle_class().max_chord_error
+            if budget is None:
+                budget = args.max_chord_error
+            after = measure_puzzle(puzzle_class, budget)
+        except Exception as error:
+            print('Failed: %s: %s' % (puzzle_class.__name__, error))
+            failure_list.append(puzzle_class.__name__)
+            continue
+        report_list.append({
+            'puzzle_name': puzzle_class.__name__,
+            'max_chord_error': budget,
+            'sphere_count': sphere_count,
+            'before': before,
+            'after': after
+        })
+
+    print('')
+    print('%-22s %10s %10s %10s %10s %10s %10s' % ('Puzzle', 'Cutter', 'Cutter', 'Pieces', 'Pieces', 'Seconds', 'Seconds'))
+    print('%-22s %10s %10s %10s %10s %10s %10s' % ('', 'before', 'after', 'before', 'after', 'before', 'after'))
+    for report in report_list:
+        before = report['before']
+        after = report['after']
+        print('%-22s %10d %10d %10d %10d %10.2f %10.2f' % (
+            report['puzzle_name'],
+            before['cutter_triangle_count'], after['cutter_triangle_count'],
+            before['piece_triangle_count'], after['piece_triangle_count'],
+            before['seconds'], after['seconds']))
+
+    if os.path.dirname(args.output) != '':
+        os.makedirs(os.path.dirname(args.output), exist_ok=True)
+    with open(args.output, 'w') as handle:
+        handle.write(json.dumps(report_list, indent=4, separators=(',', ': '), sort_keys=True))
+
+    if len(failure_list) > 0:
+        print('')
+        print('FAILED: ' + ', '.join(failure_list))
+        return 1
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,112 @@
+# puzzle_cutting.py
+
+from math3d_vector import Vector
+from math3d_transform import AffineTransform
+from puzzle_implicit import make_probe_points
+from puzzle_geometry import quantize
+
+# These carry out the cut schedules of puzzle_schedule.py: finding the generators whose turns can be cancelled, turning
+# pieces through a run of applications at once, and cutting pieces, in this process or in a pool of workers.
+
+def find_symmetric_generators(generator_mesh_list, bounds, quantum=1e-5):
+    # Return the indices of the generators whose surface turns into itself under their own turn.  A piece cut
+    # against such a generator is still cut against it after being turned by it, and the pieces it captures are the
+    # same after it turns as before, so its turns can be cancelled against each other.  A tessellated surface may only
+    # be symmetric up to its tessellation, in which case we play it safe and leave it out.
+    symmetric_set = set()
+    probe_list = make_probe_points(bounds)
+    for i, generator in enumerate(generator_mesh_list):
+        transform = generator.make_transform()
+        if generator.surface is not None:
+            if generator.surface.is_invariant(transform, probe_list):
+                symmetric_set.add(i)
+            continue
+        # The turn must take every triangle onto a triangle, not just every vertex onto a vertex, for the surface,
+        # and so which side of it a point is on, to be the same after the turn as before.
+        key_list = [quantize(vertex, quantum) for vertex in generator.vertex_list]
+        turned_key_list = [quantize(transform(vertex), quantum) for vertex in generator.vertex_list]
+        triangle_set = set([_triangle_key([key_list[j] for j in triangle]) for triangle in generator.triangle_list])
+        if all(_triangle_key([turned_key_list[j] for j in triangle]) in triangle_set for triangle in generator.triangle_list):
+            symmetric_set.add(i)
+    return symmetric_set
+
+def apply_generator_run(mesh_list, clean_list, generator_mesh_list, apply_list, symmetric_set, eps=1e-9):
+    # Carry out a run of consecutive applications with a single transform of each piece.  Capture only depends on
+    # where a piece's center is, so we follow the center, along with the images of the origin and the unit axes,
+    # through each turn that captures it, and then transform the piece once by the composite.  A piece that ends
+    # up back where it started, as after a whole turn, is left alone.  A piece turned by a single symmetric
+    # generator stays cut against that generator, but anything else it was cut against is forgotten.  Returns the
+    # number of pieces transformed.
+    transform_count = 0
+    for k, mesh in enumerate(mesh_list):
+        center = mesh.calc_center()
+        point_list = None
+        mover_set = set()
+        for step in apply_list:
+            generator = generator_mesh_list[step.generator]
+            for n in range(step.count):
+                if not generator.captures_point(center):
+                    break       # The piece didn't move, so it won't be captured the next time either.
+                transform = generator.make_transform(step.inverse)
+                if point_list is None:
+                    point_list = [Vector(0.0, 0.0, 0.0), Vector(1.0, 0.0, 0.0), Vector(0.0, 1.0, 0.0), Vector(0.0, 0.0, 1.0)]
+                point_list = [transform(point) for point in point_list]
+                center = transform(center)
+                mover_set.add(step.generator)
+        if point_list is None:
+            continue
+        origin = point_list[0]
+        axis_list = [point - origin for point in point_list[1:]]
+        if origin.length() < eps and all([(axis - unit_axis).length() < eps for axis, unit_axis in zip(axis_list, [Vector(1.0, 0.0, 0.0), Vector(0.0, 1.0, 0.0), Vector(0.0, 0.0, 1.0)])]):
+            continue
+        transform = AffineTransform(x_axis=axis_list[0], y_axis=axis_list[1], z_axis=axis_list[2], translation=origin)
+        mesh_list[k] = transform(mesh)
+        mesh_list[k].carry_state_from(mesh)
+        clean_list[k] = clean_list[k] & frozenset(mover_set) & frozenset(symmetric_set) if len(mover_set) == 1 else frozenset()
+        transform_count += 1
+    return transform_count
+
+def split_mesh(mesh, clean_set, generator_list, generator_mesh_list):
+    # Cut the given piece against each of the given generators in turn.  A fragment already cut against a generator
+    # and not moved since lies entirely to one side of it, so cutting it again is skipped.  Fragments come out in
+    # the same order as they would from cutting all pieces against one generator at a time.
+    fragment_list = [(mesh, clean_set)]
+    split_count = 0
+    skip_count = 0
+    for i in generator_list:
+        new_fragment_list = []
+        for fragment, fragment_clean_set in fragment_list:
+            if i in fragment_clean_set:
+                new_fragment_list.append((fragment, fragment_clean_set))
+                skip_count += 1
+                continue
+            back_mesh, front_mesh = generator_mesh_list[i].split_mesh(fragment)
+            split_count += 1
+            if len(back_mesh.triangle_list) == 0 or len(front_mesh.triangle_list) == 0:
+                # The fragment lies wholly to one side of the cut, so we keep it, and all we know about it, as it is.
+                new_fragment_list.append((fragment, fragment_clean_set | frozenset([i])))
+                continue
+            for part in [back_mesh, front_mesh]:
+                part = fragment.__class__(mesh=part, color=fragment.color)
+                # This is an optimization in terms of both time and memory.  Note that it is not needed for correctness.
+                part.reduce()
+                part.needs_reduce = False
+                new_fragment_list.append((part, fragment_clean_set | frozenset([i])))
+        fragment_list = new_fragment_list
+    return fragment_list, split_count, skip_count
+
+# The generators never move, so each worker process is given them once, up front.
+_worker_generator_mesh_list = None
+
+def init_split_worker(generator_mesh_list):
+    global _worker_generator_mesh_list
+    _worker_generator_mesh_list = generator_mesh_list
+
+def split_mesh_in_worker(task):
+    mesh, clean_set, generator_list = task
+    return split_mesh(mesh, clean_set, generator_list, _worker_generator_mesh_list)
+
+def _triangle_key(key_list):
+    # A triangle's vertex keys, in their winding order, starting from the least of them.
+    k = key_list.index(min(key_list))
+    return tuple(key_list[k:] + key_list[:k])
@@ -0,0 +1,298 @@
+# puzzle_decimate.py
+
+import math
+import heapq
+
+from puzzle_retriangulate import compact_mesh, retriangulate_coplanar_regions
+from puzzle_geometry import edge_key, quantize
+
+def decimate_mesh_list(mesh_list, tolerance, simplify_outlines=False, quantum=1e-6, max_attempts=8):
+    # Decimate all pieces of a puzzle in place to within the given tolerance, returning a small report.  By default
+    # only the interior of each sticker is decimated, and its outline is left exactly as it was, so that border loops
+    # and adjacency with neighboring pieces are unchanged.
+    #
+    # Most of what remains after that is the outline of each sticker, so outlines can also be simplified, when asked
+    # for, at the cost of moving piece boundaries.  Neighboring pieces share their outlines vertex for vertex, so
+    # outlines can't be simplified one piece at a time without opening up cracks.  Instead we simplify each curve of
+    # the global outline graph exactly once, between the junctions where three or more pieces meet, and then remove
+    # the same vertices from every piece.  Any vertex that some piece can't give up gets pinned and we try again, so
+    # adjacent pieces always agree.  If they still don't after the given number of attempts, outlines are left alone.
+    report = {
+        'tolerance': tolerance,
+        'triangles_before': sum([len(mesh.triangle_list) for mesh in mesh_list]),
+        'max_deviation': 0.0,
+        'simplify_outlines': simplify_outlines
+    }
+
+    if simplify_outlines:
+        report['outlines_simplified'] = False
+        pinned_key_set = set()
+        for attempt in range(max_attempts):
+            removable_key_set, deviation = _simplify_outlines(mesh_list, tolerance, pinned_key_set, quantum)
+            trial_list = []
+            failed_key_set = set()
+            for mesh in mesh_list:
+                trial_mesh = mesh.clone()
+                removable_set = set([i for i, vertex in enumerate(trial_mesh.vertex_list) if quantize(vertex, quantum) in removable_key_set])
+                if len(removable_set) > 0:
+                    retriangulate_coplanar_regions(trial_mesh, removable_set=removable_set)
+                    for vertex in trial_mesh.vertex_list:
+                        key = quantize(vertex, quantum)
+                        if key in removable_key_set:
+                            failed_key_set.add(key)
+                trial_list.append(trial_mesh)
+            if len(failed_key_set) == 0:
+                for mesh, trial_mesh in zip(mesh_list, trial_list):
+                    mesh.vertex_list = trial_mesh.vertex_list
+                    mesh.triangle_list = trial_mesh.triangle_list
+                report['max_deviation'] = deviation
+                report['outlines_simplified'] = True
+                break
+            pinned_key_set |= failed_key_set
+        report['outline_attempts'] = attempt + 1
+        if not report['outlines_simplified']:
+            print('WARNING: Outlines could not be simplified consistently in %d attempts, so they were left as they were.' % max_attempts)
+
+    for mesh in mesh_list:
+        report['max_deviation'] = max(report['max_deviation'], decimate_mesh(mesh, tolerance))
+
+    report['triangles_after'] = sum([len(mesh.triangle_list) for mesh in mesh_list])
+    return report
+
+def decimate_mesh(mesh, tolerance, min_normal_dot=0.2):
+    # Reduce the given mesh in place by quadric-error half-edge collapse.  Each vertex accumulates the planes
+    # of every original triangle merged into it, and a collapse is only taken if the root of the summed squared
+    # plane distances at the surviving vertex stays within the given tolerance.  That root bounds the distance
+    # to each of those planes.  Vertices on the mesh boundary are never moved or removed, so the outline of the
+    # piece, and therefore its border loops and its adjacency with other pieces, is unchanged.  Because we only
+    # ever collapse onto existing vertices, no new positions are invented.  Returns the largest error accepted.
+    vertex_list = mesh.vertex_list
+    triangle_list = [list(triangle) for triangle in mesh.triangle_list]
+    if len(triangle_list) == 0:
+        return 0.0
+
+    quadric_list = [[0.0] * 10 for i in range(len(vertex_list))]
+    vertex_triangle_map = [set() for i in range(len(vertex_list))]
+    edge_count_map = {}
+    for i, triangle in enumerate(triangle_list):
+        plane = _calc_plane(vertex_list, triangle)
+        for index in triangle:
+            vertex_triangle_map[index].add(i)
+            if plane is not None:
+                _add_plane(quadric_list[index], plane)
+        for j in range(3):
+            edge = edge_key(triangle[j], triangle[(j + 1) % 3])
+            edge_count_map[edge] = edge_count_map.get(edge, 0) + 1
+
+    locked_set = set()
+    for edge, count in edge_count_map.items():
+        if count != 2:
+            locked_set.add(edge[0])
+            locked_set.add(edge[1])
+
+    removed_set = set()
+    version_list = [0] * len(vertex_list)
+    heap = []
+
+    def push_candidates(index):
+        for neighbor in _neighbors(triangle_list, vertex_triangle_map, index):
+            for source, target in [(index, neighbor), (neighbor, index)]:
+                if source in locked_set:
+                    continue
+                cost = _eval_quadric(_sum_quadrics(quadric_list[source], quadric_list[target]), vertex_list[target])
+                heapq.heappush(heap, (cost, source, target, version_list[source], version_list[target]))
+
+    for index in range(len(vertex_list)):
+        if len(vertex_triangle_map[index]) > 0 and index not in locked_set:
+            push_candidates(index)
+
+    max_error = 0.0
+    tolerance_squared = tolerance * tolerance
+    while len(heap) > 0:
+        cost, source, target, source_version, target_version = heapq.heappop(heap)
+        if cost > tolerance_squared:
+            break
+        if source in removed_set or target in removed_set:
+            continue
+        if version_list[source] != source_version or version_list[target] != target_version:
+            continue
+        if not _can_collapse(vertex_list, triangle_list, vertex_triangle_map, source, target, min_normal_dot):
+            continue
+
+        for i in list(vertex_triangle_map[source]):
+            triangle = triangle_list[i]
+            if target in triangle:
+                for index in triangle:
+                    vertex_triangle_map[index].discard(i)
+                triangle_list[i] = None
+            else:
+                triangle[triangle.index(source)] = target
+                vertex_triangle_map[target].add(i)
+        vertex_triangle_map[source] = set()
+        removed_set.add(source)
+
+        quadric_list[target] = _sum_quadrics(quadric_list[source], quadric_list[target])
+        max_error = max(max_error, math.sqrt(max(cost, 0.0)))
+        for index in [target] + list(_neighbors(triangle_list, vertex_triangle_map, target)):
+            version_list[index] += 1
+        for index in [target] + list(_neighbors(triangle_list, vertex_triangle_map, target)):
+            push_candidates(index)
+
+    compact_mesh(mesh, [tuple(triangle) for triangle in triangle_list if triangle is not None])
+    return max_error
+
+def _simplify_outlines(mesh_list, tolerance, pinned_key_set, quantum):
+    position_map = {}
+    neighbor_map = {}
+    for mesh in mesh_list:
+        edge_set = set()
+        for triangle in mesh.triangle_list:
+            for j in range(3):
+                edge_set.add((triangle[j], triangle[(j + 1) % 3]))
+        for edge in edge_set:
+            if (edge[1], edge[0]) in edge_set:
+                continue
+            key_a = quantize(mesh.vertex_list[edge[0]], quantum)
+            key_b = quantize(mesh.vertex_list[edge[1]], quantum)
+            if key_a == key_b:
+                continue
+            position_map[key_a] = mesh.vertex_list[edge[0]]
+            position_map[key_b] = mesh.vertex_list[edge[1]]
+            neighbor_map.setdefault(key_a, set()).add(key_b)
+            neighbor_map.setdefault(key_b, set()).add(key_a)
+
+    junction_set = set([key for key in neighbor_map if len(neighbor_map[key]) != 2 or key in pinned_key_set])
+
+    chain_list = []
+    visited_set = set()
+    def walk(start_key, next_key):
+        chain = [start_key, next_key]
+        visited_set.add(edge_key(start_key, next_key))
+        while chain[-1] not in junction_set:
+            following_key = [key for key in sorted(neighbor_map[chain[-1]]) if edge_key(chain[-1], key) not in visited_set]
+            if len(following_key) == 0:
+                break
+            visited_set.add(edge_key(chain[-1], following_key[0]))
+            chain.append(following_key[0])
+        return chain
+
+    for key in sorted(junction_set):
+        for neighbor_key in sorted(neighbor_map[key]):
+            if edge_key(key, neighbor_key) not in visited_set:
+                chain_list.append(walk(key, neighbor_key))
+
+    # Whatever is left consists of closed curves without any junctions on them.  Break each at an arbitrary point.
+    for key in sorted(neighbor_map):
+        for neighbor_key in sorted(neighbor_map[key]):
+            if edge_key(key, neighbor_key) not in visited_set:
+                junction_set.add(key)
+                chain_list.append(walk(key, neighbor_key))
+
+    removable_key_set = set()
+    max_deviation = 0.0
+    for chain in chain_list:
+        keep_list = [False] * len(chain)
+        keep_list[0] = True
+        keep_list[-1] = True
+        max_deviation = max(max_deviation, _douglas_peucker([position_map[key] for key in chain], 0, len(chain) - 1, tolerance, keep_list))
+        for key, keep in zip(chain, keep_list):
+            if not keep and key not in junction_set:
+                removable_key_set.add(key)
+
+    return removable_key_set, max_deviation
+
+def _douglas_peucker(point_list, i, j, tolerance, keep_list):
+    # Mark which points between i and j must be kept, returning the largest deviation of those that aren't.
+    if j - i < 2:
+        return 0.0
+    largest_distance = -1.0
+    k = None
+    for m in range(i + 1, j):
+        distance = _distance_to_segment(point_list[m], point_list[i], point_list[j])
+        if distance > largest_distance:
+            largest_distance = distance
+            k = m
+    if largest_distance <= tolerance:
+        return largest_distance
+    keep_list[k] = True
+    return max(_douglas_peucker(point_list, i, k, tolerance, keep_list), _douglas_peucker(point_list, k, j, tolerance, keep_list))
+
+def _distance_to_segment(point, point_a, point_b):
+    vector = point_b - point_a
+    length_squared = vector.dot(vector)
+    if length_squared == 0.0:
+        return (point - point_a).length()
+    t = min(max((point - point_a).dot(vector) / length_squared, 0.0), 1.0)
+    return (point - (point_a + vector * t)).length()
+
+def _can_collapse(vertex_list, triangle_list, vertex_triangle_map, source, target, min_normal_dot):
+    # The link condition: the only vertices adjacent to both ends of the edge must be those opposite it.
+    # Otherwise the collapse would pinch the surface into something non-manifold.
+    shared_triangle_list = [i for i in vertex_triangle_map[source] if target in triangle_list[i]]
+    if len(shared_triangle_list) == 0:
+        return False
+    opposite_set = set()
+    for i in shared_triangle_list:
+        for index in triangle_list[i]:
+            if index != source and index != target:
+                opposite_set.add(index)
+    common_set = _neighbors(triangle_list, vertex_triangle_map, source) & _neighbors(triangle_list, vertex_triangle_map, target)
+    if common_set != opposite_set:
+        return False
+
+    # Don't allow any of the triangles that survive the collapse to flip over or degenerate.
+    for i in vertex_triangle_map[source]:
+        triangle = triangle_list[i]
+        if target in triangle:
+            continue
+        old_normal = _calc_normal(vertex_list, triangle)
+        new_normal = _calc_normal(vertex_list, [target if index == source else index for index in triangle])
+        old_length = old_normal.length()
+        new_length = new_normal.length()
+        if old_length == 0.0:
+            continue
+        if new_length == 0.0 or old_normal.dot(new_normal) / (old_length * new_length) < min_normal_dot:
+            return False
+
+    return True
+
+def _neighbors(triangle_list, vertex_triangle_map, index):
+    neighbor_set = set()
+    for i in vertex_triangle_map[index]:
+        for other in triangle_list[i]:
+            if other != index:
+                neighbor_set.add(other)
+    return neighbor_set
+
+def _calc_normal(vertex_list, triangle):
+    return (vertex_list[triangle[1]] - vertex_list[triangle[0]]).cross(vertex_list[triangle[2]] - vertex_list[triangle[0]])
+
+def _calc_plane(vertex_list, triangle):
+    normal = _calc_normal(vertex_list, triangle)
+    length = normal.length()
+    if length == 0.0:
+        return None
+    normal = normal / length
+    return normal.x, normal.y, normal.z, -normal.dot(vertex_list[triangle[0]])
+
+def _add_plane(quadric, plane):
+    a, b, c, d = plane
+    quadric[0] += a * a
+    quadric[1] += a * b
+    quadric[2] += a * c
+    quadric[3] += b * b
+    quadric[4] += b * c
+    quadric[5] += c * c
+    quadric[6] += a * d
+    quadric[7] += b * d
+    quadric[8] += c * d
+    quadric[9] += d * d
+
+def _sum_quadrics(quadric_a, quadric_b):
+    return [quadric_a[i] + quadric_b[i] for i in range(10)]
+
+def _eval_quadric(quadric, point):
+    x, y, z = point.x, point.y, point.z
+    return (quadric[0] * x * x + 2.0 * quadric[1] * x * y + 2.0 * quadric[2] * x * z
+            + quadric[3] * y * y + 2.0 * quadric[4] * y * z + quadric[5] * z * z
+            + 2.0 * (quadric[6] * x + quadric[7] * y + quadric[8] * z) + quadric[9])
@@ -11,6 +11,7 @@ from math3d_sphere import Sphere
 from math3d_cylinder import Cylinder
 from math3d_point_cloud import PointCloud
 from puzzle_generator import GeneratorMesh, ColoredMesh
+from puzzle_schedule import Cut, Apply
 
 class RubiksCube(PuzzleDefinitionBase):
     def __init__(self):
@@ -58,28 +59,12 @@ class FusedCube(RubiksCube):
         del mesh_list[0]
         return mesh_list
 
-    def transform_meshes_for_more_cutting(self, mesh_list, generator_mesh_list, cut_pass):
-        r_cut_disk = generator_mesh_list[0]
-        u_cut_disk = generator_mesh_list[1]
-        f_cut_disk = generator_mesh_list[2]
-        
-        if cut_pass < 3:
-            self.apply_generator(mesh_list, r_cut_disk)
-        elif cut_pass == 3:
-            self.apply_generator(mesh_list, r_cut_disk)
-            self.apply_generator(mesh_list, u_cut_disk)
-        elif 3 < cut_pass < 6:
-            self.apply_generator(mesh_list, u_cut_disk)
-        elif cut_pass == 6:
-            self.apply_generator(mesh_list, u_cut_disk)
-            self.apply_generator(mesh_list, f_cut_disk)
-        elif 6 < cut_pass < 9:
-            self.apply_generator(mesh_list, f_cut_disk)
-        elif cut_pass == 9:
-            self.apply_generator(mesh_list, f_cut_disk)
-            return False
-        
-        return True
+    def cut_schedule(self, generator_mesh_list):
+        # Give each of the R, U and F faces a full turn, cutting after each quarter turn.
+        schedule = [Cut()]
+        for i in range(3):
+            schedule += [Apply(i), Cut()] * 3 + [Apply(i)]
+        return schedule
 
 class CopterBase(PuzzleDefinitionBase):
     def __init__(self):
@@ -163,7 +148,7 @@ class CurvyCopter(CopterBase):
 
         mesh_list = []
         for sphere in sphere_list:
-            mesh = GeneratorMesh(mesh=sphere.make_mesh(subdivision_level=2), axis=sphere.center.normalized(), angle=math.pi, pick_point=sphere.center.resized(math.sqrt(2.0)))
+            mesh = GeneratorMesh(mesh=self.make_sphere_mesh(sphere), axis=sphere.center.normalized(), angle=math.pi, pick_point=sphere.center.resized(math.sqrt(2.0)))
             mesh_list.append(mesh)
         
         return mesh_list
@@ -204,7 +189,7 @@ class FlowerCopter(CurvyCopter):
         point_list = [point for point in Vector(1.0, 1.0, 1.0).sign_permute()]
         for point in point_list:
             sphere = Sphere(point, radius)
-            mesh = GeneratorMesh(mesh=sphere.make_mesh(subdivision_level=2), axis=point.normalized(), angle=2.0 * math.pi / 3.0, pick_point=point)
+            mesh = GeneratorMesh(mesh=self.make_sphere_mesh(sphere), axis=point.normalized(), angle=2.0 * math.pi / 3.0, pick_point=point)
             mesh_list.append(mesh)
         
         return mesh_list
@@ -247,7 +232,7 @@ class FlowerRexCube(PuzzleDefinitionBase):
         length = 3.0
         radius = (Vector(1.0, 1.0, 1.0).resized(length) - Vector(-1.0, 1.0, 1.0)).length()
         for vector in Vector(1.0, 1.0, 1.0).sign_permute():
-            mesh = GeneratorMesh(mesh=Sphere(vector.resized(length), radius).make_mesh(subdivision_level=2), axis=vector.normalized(), angle=2.0 * math.pi / 3.0, pick_point=vector)
+            mesh = GeneratorMesh(mesh=self.make_sphere_mesh(Sphere(vector.resized(length), radius)), axis=vector.normalized(), angle=2.0 * math.pi / 3.0, pick_point=vector)
             mesh_list.append(mesh)
         return mesh_list
     
@@ -288,29 +273,11 @@ class SquareOne(PuzzleDefinitionBase):
         
         return mesh_list
 
-    def transform_meshes_for_more_cutting(self, mesh_list, generator_mesh_list, cut_pass):
-        u_cut_disk = generator_mesh_list[1]
-        d_cut_disk = generator_mesh_list[2]
-        
-        if cut_pass == 0:
-            self.apply_generator(mesh_list, u_cut_disk)
-            self.apply_generator(mesh_list, d_cut_disk, inverse=True)
-            return True
-        elif cut_pass == 1:
-            self.apply_generator(mesh_list, u_cut_disk)
-            self.apply_generator(mesh_list, d_cut_disk, inverse=True)
-            self.apply_generator(mesh_list, u_cut_disk)
-            self.apply_generator(mesh_list, d_cut_disk, inverse=True)
-            return True
-        elif cut_pass == 2:
-            self.apply_generator(mesh_list, u_cut_disk)
-            self.apply_generator(mesh_list, d_cut_disk, inverse=True)
-            return True
-
-        for i in range(8):
-            self.apply_generator(mesh_list, u_cut_disk)
-            self.apply_generator(mesh_list, d_cut_disk, inverse=True)
-        return False
+    def cut_schedule(self, generator_mesh_list):
+        # Turn the top and bottom layers a twelfth in opposite directions, cutting after one, two, and then one more
+        # such turn, and then turn them the rest of the way around.
+        turn = [Apply(1), Apply(2, inverse=True)]
+        return [Cut()] + turn + [Cut()] + turn * 2 + [Cut()] + turn + [Cut()] + turn * 8
 
 class Bagua(PuzzleDefinitionBase):
     def __init__(self):
@@ -387,70 +354,21 @@ class PentacleCube(RubiksCube):
         ]
         
         for vector in vector_list:
-            mesh = GeneratorMesh(mesh=Sphere(vector, 1.0).make_mesh(subdivision_level=2), axis=vector, angle=math.pi / 10.0, pick_point=vector.resized(1.5))
+            mesh = GeneratorMesh(mesh=self.make_sphere_mesh(Sphere(vector, 1.0)), axis=vector, angle=math.pi / 10.0, pick_point=vector.resized(1.5))
             mesh_list.append(mesh)
         
         return mesh_list
 
-    def can_apply_cutmesh_for_pass(self, i, cut_mesh, cut_pass, generator_mesh_list):
-        if cut_pass == 0 and i >= 6:
-            return True
-        
-        if cut_pass == 1 and i == 0: # left
-            return True
-        if cut_pass == 2 and i == 3: # up
-            return True
-        if cut_pass == 3 and i == 1: # right
-            return True
-        if cut_pass == 4 and i == 2: # down
-            return True
-        if cut_pass == 5 and i == 0: # left
-            return True
-        if cut_pass == 6 and i == 5: # forward
-            return True
-        if cut_pass == 7 and i == 4: # back
-            return True
-        if cut_pass == 8 and i == 5: # forward
-            return True
-        
-        return False
-
-    def transform_meshes_for_more_cutting(self, mesh_list, generator_mesh_list, cut_pass):
-        l_cut_circle = generator_mesh_list[6]
-        r_cut_circle = generator_mesh_list[7]
-        d_cut_circle = generator_mesh_list[8]
-        u_cut_circle = generator_mesh_list[9]
-        b_cut_circle = generator_mesh_list[10]
-        f_cut_circle = generator_mesh_list[11]
-        
-        if cut_pass == 0:
-            pass
-        
-        if cut_pass == 1 or cut_pass == 2 or cut_pass == 3 or cut_pass == 4:
-            self.apply_generator(mesh_list, f_cut_circle)
-            self.apply_generator(mesh_list, b_cut_circle, inverse=True)
-            self.apply_generator(mesh_list, u_cut_circle, inverse=True)
-            self.apply_generator(mesh_list, d_cut_circle)
-            self.apply_generator(mesh_list, l_cut_circle)
-            self.apply_generator(mesh_list, r_cut_circle, inverse=True)
-        
-        if cut_pass == 5:
-            for i in range(6):
-                self.apply_generator(mesh_list, l_cut_circle)
-                self.apply_generator(mesh_list, r_cut_circle, inverse=True)
-            for i in range(3):
-                self.apply_generator(mesh_list, u_cut_circle)
-                self.apply_generator(mesh_list, d_cut_circle, inverse=True)
-                
-        if cut_pass == 6 or cut_pass == 7:
-            for i in range(2):
-                self.apply_generator(mesh_list, l_cut_circle)
-                self.apply_generator(mesh_list, r_cut_circle, inverse=True)
-            for i in range(2):
-                self.apply_generator(mesh_list, u_cut_circle, inverse=True)
-                self.apply_generator(mesh_list, d_cut_circle)
-                
-        return True if cut_pass < 8 else False
+    def cut_schedule(self, generator_mesh_list):
+        # Cut against the circles, then against the faces, one at a time, between turns of the circles.
+        l, r, d, u, b, f = range(6, 12)
+        twist = [Apply(f), Apply(b, inverse=True), Apply(u, inverse=True), Apply(d), Apply(l), Apply(r, inverse=True)]
+        schedule = [Cut(list(range(6, 12))), Cut([0])] + twist
+        schedule += [Cut([3])] + twist + [Cut([1])] + twist + [Cut([2])] + twist
+        schedule += [Cut([0])] + [Apply(l), Apply(r, inverse=True)] * 6 + [Apply(u), Apply(d, inverse=True)] * 3
+        tilt = [Apply(l), Apply(r, inverse=True)] * 2 + [Apply(u, inverse=True), Apply(d)] * 2
+        schedule += [Cut([5])] + tilt + [Cut([4])] + tilt + [Cut([5])]
+        return schedule
     
     def min_mesh_area(self):
         return 0.05
@@ -545,90 +463,41 @@ class Bubbloid4x4x5(PuzzleDefinitionBase):
         mesh_list = []
         for vector in Vector(1.0, 1.0, 1.0).sign_permute():
             center = scale_transform(vector)
-            mesh = GeneratorMesh(mesh=Sphere(center, radius).make_mesh(subdivision_level=2), axis=vector.normalized(), angle=2.0 * math.pi / 3.0, center=center, pick_point=center)
+            mesh = GeneratorMesh(mesh=self.make_sphere_mesh(Sphere(center, radius)), axis=vector.normalized(), angle=2.0 * math.pi / 3.0, center=center, pick_point=center)
             mesh_list.append(mesh)
         return mesh_list
 
+    def calc_cutter_bounds(self, initial_mesh_list):
+        # Pieces are turned about the corners of this puzzle, so between cut passes they can stray outside its bounding sphere.
+        center, radius = super().calc_cutter_bounds(initial_mesh_list)
+        corner = Vector(1.0, self.s, 1.0)
+        return center, max(radius, corner.length() + self.a + 2.0 * self.b)
+
     def find_generator_with_axis(self, generator_mesh_list, axis):
-        for mesh in generator_mesh_list:
+        for i, mesh in enumerate(generator_mesh_list):
             if (mesh.axis - axis.normalized()).length() < 1e-6:
-                return mesh
-
-    def transform_meshes_for_more_cutting(self, mesh_list, generator_mesh_list, cut_pass):
-        if cut_pass == 0 or cut_pass == 1 or cut_pass == 2:
-            self.apply_generator(mesh_list, generator_mesh_list[0])
-        if cut_pass == 2 or cut_pass == 3 or cut_pass == 4:
-            self.apply_generator(mesh_list, generator_mesh_list[1])
-        if cut_pass == 4 or cut_pass == 5 or cut_pass == 6:
-            self.apply_generator(mesh_list, generator_mesh_list[2])
-        if cut_pass == 6 or cut_pass == 7 or cut_pass == 8:
-            self.apply_generator(mesh_list, generator_mesh_list[3])
-        if cut_pass == 8 or cut_pass == 9 or cut_pass == 10:
-            self.apply_generator(mesh_list, generator_mesh_list[4])
-        if cut_pass == 10 or cut_pass == 11 or cut_pass == 12:
-            self.apply_generator(mesh_list, generator_mesh_list[5])
-        if cut_pass == 12 or cut_pass == 13 or cut_pass == 14:
-            self.apply_generator(mesh_list, generator_mesh_list[6])
-        if cut_pass == 14 or cut_pass == 15 or cut_pass == 16:
-            self.apply_generator(mesh_list, generator_mesh_list[7])
-        if cut_pass == 16:
-            self.apply_generator(mesh_list, self.find_generator_with_axis(generator_mesh_list, Vector(1.0, 1.0, 1.0)), inverse=True)
-            self.apply_generator(mesh_list, self.find_generator_with_axis(generator_mesh_list, Vector(1.0, 1.0, -1.0)), inverse=True)
-            self.apply_generator(mesh_list, self.find_generator_with_axis(generator_mesh_list, Vector(-1.0, 1.0, -1.0)), inverse=True)
-            self.apply_generator(mesh_list, self.find_generator_with_axis(generator_mesh_list, Vector(-1.0, 1.0, 1.0)), inverse=True)
-            self.apply_generator(mesh_list, self.find_generator_with_axis(generator_mesh_list, Vector(1.0, 1.0, 1.0)), inverse=True)
-        elif cut_pass == 17:
-            self.apply_generator(mesh_list, self.find_generator_with_axis(generator_mesh_list, Vector(1.0, 1.0, 1.0)))
-            self.apply_generator(mesh_list, self.find_generator_with_axis(generator_mesh_list, Vector(-1.0, 1.0, 1.0)))
-            self.apply_generator(mesh_list, self.find_generator_with_axis(generator_mesh_list, Vector(-1.0, 1.0, -1.0)))
-            self.apply_generator(mesh_list, self.find_generator_with_axis(generator_mesh_list, Vector(1.0, 1.0, -1.0)))
-            self.apply_generator(mesh_list, self.find_generator_with_axis(generator_mesh_list, Vector(1.0, 1.0, 1.0)))
-
-            self.apply_generator(mesh_list, self.find_generator_with_axis(generator_mesh_list, Vector(1.0, -1.0, 1.0)))
-            self.apply_generator(mesh_list, self.find_generator_with_axis(generator_mesh_list, Vector(1.0, -1.0, -1.0)))
-            self.apply_generator(mesh_list, self.find_generator_with_axis(generator_mesh_list, Vector(-1.0, -1.0, -1.0)))
-            self.apply_generator(mesh_list, self.find_generator_with_axis(generator_mesh_list, Vector(-1.0, -1.0, 1.0)))
-            self.apply_generator(mesh_list, self.find_generator_with_axis(generator_mesh_list, Vector(1.0, -1.0, 1.0)))
-        elif cut_pass == 18:
-            self.apply_generator(mesh_list, self.find_generator_with_axis(generator_mesh_list, Vector(1.0, -1.0, 1.0)), inverse=True)
-            self.apply_generator(mesh_list, self.find_generator_with_axis(generator_mesh_list, Vector(-1.0, -1.0, 1.0)), inverse=True)
-            self.apply_generator(mesh_list, self.find_generator_with_axis(generator_mesh_list, Vector(-1.0, -1.0, -1.0)), inverse=True)
-            self.apply_generator(mesh_list, self.find_generator_with_axis(generator_mesh_list, Vector(1.0, -1.0, -1.0)), inverse=True)
-            self.apply_generator(mesh_list, self.find_generator_with_axis(generator_mesh_list, Vector(1.0, -1.0, 1.0)), inverse=True)
-
-        return True if cut_pass < 18 else False
-
-    def can_apply_cutmesh_for_pass(self, i, cut_mesh, cut_pass, generator_mesh_list):
-        if cut_pass == 0:
-            return True
+                return i
 
-        if 0 < cut_pass <= 16:
-            if cut_pass == 1 or cut_pass == 2:
-                vector = generator_mesh_list[0].axis.resized(math.sqrt(3.0))
-            elif cut_pass == 3 or cut_pass == 4:
-                vector = generator_mesh_list[1].axis.resized(math.sqrt(3.0))
-            elif cut_pass == 5 or cut_pass == 6:
-                vector = generator_mesh_list[2].axis.resized(math.sqrt(3.0))
-            elif cut_pass == 7 or cut_pass == 8:
-                vector = generator_mesh_list[3].axis.resized(math.sqrt(3.0))
-            elif cut_pass == 9 or cut_pass == 10:
-                vector = generator_mesh_list[4].axis.resized(math.sqrt(3.0))
-            elif cut_pass == 11 or cut_pass == 12:
-                vector = generator_mesh_list[5].axis.resized(math.sqrt(3.0))
-            elif cut_pass == 13 or cut_pass == 14:
-                vector = generator_mesh_list[6].axis.resized(math.sqrt(3.0))
-            elif cut_pass == 15 or cut_pass == 16:
-                vector = generator_mesh_list[7].axis.resized(math.sqrt(3.0))
-    
-            distance = (vector - cut_mesh.axis.resized(math.sqrt(3.0))).length()
-            return True if math.fabs(distance - 2.0) < 1e-5 else False
-        
-        if cut_pass == 17:
-            return True if math.fabs(cut_mesh.axis.resized(math.sqrt(3.0)).y + 1.0) < 1e-5 else False
-        if cut_pass == 18:
-            return True if math.fabs(cut_mesh.axis.resized(math.sqrt(3.0)).y - 1.0) < 1e-5 else False
-        
-        return False
+    def cut_schedule(self, generator_mesh_list):
+        # Give each corner a full turn in two steps, cutting against its neighboring corners after each, then turn the
+        # top and bottom corners in a cycle, cutting against the bottom corners, then the top corners, in between.
+        corner_list = [mesh.axis.resized(math.sqrt(3.0)) for mesh in generator_mesh_list]
+        schedule = [Cut(), Apply(0)]
+        for k in range(8):
+            neighbor_list = [i for i in range(8) if math.fabs((corner_list[k] - corner_list[i]).length() - 2.0) < 1e-5]
+            schedule += [Cut(neighbor_list), Apply(k), Cut(neighbor_list), Apply(k)]
+            if k < 7:
+                schedule += [Apply(k + 1)]
+        top_list = [self.find_generator_with_axis(generator_mesh_list, vector) for vector in [
+            Vector(1.0, 1.0, 1.0), Vector(1.0, 1.0, -1.0), Vector(-1.0, 1.0, -1.0), Vector(-1.0, 1.0, 1.0), Vector(1.0, 1.0, 1.0)]]
+        bottom_list = [self.find_generator_with_axis(generator_mesh_list, vector) for vector in [
+            Vector(1.0, -1.0, 1.0), Vector(1.0, -1.0, -1.0), Vector(-1.0, -1.0, -1.0), Vector(-1.0, -1.0, 1.0), Vector(1.0, -1.0, 1.0)]]
+        schedule += [Apply(i, inverse=True) for i in top_list]
+        schedule += [Cut([i for i in range(8) if math.fabs(corner_list[i].y + 1.0) < 1e-5])]
+        schedule += [Apply(i) for i in reversed(top_list)] + [Apply(i) for i in bottom_list]
+        schedule += [Cut([i for i in range(8) if math.fabs(corner_list[i].y - 1.0) < 1e-5])]
+        schedule += [Apply(i, inverse=True) for i in reversed(bottom_list)]
+        return schedule
 
 class Rubiks2x2(PuzzleDefinitionBase):
     def __init__(self):
@@ -741,7 +610,7 @@ class BauhiniaDodecahedron(PuzzleDefinitionBase):
         mesh_list = []
 
         for vertex in self.vertex_list:
-            mesh = GeneratorMesh(mesh=Sphere(vertex, self.edge_length).make_mesh(subdivision_level=2), axis=vertex.normalized(), angle=2.0 * math.pi / 3.0, pick_point=vertex)
+            mesh = GeneratorMesh(mesh=self.make_sphere_mesh(Sphere(vertex, self.edge_length)), axis=vertex.normalized(), angle=2.0 * math.pi / 3.0, pick_point=vertex)
             mesh_list.append(mesh)
 
         return mesh_list
@@ -1254,6 +1123,11 @@ class WormHoleII(WormHoleBase):
         
         return mesh_list
 
+    def annotate_puzzle_data(self, puzzle_data):
+        # The page needs to know which pieces are of the core, and those are what's left of the hidden face.
+        for mesh_data in puzzle_data['mesh_list']:
+            mesh_data['special_case_data'] = {'core': mesh_data['alpha'] == 0.0}
+
 class LatchCube(RubiksCube):
     def __init__(self):
         super().__init__()
@@ -1320,7 +1194,7 @@ class LatchCube(RubiksCube):
 
 class Rubiks3x3x5(RubiksCube):
     def __init__(self):
-        pass
+        super().__init__()
 
     def bandages(self):
         return True
@@ -1536,27 +1410,19 @@ class DreidelCube(RubiksCube):
 
         for center in Vector(1.0, 1.0, 1.0).sign_permute():
             sphere = Sphere(center, radius)
-            mesh = GeneratorMesh(mesh=sphere.make_mesh(subdivision_level=2), axis=center.normalized(), angle=math.pi / 3.0, pick_point=center)
+            mesh = GeneratorMesh(mesh=self.make_sphere_mesh(sphere), axis=center.normalized(), angle=math.pi / 3.0, pick_point=center)
             mesh_list.append(mesh)
 
         return mesh_list
 
-    def can_apply_cutmesh_for_pass(self, i, cut_mesh, cut_pass, generator_mesh_list):
-        if cut_pass == 0:
-            return True
-        if cut_pass == 1:
-            return True if 0 <= i < 6 else False
-        return False
-
-    def transform_meshes_for_more_cutting(self, mesh_list, generator_mesh_list, cut_pass):
-        if cut_pass == 0:
-            for i in range(6, len(generator_mesh_list)):
-                self.apply_generator(mesh_list, generator_mesh_list[i])
-            return True
-        if cut_pass == 1:
-            for i in range(6, len(generator_mesh_list)):
-                self.apply_generator(mesh_list, generator_mesh_list[i], inverse=True)
-            return False
+    def cut_schedule(self, generator_mesh_list):
+        # Turn each corner once, cut against the faces again, then turn the corners back.
+        corner_list = list(range(6, len(generator_mesh_list)))
+        schedule = [Cut()]
+        schedule += [Apply(i) for i in corner_list]
+        schedule += [Cut(list(range(6)))]
+        schedule += [Apply(i, inverse=True) for i in corner_list]
+        return schedule
 
 class EitansStar(PuzzleDefinitionBase):
     def __init__(self):
@@ -0,0 +1,126 @@
+# puzzle_events.py
+
+import os
+import json
+import time
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+try:
+    import msvcrt
+except ImportError:
+    msvcrt = None
+
+class EventStream(object):
+    # This writes one JSON object per line for each step of generating a puzzle, so that a parent process or
+    # dashboard can follow along.  Every event carries the puzzle name, the wall-clock time, the seconds elapsed
+    # since the puzzle was started, and an estimate of the seconds remaining.  The estimate comes from a history
+    # of how long each step took the last time the same puzzle was generated, scaled by how far ahead or behind
+    # of that pace we are now.  If there is no history for the puzzle, no estimate is given.
+    def __init__(self, handle, history_path=None, owns_handle=False):
+        self.handle = handle
+        self.owns_handle = owns_handle
+        self.history_path = history_path
+        self.history_map = self.load_history()
+        self.puzzle_name = None
+        self.start_time = None
+        self.step_elapsed_list = []
+
+    def load_history(self):
+        if self.history_path is None or not os.path.exists(self.history_path):
+            return {}
+        with open(self.history_path, 'r') as handle:
+            return json.loads(handle.read())
+
+    def save_history(self, total_seconds):
+        # Other processes may be generating other puzzles and updating the same history, so we take a lock on a file
+        # beside it, merge with whatever is there now, and swap the file in whole.  The swap alone keeps readers from
+        # seeing half a file, but without the lock, two writers could each merge before the other swapped, and one
+        # of their entries would be lost.
+        if self.history_path is None:
+            return
+        history_dir = os.path.dirname(self.history_path)
+        if history_dir != '':
+            os.makedirs(history_dir, exist_ok=True)
+        with open(self.history_path + '.lock', 'a+') as lock_handle:
+            _lock_file(lock_handle)
+            try:
+                history_map = self.load_history()
+                history_map[self.puzzle_name] = {
+                    'total_seconds': total_seconds,
+                    'step_elapsed_list': self.step_elapsed_list
+                }
+                temp_path = '%s.%d.tmp' % (self.history_path, os.getpid())
+                with open(temp_path, 'w') as handle:
+                    handle.write(json.dumps(history_map, indent=4, separators=(',', ': '), sort_keys=True))
+                os.replace(temp_path, self.history_path)
+            finally:
+                _unlock_file(lock_handle)
+
+    def close(self):
+        if self.owns_handle:
+            self.handle.close()
+
+    def calc_remaining_seconds(self, elapsed):
+        history = self.history_map.get(self.puzzle_name)
+        if history is None:
+            return None
+        total_seconds = history['total_seconds']
+        step_elapsed_list = history['step_elapsed_list']
+        step = len(self.step_elapsed_list)
+        if step == 0 or step > len(step_elapsed_list) or step_elapsed_list[step - 1] <= 0.0:
+            return max(total_seconds - elapsed, 0.0)
+        history_elapsed = step_elapsed_list[step - 1]
+        return max(total_seconds - history_elapsed, 0.0) * elapsed / history_elapsed
+
+    def begin_puzzle(self, puzzle_name):
+        self.puzzle_name = puzzle_name
+        self.start_time = time.perf_counter()
+        self.step_elapsed_list = []
+        self.emit('puzzle_start')
+
+    def end_step(self):
+        # Steps are the applications of generators to the meshes, which is where the time goes.
+        self.step_elapsed_list.append(time.perf_counter() - self.start_time)
+
+    def end_puzzle(self, **fields):
+        total_seconds = time.perf_counter() - self.start_time
+        self.emit('puzzle_end', **fields)
+        self.save_history(total_seconds)
+
+    def emit(self, event, **fields):
+        elapsed = time.perf_counter() - self.start_time
+        data = {
+            'event': event,
+            'puzzle': self.puzzle_name,
+            'time': time.time(),
+            'elapsed': elapsed,
+            'remaining': 0.0 if event == 'puzzle_end' else self.calc_remaining_seconds(elapsed),
+            'step': len(self.step_elapsed_list)
+        }
+        data.update(fields)
+        self.handle.write(json.dumps(data, sort_keys=True) + '\n')
+        self.handle.flush()
+
+def _lock_file(handle):
+    # Block until we hold the lock on the given file, where the platform has a way to lock one.
+    if fcntl is not None:
+        fcntl.flock(handle.fileno(), fcntl.LOCK_EX)
+    elif msvcrt is not None:
+        handle.seek(0)
+        while True:
+            try:
+                msvcrt.locking(handle.fileno(), msvcrt.LK_LOCK, 1)
+                break
+            except OSError:
+                pass    # LK_LOCK gives up after ten seconds, but we don't.
+
+def _unlock_file(handle):
+    if fcntl is not None:
+        fcntl.flock(handle.fileno(), fcntl.LOCK_UN)
+    elif msvcrt is not None:
+        handle.seek(0)
+        msvcrt.locking(handle.fileno(), msvcrt.LK_UNLCK, 1)
@@ -1,11 +1,15 @@
 # puzzle_generator.py
 
 import argparse
+import os
 import sys
 import json
 import math
 import gzip
-import datetime
+import time
+import random
+import itertools
+import multiprocessing
 
 sys.path.append(r'c:\dev\pyMath3d')
 
@@ -14,6 +18,18 @@ from math3d_transform import LinearTransform, AffineTransform
 from math3d_vector import Vector
 from math3d_side import Side
 from math3d_point_cloud import PointCloud
+from puzzle_tessellation import make_adaptive_sphere_mesh, calc_bounding_sphere
+from puzzle_retriangulate import retriangulate_coplanar_regions
+from puzzle_decimate import decimate_mesh_list
+from puzzle_border import find_border_loops
+from puzzle_implicit import split_mesh_by_surface, fit_implicit_surface
+from puzzle_bvh import TriangleBVH, calc_mesh_bounds, calc_triangle_bounds
+from puzzle_buffers import make_packed_buffers
+from puzzle_profile import ProfileBlock, span, count
+from puzzle_events import EventStream
+from puzzle_schedule import Apply, simplify_cut_schedule
+from puzzle_cutting import find_symmetric_generators, apply_generator_run, split_mesh, init_split_worker, split_mesh_in_worker
+from puzzle_archive import ARCHIVE_PATH, build_archive
 
 class ColoredMesh(TriangleMesh):
     def __init__(self, mesh=None, color=None, alpha=1.0):
@@ -24,6 +40,10 @@ class ColoredMesh(TriangleMesh):
         self.normal_list = []
         self.texture_number = -1
         self.border_loop_list = []
+        # Set while the mesh has yet to be reduced since coming out of a split.
+        self.needs_reduce = True
+        # The area as last calculated by calc_cached_area().  Anything that changes the shape of the mesh must reset this.
+        self.cached_area = None
 
     def clone(self):
         return ColoredMesh(mesh=super().clone(), color=self.color.clone(), alpha=self.alpha)
@@ -69,9 +89,8 @@ class ColoredMesh(TriangleMesh):
             glBegin(GL_LINE_LOOP)
             try:
                 for i in border_loop:
-                    point = self.vertex_list[i].clone()
-                    point *= scale      # This idea won't work in all cases.
-                    glVertex3f(point.x, point.y, point.z)
+                    point = self.vertex_list[i]
+                    glVertex3f(point.x * scale, point.y * scale, point.z * scale)      # This idea won't work in all cases.
             finally:
                 glEnd()
 
@@ -89,11 +108,20 @@ class ColoredMesh(TriangleMesh):
                 best_triangle = triangle
         return best_triangle.calc_center()
 
+    def calc_cached_area(self):
+        if self.cached_area is None:
+            self.cached_area = self.area()
+        return self.cached_area
+
+    def carry_state_from(self, mesh):
+        # The given mesh was rigidly moved to get this one, so what we knew about it still holds.
+        self.needs_reduce = mesh.needs_reduce
+        self.cached_area = mesh.cached_area
+
     def calc_border_loop_list(self):
-        try:
-            self.border_loop_list = self.find_boundary_loops()
-        except:
-            self.border_loop_list = [] # Eat exceptions for now.  There is a bug I still need to find and fix.
+        # Return the number of vertices welded and the number of border edges left open so that the caller can report them.
+        self.border_loop_list, weld_count, open_count = find_border_loops(self.vertex_list, self.triangle_list)
+        return weld_count, open_count
 
 class GeneratorMesh(TriangleMesh):
     def __init__(self, mesh=None, center=None, axis=None, angle=None, pick_point=None, min_capture_count=None, max_capture_count=None):
@@ -106,6 +134,12 @@ class GeneratorMesh(TriangleMesh):
         self.min_capture_count = min_capture_count
         self.max_capture_count = max_capture_count
         self.fixed_label = ''
+        # This is built over our triangles the first time we're used as a cutter or asked what side a point is on.
+        self.bvh = None
+        # When set, this is the exact surface our triangles approximate, and we cut and test sides against it instead,
+        # refining what we cut so that it strays from the surface by no more than the given chord error.
+        self.surface = None
+        self.surface_chord_error = None
 
     def clone(self):
         return GeneratorMesh(mesh=super().clone(), axis=self.axis.clone(), angle=self.angle, pick_point=self.pick_point.clone())
@@ -141,35 +175,97 @@ class GeneratorMesh(TriangleMesh):
             plane_list.append(plane.to_dict())
         return plane_list
     
-    def captures_mesh(self, mesh):
-        center = mesh.calc_center()
-        return True if self.side(center) == Side.BACK else False
+    def get_bvh(self):
+        if self.bvh is None or self.bvh.is_stale(self.vertex_list, self.triangle_list):
+            self.bvh = TriangleBVH(self.vertex_list, self.triangle_list)
+        return self.bvh
+
+    def side(self, point, eps=1e-7):
+        # The point is behind us if it's behind every one of our triangles' planes, as the page has it too.
+        if self.surface is not None:
+            value = self.surface.evaluate(point)
+            return Side.BACK if value < -eps else (Side.FRONT if value > eps else Side.NEITHER)
+        side = self.get_bvh().calc_side((point.x, point.y, point.z), eps)
+        return Side.BACK if side < 0 else (Side.FRONT if side > 0 else Side.NEITHER)
+
+    def split_mesh(self, mesh):
+        # Split the given mesh against this one, returning its back and front parts.  Most meshes don't come near most
+        # of a cutter, and many don't come near it at all, which we can tell from the bounds of their triangles.  Such
+        # a mesh goes whole to whichever side all its vertices are on, without the cost of a full split.
+        if self.surface is not None:
+            count('implicit_splits')
+            return split_mesh_by_surface(mesh, self.surface, self.surface_chord_error)
+        bvh = self.get_bvh()
+        if not bvh.overlaps_bounds(calc_mesh_bounds(mesh)) or not any(bvh.overlaps_bounds(calc_triangle_bounds(mesh, triangle)) for triangle in mesh.triangle_list):
+            side_set = set([self.side(vertex) for vertex in mesh.vertex_list])
+            if side_set == set([Side.BACK]):
+                count('splits_avoided')
+                return mesh, TriangleMesh()
+            if side_set == set([Side.FRONT]):
+                count('splits_avoided')
+                return TriangleMesh(), mesh
+        return mesh.split_against_mesh(self)
 
-    def transform_mesh(self, mesh, inverse=False):
-        transform = AffineTransform().make_rotation(self.axis, -self.angle if not inverse else self.angle, center=self.center)
-        return transform(mesh)
+    def captures_mesh(self, mesh):
+        return self.captures_point(mesh.calc_center())
 
-class ProfileBlock(object):
-    def __init__(self, label):
-        self.label = label
-        self.start_time = None
+    def captures_point(self, point):
+        return True if self.side(point) == Side.BACK else False
 
-    def __enter__(self):
-        self.start_time = datetime.datetime.now()
-        return self
+    def make_transform(self, inverse=False):
+        return AffineTransform().make_rotation(self.axis, -self.angle if not inverse else self.angle, center=self.center)
 
-    def __exit__(self, type, exc, tb):
-        stop_time = datetime.datetime.now()
-        delta_time = stop_time - self.start_time
-        total_seconds = delta_time.total_seconds()
-        print('%s: %f seconds' % (self.label, total_seconds))
+    def transform_mesh(self, mesh, inverse=False):
+        transform = self.make_transform(inverse)
+        new_mesh = transform(mesh)
+        if isinstance(mesh, ColoredMesh):
+            new_mesh.carry_state_from(mesh)
+        return new_mesh
 
 class PuzzleDefinitionBase(object):
     def __init__(self):
-        pass
+        # When set, curved cutters are tessellated adaptively so that they deviate from the true surface
+        # by no more than this amount, but only where they can actually touch the puzzle.
+        self.max_chord_error = None
+        self.cutter_bounds = None
+        # When set, the pieces are decimated to within this tolerance before being written out.
+        self.decimation_tolerance = None
+        # Each tolerance here gets written out as an additional, decimated level of detail.  The page loads
+        # the coarsest of these first so that it can become interactive before the full-detail puzzle arrives.
+        # Unless outlines are simplified, decimation can only thin out the interiors of stickers, which rarely saves
+        # much, so this is left for each puzzle to opt into.  A level is only kept if its file comes to no more than
+        # the given fraction of the full-detail file, since otherwise the page would download nearly twice as much
+        # to get to full detail; without it, the server answers for it with the full-detail puzzle.
+        self.lod_tolerance_list = []
+        self.lod_max_size_fraction = 0.5
+        # When set, decimation also simplifies the outlines of the stickers, which moves the boundaries between pieces.
+        # Otherwise only their interiors are decimated, and border loops and adjacency are kept exactly.
+        self.simplify_outlines = False
+        # When set, the pieces are written out as one interleaved vertex buffer and one index buffer for the whole puzzle.
+        self.packed_buffers = False
+        # When set to bit depths for position, normal and UV, the packed buffers are quantized and reordered to compress well.
+        self.quantization_bits = None
+        # This is filled in as the meshes are generated, with the time taken, split calls made and resulting
+        # mesh and triangle counts for each cut pass.
+        self.cut_pass_stats_list = []
+        # When set, structured progress events are written to this stream as the puzzle is generated.
+        self.event_stream = None
+        # When set above one, scheduled cuts are carried out by a pool of this many worker processes.
+        self.cut_worker_count = None
+        # When set, cutters that are planes, spheres or cylinders cut as the exact surfaces they approximate, to within
+        # the chord error, or the default here.  The tessellated cutters are then only used for output.
+        self.implicit_cutters = False
+        self.implicit_chord_error = 0.002
     
     def bandages(self):
         return False
+
+    def emit_event(self, event, **fields):
+        if self.event_stream is not None:
+            self.event_stream.emit(event, **fields)
+
+    def merge_coplanar_triangles(self):
+        return True
     
     def make_initial_mesh_list(self):
         # Most, but not all puzzles are based on the cube with the following standard colors.
@@ -204,7 +300,26 @@ class PuzzleDefinitionBase(object):
     
     def min_mesh_area(self):
         return 0.001
+
+    def calc_cutter_bounds(self, initial_mesh_list):
+        # Puzzles that shape-shift far outside their initial bounds between cut passes may need to override this.
+        return calc_bounding_sphere(initial_mesh_list)
+
+    def make_sphere_mesh(self, sphere):
+        if self.max_chord_error is None or self.implicit_cutters:
+            return sphere.make_mesh(subdivision_level=2)
+        return make_adaptive_sphere_mesh(sphere.center, sphere.radius, self.max_chord_error, bounds=self.cutter_bounds)
     
+    def attach_implicit_surfaces(self, generator_mesh_list):
+        chord_error = self.max_chord_error if self.max_chord_error is not None else self.implicit_chord_error
+        implicit_count = 0
+        for generator_mesh in generator_mesh_list:
+            generator_mesh.surface = fit_implicit_surface(generator_mesh, generator_mesh.axis, self.cutter_bounds)
+            generator_mesh.surface_chord_error = chord_error
+            if generator_mesh.surface is not None:
+                implicit_count += 1
+        print('Cutting against %d of %d cutters implicitly.' % (implicit_count, len(generator_mesh_list)))
+
     def can_apply_cutmesh_for_pass(self, i, cut_mesh, cut_pass, generator_mesh_list):
         return True
 
@@ -212,73 +327,291 @@ class PuzzleDefinitionBase(object):
         return True
 
     def generate_final_mesh_list(self):
-        initial_mesh_list = self.make_initial_mesh_list()
-        final_mesh_list = [mesh.clone() for mesh in initial_mesh_list]
-        generator_mesh_list = self.make_generator_mesh_list()
-        
-        cut_pass = 0
-        while True:
-            print('Performing cut pass %d...' % cut_pass)
+        with span('generate_final_mesh_list'):
+            initial_mesh_list = self.make_initial_mesh_list()
+            final_mesh_list = [mesh.clone() for mesh in initial_mesh_list]
+            self.cutter_bounds = self.calc_cutter_bounds(initial_mesh_list)
+            generator_mesh_list = self.make_generator_mesh_list()
+            if self.implicit_cutters:
+                self.attach_implicit_surfaces(generator_mesh_list)
             
-            # Cut all the meshes against all the generator meshes.
-            for i, cut_mesh in enumerate(generator_mesh_list):
-                if self.can_apply_cutmesh_for_pass(i, cut_mesh, cut_pass, generator_mesh_list):
-                    print('Applying cut mesh %d of %d...' % (i + 1, len(generator_mesh_list)))
-                    new_mesh_list = []
-                    for mesh in final_mesh_list:
-                        if not self.can_apply_cutmesh_to_mesh(i, cut_mesh, cut_pass, mesh):
-                            new_mesh_list.append(mesh)
-                        else:
-                            back_mesh, front_mesh = mesh.split_against_mesh(cut_mesh)
-                            if len(back_mesh.triangle_list) > 0:
-                                new_mesh_list.append(ColoredMesh(mesh=back_mesh, color=mesh.color))
-                            if len(front_mesh.triangle_list) > 0:
-                                new_mesh_list.append(ColoredMesh(mesh=front_mesh, color=mesh.color))
-                    final_mesh_list = new_mesh_list
-                    # This is an optimization in terms of both time and memory.  Note that it is not needed for correctness.
-                    for mesh in final_mesh_list:
-                        mesh.reduce()
-
-            # Cull meshes with area below a certain threshold to eliminate some artifacting.
+            self.cut_pass_stats_list = []
+            cut_schedule = self.cut_schedule(generator_mesh_list)
+            if cut_schedule is not None:
+                final_mesh_list = self.execute_cut_schedule(cut_schedule, final_mesh_list, generator_mesh_list)
+                return final_mesh_list, initial_mesh_list, generator_mesh_list
+
+            cut_pass = 0
+            while True:
+                print('Performing cut pass %d...' % cut_pass)
+                start_time = time.perf_counter()
+                split_count = 0
+                self.emit_event('pass_start', cut_pass=cut_pass, mesh_count=len(final_mesh_list))
+
+                with span('cut pass', cut_pass=cut_pass):
+                    # Cut all the meshes against all the generator meshes.
+                    for i, cut_mesh in enumerate(generator_mesh_list):
+                        if self.can_apply_cutmesh_for_pass(i, cut_mesh, cut_pass, generator_mesh_list):
+                            print('Applying cut mesh %d of %d...' % (i + 1, len(generator_mesh_list)))
+                            self.emit_event('generator_start', cut_pass=cut_pass, cut_mesh=i, cut_mesh_count=len(generator_mesh_list), mesh_count=len(final_mesh_list))
+                            with span('cut mesh', cut_mesh=i):
+                                new_mesh_list = []
+                                for mesh in final_mesh_list:
+                                    if not self.can_apply_cutmesh_to_mesh(i, cut_mesh, cut_pass, mesh):
+                                        new_mesh_list.append(mesh)
+                                    else:
+                                        with span('split'):
+                                            back_mesh, front_mesh = cut_mesh.split_mesh(mesh)
+                                            count('split_calls')
+                                            count('triangles_in', len(mesh.triangle_list))
+                                            count('triangles_out', len(back_mesh.triangle_list) + len(front_mesh.triangle_list))
+                                        split_count += 1
+                                        if len(back_mesh.triangle_list) == 0 or len(front_mesh.triangle_list) == 0:
+                                            # The mesh lies wholly to one side of the cut, so we keep it, and all we know about it, as it is.
+                                            new_mesh_list.append(mesh)
+                                        else:
+                                            new_mesh_list.append(ColoredMesh(mesh=back_mesh, color=mesh.color))
+                                            new_mesh_list.append(ColoredMesh(mesh=front_mesh, color=mesh.color))
+                                final_mesh_list = new_mesh_list
+                                # This is an optimization in terms of both time and memory.  Note that it is not needed for correctness.
+                                with span('reduce'):
+                                    for mesh in final_mesh_list:
+                                        if mesh.needs_reduce:
+                                            mesh.reduce()
+                                            mesh.needs_reduce = False
+                                            count('meshes_reduced')
+                            if self.event_stream is not None:
+                                self.event_stream.end_step()
+                                self.emit_event('generator_end', cut_pass=cut_pass, cut_mesh=i, cut_mesh_count=len(generator_mesh_list), mesh_count=len(final_mesh_list),
+                                                triangle_count=sum([len(mesh.triangle_list) for mesh in final_mesh_list]))
+
+                    self.cull_meshes(final_mesh_list)
+
+                self.cut_pass_stats_list.append({
+                    'cut_pass': cut_pass,
+                    'seconds': time.perf_counter() - start_time,
+                    'split_count': split_count,
+                    'mesh_count': len(final_mesh_list),
+                    'triangle_count': sum([len(mesh.triangle_list) for mesh in final_mesh_list])
+                })
+                self.emit_event('pass_end', **self.cut_pass_stats_list[-1])
+                
+                # Give the class a chance to transform the meshes for another round of cutting.
+                # Before iteration completes, however, the class needs to make sure all meshes properly placed.
+                with span('transform_meshes_for_more_cutting', cut_pass=cut_pass):
+                    if not self.transform_meshes_for_more_cutting(final_mesh_list, generator_mesh_list, cut_pass):
+                        break
+                
+                cut_pass += 1
+
+        return final_mesh_list, initial_mesh_list, generator_mesh_list
+    
+    def cull_meshes(self, mesh_list, state_list=None):
+        # Cull meshes with area below a certain threshold to eliminate some artifacting.
+        # If given, the list of per-mesh state is culled right along with the meshes.
+        with span('cull'):
             i = 0
-            while i < len(final_mesh_list):
-                mesh = final_mesh_list[i]
-                area = mesh.area()
+            while i < len(mesh_list):
+                mesh = mesh_list[i]
+                area = mesh.calc_cached_area()
                 if area < self.min_mesh_area():
-                    del final_mesh_list[i]
+                    del mesh_list[i]
+                    if state_list is not None:
+                        del state_list[i]
+                    count('meshes_culled')
                 else:
                     i += 1
-            
-            # Give the class a chance to transform the meshes for another round of cutting.
-            # Before iteration completes, however, the class needs to make sure all meshes properly placed.
-            if not self.transform_meshes_for_more_cutting(final_mesh_list, generator_mesh_list, cut_pass):
-                break
-            
-            cut_pass += 1
 
-        return final_mesh_list, initial_mesh_list, generator_mesh_list
-    
+    def cut_schedule(self, generator_mesh_list):
+        # Puzzles can return a list of Cut and Apply steps here instead of overriding transform_meshes_for_more_cutting
+        # and can_apply_cutmesh_for_pass.  Each Cut step counts as a cut pass in calls to can_apply_cutmesh_to_mesh.
+        return None
+
+    def execute_cut_schedule(self, cut_schedule, mesh_list, generator_mesh_list):
+        symmetric_set = find_symmetric_generators(generator_mesh_list, self.cutter_bounds)
+        cut_schedule = simplify_cut_schedule(cut_schedule, generator_mesh_list, symmetric_set)
+        # Generators that decide capture or turning in their own way have to be applied one at a time, the old way.
+        fuse_applications = all([
+            type(generator_mesh).captures_mesh is GeneratorMesh.captures_mesh and type(generator_mesh).transform_mesh is GeneratorMesh.transform_mesh
+            for generator_mesh in generator_mesh_list])
+
+        # For each piece, we keep the set of generators it has been cut against and hasn't moved relative to since.
+        clean_list = [frozenset() for mesh in mesh_list]
+        pool = None
+        if self.cut_worker_count is not None and self.cut_worker_count > 1:
+            pool = multiprocessing.Pool(self.cut_worker_count, initializer=init_split_worker, initargs=(generator_mesh_list,))
+
+        try:
+            cut_pass = 0
+            apply_list = []
+            for step in cut_schedule + [None]:
+                if isinstance(step, Apply):
+                    apply_list.append(step)
+                    continue
+
+                if len(apply_list) > 0:
+                    with span('transform_meshes_for_more_cutting', cut_pass=cut_pass - 1):
+                        if fuse_applications:
+                            count('meshes_transformed', apply_generator_run(mesh_list, clean_list, generator_mesh_list, apply_list, symmetric_set))
+                        else:
+                            for apply_step in apply_list:
+                                for n in range(apply_step.count):
+                                    self.apply_generator(mesh_list, generator_mesh_list[apply_step.generator], apply_step.inverse)
+                            clean_list = [frozenset() for mesh in mesh_list]
+                    apply_list = []
+
+                if step is None:
+                    break
+
+                print('Performing cut pass %d...' % cut_pass)
+                start_time = time.perf_counter()
+                split_count = 0
+                self.emit_event('pass_start', cut_pass=cut_pass, mesh_count=len(mesh_list))
+
+                with span('cut pass', cut_pass=cut_pass):
+                    # As in an unscheduled pass, all the pieces are cut against one generator before the next, but
+                    # the pieces can be cut in parallel.  Pieces that the puzzle doesn't want cut are passed over.
+                    for i in step.generator_list:
+                        cut_mesh = generator_mesh_list[i]
+                        print('Applying cut mesh %d of %d...' % (i + 1, len(generator_mesh_list)))
+                        self.emit_event('generator_start', cut_pass=cut_pass, cut_mesh=i, cut_mesh_count=len(generator_mesh_list), mesh_count=len(mesh_list))
+                        with span('cut mesh', cut_mesh=i):
+                            split_list = [self.can_apply_cutmesh_to_mesh(i, cut_mesh, cut_pass, mesh) for mesh in mesh_list]
+                            task_list = [(mesh, clean_set, [i]) for mesh, clean_set, split in zip(mesh_list, clean_list, split_list) if split]
+                            if pool is not None:
+                                result_iter = pool.imap(split_mesh_in_worker, task_list, chunksize=max(1, len(task_list) // (self.cut_worker_count * 8)))
+                            else:
+                                result_iter = (split_mesh(*task, generator_mesh_list=generator_mesh_list) for task in task_list)
+                            new_mesh_list = []
+                            new_clean_list = []
+                            for mesh, clean_set, split in zip(mesh_list, clean_list, split_list):
+                                if not split:
+                                    new_mesh_list.append(mesh)
+                                    new_clean_list.append(clean_set)
+                                    continue
+                                fragment_list, mesh_split_count, skip_count = next(result_iter)
+                                split_count += mesh_split_count
+                                count('split_calls', mesh_split_count)
+                                count('splits_skipped', skip_count)
+                                count('triangles_in', len(mesh.triangle_list))
+                                for fragment, fragment_clean_set in fragment_list:
+                                    count('triangles_out', len(fragment.triangle_list))
+                                    new_mesh_list.append(fragment)
+                                    new_clean_list.append(fragment_clean_set)
+                            mesh_list = new_mesh_list
+                            clean_list = new_clean_list
+                        if self.event_stream is not None:
+                            self.event_stream.end_step()
+                            self.emit_event('generator_end', cut_pass=cut_pass, cut_mesh=i, cut_mesh_count=len(generator_mesh_list), mesh_count=len(mesh_list),
+                                            triangle_count=sum([len(mesh.triangle_list) for mesh in mesh_list]))
+
+                    self.cull_meshes(mesh_list, clean_list)
+
+                self.cut_pass_stats_list.append({
+                    'cut_pass': cut_pass,
+                    'seconds': time.perf_counter() - start_time,
+                    'split_count': split_count,
+                    'mesh_count': len(mesh_list),
+                    'triangle_count': sum([len(mesh.triangle_list) for mesh in mesh_list])
+                })
+                self.emit_event('pass_end', **self.cut_pass_stats_list[-1])
+                cut_pass += 1
+        finally:
+            if pool is not None:
+                pool.close()
+                pool.join()
+
+        return mesh_list
+
     def transform_meshes_for_more_cutting(self, mesh_list, generator_mesh_list, cut_pass):
         return False
     
     def apply_generator(self, mesh_list, generator_mesh, inverse=False):
-        for i, mesh in enumerate(mesh_list):
-            if generator_mesh.captures_mesh(mesh):
-                mesh_list[i] = generator_mesh.transform_mesh(mesh, inverse)
+        with span('apply_generator', inverse=inverse):
+            for i, mesh in enumerate(mesh_list):
+                if generator_mesh.captures_mesh(mesh):
+                    mesh_list[i] = generator_mesh.transform_mesh(mesh, inverse)
+                    count('meshes_transformed')
     
     def generate_puzzle_file(self):
-        with ProfileBlock('Generate meshes'):
-            final_mesh_list, initial_mesh_list, generator_mesh_list = self.generate_final_mesh_list()
-            alphabet = 'abcdefghijklmnopqrstuvwxyz'
-            i = 0
-            j = 1
-            for mesh in generator_mesh_list:
-                mesh.fixed_label = alphabet[i] * j
-                i += 1
-                if i >= len(alphabet):
-                    i = 0
-                    j += 1
+        with span(self.__class__.__name__):
+            if self.event_stream is not None:
+                self.event_stream.begin_puzzle(self.__class__.__name__)
+
+            with ProfileBlock('Generate meshes'):
+                final_mesh_list, initial_mesh_list, generator_mesh_list = self.generate_final_mesh_list()
+                alphabet = 'abcdefghijklmnopqrstuvwxyz'
+                i = 0
+                j = 1
+                for mesh in generator_mesh_list:
+                    mesh.fixed_label = alphabet[i] * j
+                    i += 1
+                    if i >= len(alphabet):
+                        i = 0
+                        j += 1
+
+            if self.merge_coplanar_triangles():
+                with ProfileBlock('Retriangulate coplanar faces'):
+                    triangle_count = sum([len(mesh.triangle_list) for mesh in final_mesh_list])
+                    removed_count = sum([retriangulate_coplanar_regions(mesh) for mesh in final_mesh_list])
+                    print('Removed %d of %d triangles.' % (removed_count, triangle_count))
+
+            # Pieces are captured by generators according to their centers, so every level of detail must share
+            # the same centers, or moves would behave differently depending on which level happens to be loaded.
+            center_list = [mesh.calc_center() for mesh in final_mesh_list]
+
+            decimation_report_list = []
+
+            # Each level of detail is made from its own copy of the pieces, coarsest first.
+            lod_mesh_list_list = []
+            for lod, tolerance in enumerate(sorted(self.lod_tolerance_list, reverse=True)):
+                lod_mesh_list = [mesh.clone() for mesh in final_mesh_list]
+                with ProfileBlock('Decimate meshes for LOD %d' % lod):
+                    decimation_report_list.append(decimate_mesh_list(lod_mesh_list, tolerance, self.simplify_outlines))
+                lod_mesh_list_list.append(lod_mesh_list)
+
+            if self.decimation_tolerance is not None:
+                with ProfileBlock('Decimate meshes'):
+                    decimation_report_list.append(decimate_mesh_list(final_mesh_list, self.decimation_tolerance, self.simplify_outlines))
+
+            puzzle_path = self.write_puzzle_file(final_mesh_list, center_list, generator_mesh_list, 'puzzles/' + self.__class__.__name__ + '.json.gz')
+
+            # Levels of detail are written after the full-detail puzzle, so that they can be measured against it.  Any
+            # level that isn't kept, this time or since an earlier run, is removed, so that the server doesn't serve it.
+            lod = 0
+            while True:
+                lod_path = 'puzzles/' + self.__class__.__name__ + '.lod%d.json.gz' % lod
+                if lod < len(lod_mesh_list_list):
+                    self.write_puzzle_file(lod_mesh_list_list[lod], center_list, generator_mesh_list, lod_path, lod=lod)
+                    size_fraction = os.path.getsize(lod_path) / float(os.path.getsize(puzzle_path))
+                    decimation_report_list[lod]['size_fraction'] = size_fraction
+                    # The page only ever starts from the coarsest level, so a finer one is no use without it.
+                    decimation_report_list[lod]['kept'] = size_fraction <= self.lod_max_size_fraction and (lod == 0 or decimation_report_list[lod - 1]['kept'])
+                    if decimation_report_list[lod]['kept']:
+                        print('Kept LOD %d at %.0f%% of the full-detail file.' % (lod, size_fraction * 100.0))
+                    else:
+                        print('Dropped LOD %d, which came to %.0f%% of the full-detail file.' % (lod, size_fraction * 100.0))
+                        os.remove(lod_path)
+                elif os.path.exists(lod_path):
+                    os.remove(lod_path)
+                else:
+                    break
+                lod += 1
+
+            if len(decimation_report_list) > 0:
+                for report in decimation_report_list:
+                    print('Decimated %d triangles down to %d with a max deviation of %f.' % (report['triangles_before'], report['triangles_after'], report['max_deviation']))
+                os.makedirs('reports', exist_ok=True)
+                with open('reports/' + self.__class__.__name__ + '.decimation.json', 'w') as handle:
+                    handle.write(json.dumps(decimation_report_list, indent=4, separators=(',', ': '), sort_keys=True))
+
+            if self.event_stream is not None:
+                self.event_stream.end_puzzle(puzzle_path=puzzle_path, mesh_count=len(final_mesh_list),
+                                             triangle_count=sum([len(mesh.triangle_list) for mesh in final_mesh_list]))
 
+            return puzzle_path
+
+    def write_puzzle_file(self, final_mesh_list, center_list, generator_mesh_list, puzzle_path, lod=None):
         with ProfileBlock('Calculate UVs'):
             self.calculate_uvs(final_mesh_list)
         
@@ -286,17 +619,48 @@ class PuzzleDefinitionBase(object):
             self.calculate_normals(final_mesh_list)
         
         with ProfileBlock('Calculate border loops'):
-            for mesh in final_mesh_list:
-                mesh.calc_border_loop_list()
+            border_report = {
+                'mesh_count': len(final_mesh_list),
+                'welded_mesh_count': 0,
+                'open_mesh_list': []
+            }
+            for i, mesh in enumerate(final_mesh_list):
+                weld_count, open_count = mesh.calc_border_loop_list()
+                if weld_count > 0:
+                    border_report['welded_mesh_count'] += 1
+                if open_count > 0:
+                    border_report['open_mesh_list'].append(i)
+            print('Welded vertices in %d of %d meshes.' % (border_report['welded_mesh_count'], border_report['mesh_count']))
+            if len(border_report['open_mesh_list']) > 0:
+                print('WARNING: Meshes with open borders: ' + ', '.join([str(i) for i in border_report['open_mesh_list']]))
+            os.makedirs('reports', exist_ok=True)
+            with open('reports/' + os.path.basename(puzzle_path).replace('.json.gz', '.borders.json'), 'w') as handle:
+                handle.write(json.dumps(border_report, indent=4, separators=(',', ': '), sort_keys=True))
         
         with ProfileBlock('Make puzzle file'):
             puzzle_data = {
-                'mesh_list': [{**mesh.to_dict(), 'center': mesh.calc_center().to_dict()} for mesh in final_mesh_list],
+                'mesh_list': [{**mesh.to_dict(), 'center': center.to_dict()} for mesh, center in zip(final_mesh_list, center_list)],
                 'generator_mesh_list': [{**mesh.to_dict(), 'plane_list': mesh.make_plane_list()} for mesh in generator_mesh_list],
                 'bandages': self.bandages()
             }
+            for generator_mesh, generator_data in zip(generator_mesh_list, puzzle_data['generator_mesh_list']):
+                if generator_mesh.surface is not None:
+                    # We cut against the exact surface, not the planes, so the page must test sides against it too.
+                    generator_data['surface'] = generator_mesh.surface.to_dict()
             self.annotate_puzzle_data(puzzle_data)
-            puzzle_path = 'puzzles/' + self.__class__.__name__ + '.json.gz'
+            if self.packed_buffers or self.quantization_bits is not None:
+                # Each piece keeps its other data, but refers to its ranges of the packed buffers for geometry.
+                puzzle_data['packed_buffers'], range_list = make_packed_buffers(final_mesh_list, self.quantization_bits)
+                for mesh_data, mesh_range in zip(puzzle_data['mesh_list'], range_list):
+                    for key in ['vertex_list', 'triangle_list', 'uv_list', 'normal_list', 'border_loop_list']:
+                        del mesh_data[key]
+                    mesh_data.update(mesh_range)
+            if lod is not None:
+                # The page only needs the capture data of each generator, not its cutting surface.
+                puzzle_data['lod'] = lod
+                for generator_data in puzzle_data['generator_mesh_list']:
+                    del generator_data['vertex_list']
+                    del generator_data['triangle_list']
             with gzip.open(puzzle_path, 'wb') as handle:
                 json_text = json.dumps(puzzle_data, indent=4, separators=(',', ': '), sort_keys=True)
                 json_bytes = json_text.encode('utf-8')
@@ -418,7 +782,7 @@ class PuzzleDefinitionBase(object):
         
         return [l_mesh, r_mesh, d_mesh, u_mesh, b_mesh, f_mesh]
     
-    def make_face_meshes(self, mesh):
+    def make_face_meshes(self, mesh, plane_quantum=1e-3):
         face_mesh_list = []
         plane_list = []
         color_list = [
@@ -436,38 +800,49 @@ class PuzzleDefinitionBase(object):
             Vector(0.5, 0.0, 1.0),
             Vector(0.5, 0.5, 0.5)
         ]
-        j = 0
         
-        while len(mesh.triangle_list) > 0:
-            triple = mesh.triangle_list.pop(0)
-            
+        # Rather than test every triangle against every face found so far, we bucket faces by a quantized key of
+        # their plane, and test each triangle against only those faces in neighboring buckets.  We also look near
+        # the opposite key, because a triangle lies in a plane regardless of which way it faces.  Faces are made
+        # in the order of their first triangle, and when several faces would take a triangle, the earliest wins.
+        def make_plane_key(plane):
+            normal = plane.unit_normal
+            return tuple([int(round(value / plane_quantum)) for value in [normal.x, normal.y, normal.z, plane.center.dot(normal)]])
+
+        face_list = []
+        bucket_map = {}
+        for triple in mesh.triangle_list:
             triangle = mesh.make_triangle(triple)
-            triangle_list = [triangle]
-            
             plane = triangle.calc_plane()
-            plane_list.append(plane)
-            
-            i = 0
-            while i < len(mesh.triangle_list):
-                triangle = mesh.make_triangle(i)
-                if all([plane.side(triangle[i]) == Side.NEITHER for i in range(3)]):
-                    triangle_list.append(triangle)
-                    del mesh.triangle_list[i]
-                else:
-                    i += 1
-            
+            key = make_plane_key(plane)
+            face = None
+            for sign in [1, -1]:
+                for neighbor_key in itertools.product(*[(sign * k - 1, sign * k, sign * k + 1) for k in key]):
+                    for candidate in bucket_map.get(neighbor_key, []):
+                        if face is not None and candidate[0] > face[0]:
+                            continue
+                        if all([candidate[1].side(triangle[i]) == Side.NEITHER for i in range(3)]):
+                            face = candidate
+            if face is None:
+                face = (len(face_list), plane, [])
+                face_list.append(face)
+                bucket_map.setdefault(key, []).append(face)
+            face[2].append(triangle)
+
+        color_random = random.Random(0)
+        for j, face in enumerate(face_list):
             if j < len(color_list):
                 color = color_list[j]
-                j += 1
             else:
-                color = Vector().random()
+                color = Vector(color_random.random(), color_random.random(), color_random.random())
             
-            face_mesh = ColoredMesh(color=color, mesh=TriangleMesh().from_triangle_list(triangle_list))
+            face_mesh = ColoredMesh(color=color, mesh=TriangleMesh().from_triangle_list(face[2]))
             face_mesh_list.append(face_mesh)
+            plane_list.append(face[1])
             
         return face_mesh_list, plane_list
 
-def main():
+def make_puzzle_class_list():
     from puzzle_definitions import RubiksCube, FisherCube, FusedCube, CurvyCopter
     from puzzle_definitions import CurvyCopterPlus, HelicopterCube, FlowerCopter
     from puzzle_definitions import Megaminx, DinoCube, FlowerRexCube, Skewb
@@ -479,7 +854,7 @@ def main():
     from puzzle_definitions import MultiCube, SuperStar, DreidelCube, EitansStar
     from puzzle_definitions import Cubic4x6x8
 
-    puzzle_class_list = [
+    return [
         RubiksCube, FisherCube, FusedCube, CurvyCopter,
         CurvyCopterPlus, HelicopterCube, FlowerCopter,
         Megaminx, DinoCube, FlowerRexCube, Skewb,
@@ -492,16 +867,70 @@ def main():
         Cubic4x6x8
     ]
 
+def main():
+    puzzle_class_list = make_puzzle_class_list()
+
     arg_parser = argparse.ArgumentParser()
     arg_parser.add_argument('--puzzle', help='Specify which puzzle to generate.  If not given, all are generated.', type=str)
+    arg_parser.add_argument('--max-chord-error', help='Tessellate curved cutters adaptively to within this error, overriding any per-puzzle budget.', type=float)
+    arg_parser.add_argument('--implicit-cutters', help='Cut against the exact planes, spheres and cylinders that cutters approximate.', action='store_true')
+    arg_parser.add_argument('--decimate', help='Decimate the pieces to within this tolerance before writing them out.', type=float)
+    arg_parser.add_argument('--simplify-outlines', help='Let decimation simplify sticker outlines too, moving the boundaries between pieces.', action='store_true')
+    arg_parser.add_argument('--lod', help='Write out a decimated level of detail for each of these tolerances, where it comes out small enough to be worth loading first.', type=float, nargs='*')
+    arg_parser.add_argument('--packed-buffers', help='Write out one vertex buffer and one index buffer for the whole puzzle.', action='store_true')
+    arg_parser.add_argument('--quantize', help='Pack the buffers, quantizing position, normal and UV components to these bit depths.', type=int, nargs=3)
+    arg_parser.add_argument('--events', help='Write progress events in the given format.', type=str, choices=['jsonl'])
+    arg_parser.add_argument('--events-file', help='Write progress events to this file instead of stdout.', type=str)
+    arg_parser.add_argument('--workers', help='Cut the pieces of puzzles that have a cut schedule in this many processes.', type=int)
+    arg_parser.add_argument('--archive', help='Pack every puzzle file into one archive for serving when done.', action='store_true')
+    arg_parser.add_argument('--events-history', help='Estimate remaining time from, and record timings to, this file.', type=str, default='reports/generation_history.json')
     args = arg_parser.parse_args()
 
+    event_stream = None
+    stdout = sys.stdout
+    if args.events is not None:
+        if args.events_file is not None:
+            event_stream = EventStream(open(args.events_file, 'w'), args.events_history, owns_handle=True)
+        else:
+            # Keep stdout clean for the events by sending everything else to stderr.
+            event_stream = EventStream(sys.stdout, args.events_history)
+            sys.stdout = sys.stderr
+
+    try:
+        generate_puzzles(puzzle_class_list, args, event_stream)
+    finally:
+        sys.stdout = stdout
+        if event_stream is not None:
+            event_stream.close()
+
+def generate_puzzles(puzzle_class_list, args, event_stream):
     for puzzle_class in puzzle_class_list:
         if args.puzzle is not None and args.puzzle != puzzle_class.__name__:
             continue
         print('Generating: %s' % puzzle_class.__name__)
         puzzle = puzzle_class()
+        if args.max_chord_error is not None:
+            puzzle.max_chord_error = args.max_chord_error
+        if args.implicit_cutters:
+            puzzle.implicit_cutters = True
+        if args.decimate is not None:
+            puzzle.decimation_tolerance = args.decimate
+        if args.lod is not None:
+            puzzle.lod_tolerance_list = args.lod
+        if args.simplify_outlines:
+            puzzle.simplify_outlines = True
+        if args.packed_buffers:
+            puzzle.packed_buffers = True
+        if args.quantize is not None:
+            puzzle.quantization_bits = args.quantize
+        if args.workers is not None:
+            puzzle.cut_worker_count = args.workers
+        puzzle.event_stream = event_stream
         puzzle.generate_puzzle_file()
+
+    if args.archive:
+        entry_map = build_archive()
+        print('Packed %d puzzle files into %s.' % (len(entry_map), ARCHIVE_PATH))
     
     print('Process complete!')
 
@@ -0,0 +1,45 @@
+# puzzle_geometry.py
+
+# Small geometric helpers shared by the mesh-processing stages.  They work on anything with x, y and z, and the usual
+# vector arithmetic where it's needed, so that they don't tie their callers to any one vector type.
+
+def edge_key(i, j):
+    # The same key for an edge whichever way round it's given.
+    return (i, j) if i < j else (j, i)
+
+def quantize(vertex, quantum):
+    # Vertices closer than about the given quantum get the same key, so that they can be matched up by hashing.
+    return (int(round(vertex.x / quantum)), int(round(vertex.y / quantum)), int(round(vertex.z / quantum)))
+
+def calc_closest_point_on_triangle(p, a, b, c):
+    # This is the region-by-region method from Ericson's Real-Time Collision Detection.
+    ab = b - a
+    ac = c - a
+    ap = p - a
+    d1 = ab.dot(ap)
+    d2 = ac.dot(ap)
+    if d1 <= 0.0 and d2 <= 0.0:
+        return a
+    bp = p - b
+    d3 = ab.dot(bp)
+    d4 = ac.dot(bp)
+    if d3 >= 0.0 and d4 <= d3:
+        return b
+    vc = d1 * d4 - d3 * d2
+    if vc <= 0.0 and d1 >= 0.0 and d3 <= 0.0:
+        return a + ab * (d1 / (d1 - d3))
+    cp = p - c
+    d5 = ab.dot(cp)
+    d6 = ac.dot(cp)
+    if d6 >= 0.0 and d5 <= d6:
+        return c
+    vb = d5 * d2 - d1 * d6
+    if vb <= 0.0 and d2 >= 0.0 and d6 <= 0.0:
+        return a + ac * (d2 / (d2 - d6))
+    va = d3 * d6 - d5 * d4
+    if va <= 0.0 and (d4 - d3) >= 0.0 and (d5 - d6) >= 0.0:
+        return b + (c - b) * ((d4 - d3) / ((d4 - d3) + (d5 - d6)))
+    denominator = va + vb + vc
+    if denominator == 0.0:
+        return a
+    return a + ab * (vb / denominator) + ac * (vc / denominator)
@@ -0,0 +1,418 @@
+# puzzle_implicit.py
+
+import math
+import random
+
+from math3d_triangle_mesh import TriangleMesh
+from math3d_vector import Vector
+from puzzle_tessellation import refine_triangles
+from puzzle_border import find_border_loops
+from puzzle_geometry import calc_closest_point_on_triangle
+
+# A cutting surface given implicitly as the zero set of a function that is negative on the back side of the surface
+# and positive on the front.  Each surface here is the signed distance to a sphere, plane or infinite cylinder, so
+# its unsigned form is convex, and a piece of a triangle can only be on the inside if a vertex is, or if the closest
+# point of the triangle to the surface's core is.  Where a tessellated cutter makes us split against hundreds of
+# triangles, and leaves seams wherever its facets meet, an implicit cutter is evaluated once per vertex, and edges
+# are cut exactly where they cross the true surface.
+
+class ImplicitSurface(object):
+    def __init__(self, sign=1.0):
+        # The sign is flipped for meshes wound inside-out, so that the back side is the same as the mesh's.
+        self.sign = sign
+
+    def evaluate(self, point):
+        return self.sign * self.calc_distance(point)
+
+    def calc_gradient(self, point):
+        return self.calc_distance_gradient(point) * self.sign
+
+    def calc_distance(self, point):
+        raise Exception('Please override this method.')
+
+    def calc_distance_gradient(self, point):
+        raise Exception('Please override this method.')
+
+    def calc_min_distance_on_triangle(self, a, b, c):
+        raise Exception('Please override this method.')
+
+    def to_dict(self):
+        # This goes in the puzzle file beside the generator's planes, so that the page can tell which side of the
+        # surface a point is on just as we did when cutting.
+        raise Exception('Please override this method.')
+
+    def calc_crossing(self, a, b):
+        # Return the parameter along the segment from a to b at which it crosses the surface, given that it does.
+        # This falls back on bisection for surfaces without a closed form.
+        distance_a = self.calc_distance(a)
+        t_min, t_max = 0.0, 1.0
+        for i in range(60):
+            t = (t_min + t_max) / 2.0
+            if (self.calc_distance(a + (b - a) * t) < 0.0) == (distance_a < 0.0):
+                t_min = t
+            else:
+                t_max = t
+        return (t_min + t_max) / 2.0
+
+    def is_invariant(self, transform, probe_list):
+        # Rigid motions preserve distances, so a motion maps the surface to itself just when it leaves the distance
+        # to the surface unchanged, which we check at a handful of points in general position.
+        return all([math.fabs(self.calc_distance(transform(point)) - self.calc_distance(point)) < 1e-6 for point in probe_list])
+
+class PlaneSurface(ImplicitSurface):
+    def __init__(self, center, unit_normal, sign=1.0):
+        super().__init__(sign)
+        self.center = center
+        self.unit_normal = unit_normal
+
+    def calc_distance(self, point):
+        return (point - self.center).dot(self.unit_normal)
+
+    def calc_distance_gradient(self, point):
+        return self.unit_normal.clone()
+
+    def to_dict(self):
+        return {'type': 'plane', 'sign': self.sign, 'center': self.center.to_dict(), 'unit_normal': self.unit_normal.to_dict()}
+
+    def calc_min_distance_on_triangle(self, a, b, c):
+        return min([self.calc_distance(point) for point in [a, b, c]])
+
+    def calc_crossing(self, a, b):
+        distance_a = self.calc_distance(a)
+        distance_b = self.calc_distance(b)
+        return distance_a / (distance_a - distance_b)
+
+class SphereSurface(ImplicitSurface):
+    def __init__(self, center, radius, sign=1.0):
+        super().__init__(sign)
+        self.center = center
+        self.radius = radius
+
+    def calc_distance(self, point):
+        return (point - self.center).length() - self.radius
+
+    def calc_distance_gradient(self, point):
+        vector = point - self.center
+        length = vector.length()
+        return vector / length if length > 0.0 else Vector(0.0, 0.0, 0.0)
+
+    def to_dict(self):
+        return {'type': 'sphere', 'sign': self.sign, 'center': self.center.to_dict(), 'radius': self.radius}
+
+    def calc_min_distance_on_triangle(self, a, b, c):
+        return (calc_closest_point_on_triangle(self.center, a, b, c) - self.center).length() - self.radius
+
+    def calc_crossing(self, a, b):
+        direction = b - a
+        offset = a - self.center
+        return _solve_quadratic_in_unit_interval(direction.dot(direction), 2.0 * offset.dot(direction), offset.dot(offset) - self.radius * self.radius)
+
+class CylinderSurface(ImplicitSurface):
+    def __init__(self, center, unit_axis, radius, sign=1.0):
+        super().__init__(sign)
+        self.center = center
+        self.unit_axis = unit_axis
+        self.radius = radius
+
+    def calc_radial_vector(self, point):
+        vector = point - self.center
+        return vector - self.unit_axis * vector.dot(self.unit_axis)
+
+    def calc_distance(self, point):
+        return self.calc_radial_vector(point).length() - self.radius
+
+    def calc_distance_gradient(self, point):
+        vector = self.calc_radial_vector(point)
+        length = vector.length()
+        return vector / length if length > 0.0 else Vector(0.0, 0.0, 0.0)
+
+    def to_dict(self):
+        return {'type': 'cylinder', 'sign': self.sign, 'center': self.center.to_dict(), 'unit_axis': self.unit_axis.to_dict(), 'radius': self.radius}
+
+    def calc_min_distance_on_triangle(self, a, b, c):
+        # The axis either passes through the triangle, or comes closest to it along one of its edges.
+        if _line_hits_triangle(self.center, self.unit_axis, a, b, c):
+            return -self.radius
+        return min([_calc_line_segment_distance(self.center, self.unit_axis, p, q) for p, q in [(a, b), (b, c), (c, a)]]) - self.radius
+
+    def calc_crossing(self, a, b):
+        direction = self.calc_radial_vector(b) - self.calc_radial_vector(a)
+        offset = self.calc_radial_vector(a)
+        return _solve_quadratic_in_unit_interval(direction.dot(direction), 2.0 * offset.dot(direction), offset.dot(offset) - self.radius * self.radius)
+
+def split_mesh_by_surface(mesh, surface, max_chord_error, eps=1e-7, max_level=6):
+    # Split the given mesh against the given surface, returning its back and front parts.  Triangles that the surface
+    # passes through are first refined, conformingly, until a straight cut across each deviates from the surface by
+    # no more than the given chord error.  Each edge that crosses the surface gets one new vertex, shared by the
+    # triangles on either side of it, so the parts come out without cracks.
+    vertex_list = list(mesh.vertex_list)
+    triangle_list = [tuple(triangle) for triangle in mesh.triangle_list]
+    value_list = [surface.evaluate(vertex) for vertex in vertex_list]
+
+    # The inside of each surface is convex, so a mesh whose vertices are all inside is wholly inside.
+    if surface.sign > 0.0 and all([value < -eps for value in value_list]):
+        return mesh, TriangleMesh()
+    if surface.sign < 0.0 and all([value > eps for value in value_list]):
+        return TriangleMesh(), mesh
+
+    def should_refine(triangle):
+        a, b, c = [vertex_list[i] for i in triangle]
+        if max([(a - b).length(), (b - c).length(), (c - a).length()]) < max_chord_error:
+            return False
+        value_a, value_b, value_c = [value_list[i] for i in triangle]
+        if min(value_a, value_b, value_c) < -eps and max(value_a, value_b, value_c) > eps:
+            # The surface crosses two edges, and we cut straight between the crossings, so we look at how far the
+            # surface strays from the middle of that cut.  Distance is measured within the plane of the triangle.
+            crossing_list = []
+            for p, q, value_p, value_q in [(a, b, value_a, value_b), (b, c, value_b, value_c), (c, a, value_c, value_a)]:
+                if (value_p < -eps and value_q > eps) or (value_p > eps and value_q < -eps):
+                    crossing_list.append(p + (q - p) * surface.calc_crossing(p, q))
+            if len(crossing_list) != 2:
+                return True
+            middle = (crossing_list[0] + crossing_list[1]) / 2.0
+            normal = (b - a).cross(c - a)
+            if normal.length() == 0.0:
+                return False
+            normal = normal.normalized()
+            gradient = surface.calc_gradient(middle)
+            gradient = gradient - normal * gradient.dot(normal)
+            return math.fabs(surface.evaluate(middle)) > max_chord_error * gradient.length()
+        # The surface can also dip into a triangle, or cross one edge twice, without separating any of its vertices.
+        if surface.sign > 0.0 and min(value_a, value_b, value_c) > eps:
+            return surface.calc_min_distance_on_triangle(a, b, c) < -eps
+        if surface.sign < 0.0 and max(value_a, value_b, value_c) < -eps:
+            return surface.calc_min_distance_on_triangle(a, b, c) < -eps
+        return False
+
+    for level in range(max_level):
+        triangle_list, refined_count = refine_triangles(vertex_list, triangle_list, should_refine, lambda point: point)
+        value_list += [surface.evaluate(vertex) for vertex in vertex_list[len(value_list):]]
+        if refined_count == 0:
+            break
+
+    side_list = [0 if math.fabs(value) <= eps else (-1 if value < 0.0 else 1) for value in value_list]
+    crossing_map = {}
+
+    def find_crossing(i, j):
+        key = (i, j) if i < j else (j, i)
+        k = crossing_map.get(key)
+        if k is None:
+            p, q = vertex_list[key[0]], vertex_list[key[1]]
+            k = len(vertex_list)
+            vertex_list.append(p + (q - p) * surface.calc_crossing(p, q))
+            crossing_map[key] = k
+        return k
+
+    back_triangle_list = []
+    front_triangle_list = []
+    for triangle in triangle_list:
+        side_set = set([side_list[i] for i in triangle])
+        if 1 not in side_set and -1 not in side_set:
+            # The triangle lies in the surface, so the piece it bounds is on the side its back faces.
+            a, b, c = [vertex_list[i] for i in triangle]
+            normal = (b - a).cross(c - a)
+            if normal.dot(surface.calc_gradient((a + b + c) / 3.0)) > 0.0:
+                back_triangle_list.append(triangle)
+            else:
+                front_triangle_list.append(triangle)
+        elif 1 not in side_set:
+            back_triangle_list.append(triangle)
+        elif -1 not in side_set:
+            front_triangle_list.append(triangle)
+        else:
+            back_polygon = []
+            front_polygon = []
+            for j in range(3):
+                i, k = triangle[j], triangle[(j + 1) % 3]
+                if side_list[i] <= 0:
+                    back_polygon.append(i)
+                if side_list[i] >= 0:
+                    front_polygon.append(i)
+                if side_list[i] * side_list[k] < 0:
+                    m = find_crossing(i, k)
+                    back_polygon.append(m)
+                    front_polygon.append(m)
+            back_triangle_list += [(back_polygon[0], back_polygon[j], back_polygon[j + 1]) for j in range(1, len(back_polygon) - 1)]
+            front_triangle_list += [(front_polygon[0], front_polygon[j], front_polygon[j + 1]) for j in range(1, len(front_polygon) - 1)]
+
+    if len(front_triangle_list) == 0:
+        return mesh, TriangleMesh()
+    if len(back_triangle_list) == 0:
+        return TriangleMesh(), mesh
+    return _make_mesh(vertex_list, back_triangle_list), _make_mesh(vertex_list, front_triangle_list)
+
+def fit_implicit_surface(mesh, axis, bounds, eps=1e-5):
+    # Recognize the given cutter as a plane, sphere or cylinder, if it is one, and return the implicit surface it
+    # approximates.  A flat cutter only counts as a plane if it covers the whole of the given bounding sphere, and a
+    # cylinder only if its caps are beyond it, because otherwise its edges take part in the cut.  The cylinder's axis
+    # is taken to be that of the generator, which is how the puzzles here use them.  Anything else returns None.
+    if len(mesh.triangle_list) == 0:
+        return None
+    loop_list, weld_count, open_count = find_border_loops(mesh.vertex_list, mesh.triangle_list)
+    bounds_center, bounds_radius = bounds
+
+    normal_list = []
+    for triangle in mesh.triangle_list:
+        a, b, c = [mesh.vertex_list[i] for i in triangle]
+        normal = (b - a).cross(c - a)
+        if normal.length() > eps * eps:
+            normal_list.append(((a + b + c) / 3.0, normal.normalized()))
+    if len(normal_list) == 0:
+        return None
+
+    center, unit_normal = normal_list[0]
+    if all([normal.dot(unit_normal) > 1.0 - eps for point, normal in normal_list]) and \
+            all([math.fabs((vertex - center).dot(unit_normal)) < eps for vertex in mesh.vertex_list]):
+        if open_count > 0 or len(loop_list) != 1:
+            return None
+        distance = (bounds_center - center).dot(unit_normal)
+        if math.fabs(distance) >= bounds_radius:
+            return PlaneSurface(center, unit_normal)
+        foot = bounds_center - unit_normal * distance
+        if not any([(calc_closest_point_on_triangle(foot, *[mesh.vertex_list[i] for i in triangle]) - foot).length() < eps for triangle in mesh.triangle_list]):
+            return None
+        loop = loop_list[0]
+        edge_distance = min([_calc_point_segment_distance(foot, mesh.vertex_list[loop[j]], mesh.vertex_list[loop[(j + 1) % len(loop)]]) for j in range(len(loop))])
+        if edge_distance < math.sqrt(bounds_radius * bounds_radius - distance * distance):
+            return None
+        return PlaneSurface(center, unit_normal)
+
+    if len(loop_list) > 0 or open_count > 0:
+        return None
+
+    surface = _fit_sphere(mesh.vertex_list, eps)
+    if surface is None and axis is not None:
+        surface = _fit_cylinder(mesh.vertex_list, axis.normalized(), bounds, eps)
+    if surface is None:
+        return None
+
+    # Orient the surface so that its front is the side the mesh's triangles face.
+    point, normal = max(normal_list, key=lambda entry: math.fabs(entry[1].dot(surface.calc_gradient(entry[0]))))
+    if normal.dot(surface.calc_gradient(point)) < 0.0:
+        surface.sign = -1.0
+    return surface
+
+def make_probe_points(bounds, count=8):
+    # Points in general position about the puzzle for telling whether a motion leaves a surface alone.
+    generator = random.Random(0)
+    center, radius = bounds
+    return [center + Vector(generator.uniform(-radius, radius), generator.uniform(-radius, radius), generator.uniform(-radius, radius)) for i in range(count)]
+
+def _fit_sphere(vertex_list, eps):
+    # Fit |p|^2 = 2 c.p + k in the least-squares sense, then check that every vertex lies on the result.
+    if len(vertex_list) < 4:
+        return None
+    matrix = [[0.0] * 5 for i in range(4)]
+    for vertex in vertex_list:
+        row = [vertex.x, vertex.y, vertex.z, 1.0]
+        value = vertex.dot(vertex)
+        for i in range(4):
+            for j in range(4):
+                matrix[i][j] += row[i] * row[j]
+            matrix[i][4] += row[i] * value
+    solution = _solve_linear_system(matrix)
+    if solution is None:
+        return None
+    center = Vector(solution[0] / 2.0, solution[1] / 2.0, solution[2] / 2.0)
+    radius_squared = solution[3] + center.dot(center)
+    if radius_squared <= 0.0:
+        return None
+    radius = math.sqrt(radius_squared)
+    if any([math.fabs((vertex - center).length() - radius) > eps * max(radius, 1.0) for vertex in vertex_list]):
+        return None
+    return SphereSurface(center, radius)
+
+def _fit_cylinder(vertex_list, unit_axis, bounds, eps):
+    point_cloud_center = Vector(0.0, 0.0, 0.0)
+    for vertex in vertex_list:
+        point_cloud_center += vertex
+    point_cloud_center /= float(len(vertex_list))
+    surface = CylinderSurface(point_cloud_center, unit_axis, 0.0)
+    radius = max([surface.calc_radial_vector(vertex).length() for vertex in vertex_list])
+    if radius <= eps:
+        return None
+    surface.radius = radius
+    height_list = [(vertex - point_cloud_center).dot(unit_axis) for vertex in vertex_list]
+    min_height = min(height_list)
+    max_height = max(height_list)
+    for vertex, height in zip(vertex_list, height_list):
+        if math.fabs(surface.calc_distance(vertex)) > eps and math.fabs(height - min_height) > eps and math.fabs(height - max_height) > eps:
+            return None
+    bounds_center, bounds_radius = bounds
+    bounds_height = (bounds_center - point_cloud_center).dot(unit_axis)
+    if min_height > bounds_height - bounds_radius or max_height < bounds_height + bounds_radius:
+        return None
+    return surface
+
+def _make_mesh(vertex_list, triangle_list):
+    index_map = {}
+    new_vertex_list = []
+    new_triangle_list = []
+    for triangle in triangle_list:
+        new_triangle = []
+        for i in triangle:
+            if i not in index_map:
+                index_map[i] = len(new_vertex_list)
+                new_vertex_list.append(vertex_list[i])
+            new_triangle.append(index_map[i])
+        new_triangle_list.append(tuple(new_triangle))
+    mesh = TriangleMesh()
+    mesh.vertex_list = new_vertex_list
+    mesh.triangle_list = new_triangle_list
+    return mesh
+
+def _solve_quadratic_in_unit_interval(a, b, c):
+    # Of the roots of a t^2 + b t + c, return the one in [0, 1], or nearest it if round-off pushed it out.
+    if math.fabs(a) < 1e-300:
+        return min(max(-c / b, 0.0), 1.0) if b != 0.0 else 0.5
+    discriminant = max(b * b - 4.0 * a * c, 0.0)
+    root = math.sqrt(discriminant)
+    # This form avoids cancellation when one root is much smaller than the other.
+    q = -0.5 * (b + math.copysign(root, b))
+    root_list = [q / a, c / q] if q != 0.0 else [-b / (2.0 * a)]
+    best_t = min(root_list, key=lambda t: max(-t, t - 1.0, 0.0))
+    return min(max(best_t, 0.0), 1.0)
+
+def _solve_linear_system(matrix, eps=1e-12):
+    # Gauss-Jordan elimination with partial pivoting on an augmented matrix.
+    n = len(matrix)
+    for i in range(n):
+        pivot = max(range(i, n), key=lambda j: math.fabs(matrix[j][i]))
+        if math.fabs(matrix[pivot][i]) < eps:
+            return None
+        matrix[i], matrix[pivot] = matrix[pivot], matrix[i]
+        for j in range(n):
+            if j != i:
+                scale = matrix[j][i] / matrix[i][i]
+                matrix[j] = [value_j - scale * value_i for value_j, value_i in zip(matrix[j], matrix[i])]
+    return [matrix[i][n] / matrix[i][i] for i in range(n)]
+
+def _calc_point_segment_distance(p, a, b):
+    ab = b - a
+    length_squared = ab.dot(ab)
+    t = min(max((p - a).dot(ab) / length_squared, 0.0), 1.0) if length_squared > 0.0 else 0.0
+    return (a + ab * t - p).length()
+
+def _calc_line_segment_distance(origin, unit_direction, a, b):
+    # Distance between the infinite line through the origin along the given direction and the segment from a to b,
+    # measured perpendicular to the line, which is all a segment's distance from the line depends on.
+    def radial(point):
+        vector = point - origin
+        return vector - unit_direction * vector.dot(unit_direction)
+    return _calc_point_segment_distance(Vector(0.0, 0.0, 0.0), radial(a), radial(b))
+
+def _line_hits_triangle(origin, unit_direction, a, b, c, eps=1e-12):
+    # This is the Moller-Trumbore test, without the restriction to one side of the origin.
+    ab = b - a
+    ac = c - a
+    p = unit_direction.cross(ac)
+    determinant = ab.dot(p)
+    if math.fabs(determinant) < eps:
+        return False
+    t = origin - a
+    u = t.dot(p) / determinant
+    if u < 0.0 or u > 1.0:
+        return False
+    q = t.cross(ab)
+    v = unit_direction.dot(q) / determinant
+    return v >= 0.0 and u + v <= 1.0
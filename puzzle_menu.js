@@ -8,6 +8,34 @@ class PuzzleMenu {
         this.scrollX = 0;
         this.mouseX = 0;
         this.label_icon = undefined;
+        this.min_icon_size = 70.0;
+        this.max_icon_size = 140.0;
+    }
+    
+    supports_webp() {
+        let canvas = document.createElement('canvas');
+        canvas.width = canvas.height = 1;
+        return canvas.toDataURL('image/webp').indexOf('data:image/webp') === 0;
+    }
+    
+    choose_atlas(atlas_list, atlas_format) {
+        // Take the smallest atlas whose cells are at least as big as an icon can grow, or else the biggest there is.
+        let needed_size = this.max_icon_size * (window.devicePixelRatio || 1.0);
+        let chosen_atlas = undefined;
+        for(let i = 0; i < atlas_list.length; i++) {
+            let atlas = atlas_list[i];
+            if(atlas.atlas_format !== atlas_format)
+                continue;
+            if(chosen_atlas === undefined) {
+                chosen_atlas = atlas;
+            } else {
+                let size = atlas.atlas_rect[2];
+                let chosen_size = chosen_atlas.atlas_rect[2];
+                if((chosen_size < needed_size && size > chosen_size) || (size >= needed_size && size < chosen_size))
+                    chosen_atlas = atlas;
+            }
+        }
+        return chosen_atlas;
     }
     
     promise() {
@@ -21,11 +49,27 @@ class PuzzleMenu {
                     while(puzzle_menu_container.firstChild)
                         puzzle_menu_container.removeChild(puzzle_menu_container.firstChild);
                     
+                    // All icons come out of one sprite atlas, if the menu has them, so there's just the one image to load.
+                    let atlas_format = this.supports_webp() ? 'webp' : 'png';
                     for(let i = 0; i < puzzle_menu_list.length; i++) {
                         let puzzle_menu_item = puzzle_menu_list[i];
-                        let puzzle_menu_icon = document.createElement('img');
+                        let atlas = undefined;
+                        if(puzzle_menu_item.puzzle_atlas_list) {
+                            atlas = this.choose_atlas(puzzle_menu_item.puzzle_atlas_list, atlas_format);
+                            if(atlas === undefined)
+                                atlas = this.choose_atlas(puzzle_menu_item.puzzle_atlas_list, 'png');
+                        }
+                        let puzzle_menu_icon = undefined;
+                        if(atlas !== undefined) {
+                            puzzle_menu_icon = document.createElement('div');
+                            puzzle_menu_icon.style.backgroundImage = 'url(' + atlas.atlas_image + ')';
+                            puzzle_menu_icon.style.backgroundRepeat = 'no-repeat';
+                            puzzle_menu_icon.atlas = atlas;
+                        } else {
+                            puzzle_menu_icon = document.createElement('img');
+                            puzzle_menu_icon.src = 'images/' + puzzle_menu_item.puzzle_name + '.png';
+                        }
                         puzzle_menu_icon.classList.add('puzzle_icon');
-                        puzzle_menu_icon.src = 'images/' + puzzle_menu_item.puzzle_name + '.png';
                         puzzle_menu_icon.label = puzzle_menu_item.puzzle_label;
                         puzzle_menu_icon.addEventListener('click', () => {
                             this.menu_item_clicked(puzzle_menu_item.puzzle_name);
@@ -76,8 +120,8 @@ class PuzzleMenu {
 
         if(this.alpha > 0) {        
             let threshold = 300.0;
-            let min_size = 70.0;
-            let max_size = 140.0;
+            let min_size = this.min_icon_size;
+            let max_size = this.max_icon_size;
             let size = min_size;
             let x = this.scrollX;
             let total_weight = 0.0;
@@ -108,6 +152,12 @@ class PuzzleMenu {
                 puzzle_icon.style.width = puzzle_icon.menu_size.toString() + 'px';
                 puzzle_icon.style.height = puzzle_icon.menu_size.toString() + 'px';
                 puzzle_icon.style.left = puzzle_icon.menu_x.toString() + 'px';
+                if(puzzle_icon.atlas) {
+                    let atlas = puzzle_icon.atlas;
+                    let scale = puzzle_icon.menu_size / atlas.atlas_rect[2];
+                    puzzle_icon.style.backgroundSize = (atlas.atlas_size[0] * scale).toString() + 'px ' + (atlas.atlas_size[1] * scale).toString() + 'px';
+                    puzzle_icon.style.backgroundPosition = (-atlas.atlas_rect[0] * scale).toString() + 'px ' + (-atlas.atlas_rect[1] * scale).toString() + 'px';
+                }
             }
             
             let max_scroll_speed = 10.0;
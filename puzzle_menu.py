@@ -1,132 +1,176 @@
 # puzzle_menu.py
 
+import argparse
 import os
 import sys
 import json
 import gzip
+import time
+import hashlib
+import multiprocessing
 
 sys.path.append(r'c:\dev\pyMath3d')
 
-from OpenGL.GL import *
-from OpenGL.GLU import *
-from PyQt5 import QtGui, QtCore, QtWidgets
-from math3d_vector import Vector
 from puzzle_generator import ColoredMesh
-
-class Window(QtGui.QOpenGLWindow):
-    def __init__(self, parent=None):
-        super().__init__(parent)
-
-    def initializeGL(self):
-        glEnable(GL_DEPTH_TEST)
-        glClearColor(0.0, 0.0, 0.0, 0.0)
-
-        glEnable(GL_LIGHT0)
-
-        glShadeModel(GL_SMOOTH)
-        glEnable(GL_LINE_SMOOTH)
-
-        glLightfv(GL_LIGHT0, GL_POSITION, [1.0, 1.0, 1.0, 0.0])
-        glLightfv(GL_LIGHT0, GL_AMBIENT, [1.0, 1.0, 1.0, 1.0])
-        glLightfv(GL_LIGHT0, GL_DIFFUSE, [1.0, 1.0, 1.0, 1.0])
-
-        glEnable(GL_BLEND)
-        glBlendFunc(GL_SRC_ALPHA, GL_ONE_MINUS_SRC_ALPHA)
-
-        glEnable(GL_CULL_FACE)
-        glCullFace(GL_BACK)
-
-    def paintGL(self):
-        # The window is not meant to stick around.  We're just using it to generate images for the puzzle menu.
-        
-        puzzle_menu_data = []
-        
-        for root, dir_list, file_list in os.walk(os.getcwd() + '/puzzles'):
-            for file in file_list:
-                puzzle_file = os.path.join(root, file)
-                print('Processing %s...' % puzzle_file)
-                with gzip.open(puzzle_file, 'rb') as handle:
-                    json_bytes = handle.read()
-                    json_text = json_bytes.decode('utf-8')
-                    puzzle_data = json.loads(json_text)
-                    
-                    mesh_list = []
-                    for mesh_data in puzzle_data.get('mesh_list', []):
-                        mesh = ColoredMesh().from_dict(mesh_data)
-                        mesh_list.append(mesh)
-                    
-                    self._render_puzzle(mesh_list)
-                    
-                    image = self.grabFramebuffer()
-                    name, ext = os.path.splitext(file)
-                    name, ext = os.path.splitext(name)
-                    image_file = 'images/' + name + '.png'
-                    image.save(os.getcwd() + '/' + image_file)
-                    
-                    puzzle_menu_data.append({
-                        'puzzle_name': name,
-                        'puzzle_label': puzzle_data.get('label', name),
-                        'puzzle_icon': image_file
-                    })
-        
-        with open(os.getcwd() + '/puzzle_menu.json', 'w') as handle:
-            handle.write(json.dumps(puzzle_menu_data, indent=4, separators=(',', ': '), sort_keys=True))
-        
-        app.quit()
-    
-    def _render_puzzle(self, mesh_list):
-    
-        glClear(GL_COLOR_BUFFER_BIT | GL_DEPTH_BUFFER_BIT)
-
-        viewport = glGetIntegerv(GL_VIEWPORT)
-        width = viewport[2]
-        height = viewport[3]
-
-        aspect_ratio = float(width) / float(height)
-
-        glMatrixMode(GL_PROJECTION)
-        glLoadIdentity()
-        gluPerspective(60.0, aspect_ratio, 0.1, 1000.0)
-
-        glMatrixMode(GL_MODELVIEW)
-        glLoadIdentity()
-        gluLookAt(0.0, 0.0, 4.0, 0.0, 0.0, 0.0, 0.0, 1.0, 0.0)
-
-        orient = Vector(35.0, -45.0, 0.0)
-
-        glPushMatrix()
-        glRotatef(orient.x, 1.0, 0.0, 0.0)
-        glRotatef(orient.y, 0.0, 1.0, 0.0)
-        glRotatef(orient.z, 0.0, 0.0, 1.0)
-
-        #glEnable(GL_LIGHTING)
-        glDisable(GL_LIGHTING)
-        for mesh in mesh_list:
-            if mesh.alpha > 0.0:
-                mesh.render()
-
-        glDisable(GL_LIGHTING)
-        for mesh in mesh_list:
-            if mesh.alpha > 0.0:
-                mesh.render_border()
-
-        glPopMatrix()
-
-        glFlush()
-
-    def resizeGL(self, width, height):
-        pass  # glViewport(0, 0, width, height)
-
-def exceptionHook(cls, exc, tb):
-    sys.__excepthook__(cls, exc, tb)
+from puzzle_buffers import unpack_puzzle_data
+from puzzle_atlas import update_atlas_list
+
+# This makes the thumbnail images and the data for the puzzle menu.  By default, the puzzles are rendered in a Qt
+# GL window, which needs a display and a GL context.  With --headless, they're rasterized on the CPU instead, across
+# a pool of processes, one puzzle to a worker.  A manifest remembers what each thumbnail was made from, so that only
+# puzzles whose data or render settings have changed since are rendered again.  The thumbnails are then packed into
+# sprite atlases at a few smaller sizes, which is what the menu actually loads.
+
+MANIFEST_PATH = 'images/manifest.json'
+
+def find_puzzle_file_list():
+    puzzle_file_list = []
+    for root, dir_list, file_list in os.walk(os.getcwd() + '/puzzles'):
+        for file in file_list:
+            if not file.endswith('.json.gz') or '.' in file[:-len('.json.gz')]:
+                continue    # Skip any levels of detail; they're represented by their full-detail puzzle.
+            puzzle_file_list.append(os.path.join(root, file))
+    return sorted(puzzle_file_list)
+
+def read_puzzle_json(puzzle_file):
+    with gzip.open(puzzle_file, 'rb') as handle:
+        return handle.read()
+
+def load_puzzle_file(puzzle_file):
+    json_text = read_puzzle_json(puzzle_file).decode('utf-8')
+    puzzle_data = unpack_puzzle_data(json.loads(json_text))
+
+    mesh_list = []
+    for mesh_data in puzzle_data.get('mesh_list', []):
+        mesh = ColoredMesh().from_dict(mesh_data)
+        mesh_list.append(mesh)
+
+    return puzzle_data, mesh_list
+
+def calc_file_hash(path):
+    with open(path, 'rb') as handle:
+        return hashlib.sha256(handle.read()).hexdigest()
+
+def load_manifest():
+    if not os.path.exists(MANIFEST_PATH):
+        return {}
+    with open(MANIFEST_PATH, 'r') as handle:
+        return json.loads(handle.read())
+
+def save_manifest(manifest):
+    with open(MANIFEST_PATH, 'w') as handle:
+        handle.write(json.dumps(manifest, indent=4, separators=(',', ': '), sort_keys=True))
+
+def find_stale_puzzle_file_list(puzzle_file_list, manifest, render_settings):
+    # A thumbnail is stale if the puzzle's data has changed, which we hash after decompression because gzip stamps
+    # the time into its header, if it was rendered differently, or if the image itself is missing or was changed.
+    stale_list = []
+    for puzzle_file in puzzle_file_list:
+        puzzle_hash = hashlib.sha256(read_puzzle_json(puzzle_file)).hexdigest()
+        name = make_puzzle_name(puzzle_file)
+        record = manifest.get(name)
+        if record is None or record['puzzle_hash'] != puzzle_hash or record['render_settings'] != render_settings or \
+                not os.path.exists(record['puzzle_icon']) or calc_file_hash(record['puzzle_icon']) != record['image_hash']:
+            stale_list.append((puzzle_file, puzzle_hash))
+    return stale_list
+
+def make_puzzle_name(puzzle_file):
+    name, ext = os.path.splitext(os.path.basename(puzzle_file))
+    name, ext = os.path.splitext(name)
+    return name
+
+def make_menu_entry(puzzle_file, puzzle_data):
+    name = make_puzzle_name(puzzle_file)
+    return {
+        'puzzle_name': name,
+        'puzzle_label': puzzle_data.get('label', name),
+        'puzzle_icon': 'images/' + name + '.png'
+    }
+
+def write_puzzle_menu(puzzle_menu_data):
+    with open(os.getcwd() + '/puzzle_menu.json', 'w') as handle:
+        handle.write(json.dumps(puzzle_menu_data, indent=4, separators=(',', ': '), sort_keys=True))
+
+def patch_puzzle_menu(entry_list, name_list, atlas_size_list):
+    # Replace or add the given entries, drop any puzzle no longer among the given names, and keep the rest as they are.
+    # Every entry's place in the atlases is worked out again, since adding or removing a puzzle moves the others.
+    puzzle_menu_data = []
+    if os.path.exists('puzzle_menu.json'):
+        with open('puzzle_menu.json', 'r') as handle:
+            puzzle_menu_data = json.loads(handle.read())
+    entry_map = {entry['puzzle_name']: dict(entry) for entry in puzzle_menu_data if entry['puzzle_name'] in name_list}
+    for entry in entry_list:
+        entry_map[entry['puzzle_name']] = dict(entry)
+    new_puzzle_menu_data = [entry_map[name] for name in sorted(entry_map)]
+    for entry in new_puzzle_menu_data:
+        entry.pop('puzzle_atlas_list', None)
+    if len(atlas_size_list) > 0 and len(new_puzzle_menu_data) > 0:
+        update_atlas_list(new_puzzle_menu_data, atlas_size_list)
+    if new_puzzle_menu_data != puzzle_menu_data:
+        write_puzzle_menu(new_puzzle_menu_data)
+        return True
+    return False
+
+def render_puzzle_file_headless(task):
+    # This runs in a worker process, so it imports the rasterizer itself.
+    from puzzle_raster import render_mesh_list, write_png
+    puzzle_file, size = task
+    start_time = time.perf_counter()
+    puzzle_data, mesh_list = load_puzzle_file(puzzle_file)
+    entry = make_menu_entry(puzzle_file, puzzle_data)
+    write_png(os.getcwd() + '/' + entry['puzzle_icon'], render_mesh_list(mesh_list, size, size))
+    return entry, time.perf_counter() - start_time
+
+def main():
+    arg_parser = argparse.ArgumentParser(description='Render the puzzle menu thumbnails and write out the menu data.')
+    arg_parser.add_argument('--headless', help='Rasterize on the CPU, without a display or GL context.', action='store_true')
+    arg_parser.add_argument('--workers', help='Number of processes rendering headlessly.  Defaults to one per CPU.', type=int)
+    arg_parser.add_argument('--size', help='Width and height of the thumbnails in pixels.', type=int, default=512)
+    arg_parser.add_argument('--force', help='Render every thumbnail, whether or not it is stale.', action='store_true')
+    arg_parser.add_argument('--atlas-sizes', help='Comma-separated cell sizes of the sprite atlases, or none.', type=str, default='64,128,256')
+    args = arg_parser.parse_args()
+
+    atlas_size_list = [int(size) for size in args.atlas_sizes.split(',') if size.strip() not in ('', 'none')]
+
+    start_time = time.perf_counter()
+    render_settings = {'renderer': 'headless' if args.headless else 'gl', 'size': args.size}
+    puzzle_file_list = find_puzzle_file_list()
+    manifest = {} if args.force else load_manifest()
+    stale_list = find_stale_puzzle_file_list(puzzle_file_list, manifest, render_settings)
+    print('%d of %d thumbnails need rendering.' % (len(stale_list), len(puzzle_file_list)))
+
+    entry_list = []
+    if len(stale_list) > 0:
+        if not args.headless:
+            from puzzle_menu_gl import run_gl_menu
+            entry_list = run_gl_menu(args.size, [puzzle_file for puzzle_file, puzzle_hash in stale_list])
+        else:
+            task_list = [(puzzle_file, args.size) for puzzle_file, puzzle_hash in stale_list]
+            with multiprocessing.Pool(args.workers) as pool:
+                for entry, seconds in pool.imap(render_puzzle_file_headless, task_list):
+                    print('Rendered %s in %f seconds.' % (entry['puzzle_icon'], seconds))
+                    entry_list.append(entry)
+
+    name_list = [make_puzzle_name(puzzle_file) for puzzle_file in puzzle_file_list]
+    manifest = {name: record for name, record in manifest.items() if name in name_list}
+    for entry, (puzzle_file, puzzle_hash) in zip(entry_list, stale_list):
+        manifest[entry['puzzle_name']] = {
+            'puzzle_hash': puzzle_hash,
+            'puzzle_icon': entry['puzzle_icon'],
+            'puzzle_label': entry['puzzle_label'],
+            'image_hash': calc_file_hash(entry['puzzle_icon']),
+            'render_settings': render_settings
+        }
+    save_manifest(manifest)
+
+    # Labels of puzzles we didn't render come from the manifest, in case the menu data was lost.
+    rendered_name_set = set([entry['puzzle_name'] for entry in entry_list])
+    entry_list += [{'puzzle_name': name, 'puzzle_label': record['puzzle_label'], 'puzzle_icon': record['puzzle_icon']}
+                   for name, record in manifest.items() if name not in rendered_name_set]
+    if patch_puzzle_menu(entry_list, name_list, atlas_size_list):
+        print('Updated puzzle_menu.json.')
+    print('Rendered %d thumbnails in %f seconds.' % (len(stale_list), time.perf_counter() - start_time))
+    return 0
 
 if __name__ == '__main__':
-    sys.excepthook = exceptionHook
-
-    app = QtGui.QGuiApplication(sys.argv)
-
-    win = Window()
-    win.resize(512, 512)
-    win.show()
-
-    sys.exit(app.exec_())
\ No newline at end of file
+    sys.exit(main())
@@ -0,0 +1,112 @@
+# puzzle_menu_gl.py
+
+import os
+import sys
+
+sys.path.append(r'c:\dev\pyMath3d')
+
+from OpenGL.GL import *
+from OpenGL.GLU import *
+from PyQt5 import QtGui, QtCore, QtWidgets
+from math3d_vector import Vector
+from puzzle_menu import load_puzzle_file, make_menu_entry
+
+class Window(QtGui.QOpenGLWindow):
+    def __init__(self, puzzle_file_list, parent=None):
+        super().__init__(parent)
+        self.puzzle_file_list = puzzle_file_list
+        self.entry_list = []
+
+    def initializeGL(self):
+        glEnable(GL_DEPTH_TEST)
+        glClearColor(0.0, 0.0, 0.0, 0.0)
+
+        glEnable(GL_LIGHT0)
+
+        glShadeModel(GL_SMOOTH)
+        glEnable(GL_LINE_SMOOTH)
+
+        glLightfv(GL_LIGHT0, GL_POSITION, [1.0, 1.0, 1.0, 0.0])
+        glLightfv(GL_LIGHT0, GL_AMBIENT, [1.0, 1.0, 1.0, 1.0])
+        glLightfv(GL_LIGHT0, GL_DIFFUSE, [1.0, 1.0, 1.0, 1.0])
+
+        glEnable(GL_BLEND)
+        glBlendFunc(GL_SRC_ALPHA, GL_ONE_MINUS_SRC_ALPHA)
+
+        glEnable(GL_CULL_FACE)
+        glCullFace(GL_BACK)
+
+    def paintGL(self):
+        # The window is not meant to stick around.  We're just using it to generate images for the puzzle menu.
+
+        for puzzle_file in self.puzzle_file_list:
+            print('Processing %s...' % puzzle_file)
+            puzzle_data, mesh_list = load_puzzle_file(puzzle_file)
+
+            self._render_puzzle(mesh_list)
+
+            image = self.grabFramebuffer()
+            entry = make_menu_entry(puzzle_file, puzzle_data)
+            image.save(os.getcwd() + '/' + entry['puzzle_icon'])
+            self.entry_list.append(entry)
+
+        QtGui.QGuiApplication.instance().quit()
+
+    def _render_puzzle(self, mesh_list):
+
+        glClear(GL_COLOR_BUFFER_BIT | GL_DEPTH_BUFFER_BIT)
+
+        viewport = glGetIntegerv(GL_VIEWPORT)
+        width = viewport[2]
+        height = viewport[3]
+
+        aspect_ratio = float(width) / float(height)
+
+        glMatrixMode(GL_PROJECTION)
+        glLoadIdentity()
+        gluPerspective(60.0, aspect_ratio, 0.1, 1000.0)
+
+        glMatrixMode(GL_MODELVIEW)
+        glLoadIdentity()
+        gluLookAt(0.0, 0.0, 4.0, 0.0, 0.0, 0.0, 0.0, 1.0, 0.0)
+
+        orient = Vector(35.0, -45.0, 0.0)
+
+        glPushMatrix()
+        glRotatef(orient.x, 1.0, 0.0, 0.0)
+        glRotatef(orient.y, 0.0, 1.0, 0.0)
+        glRotatef(orient.z, 0.0, 0.0, 1.0)
+
+        #glEnable(GL_LIGHTING)
+        glDisable(GL_LIGHTING)
+        for mesh in mesh_list:
+            if mesh.alpha > 0.0:
+                mesh.render()
+
+        glDisable(GL_LIGHTING)
+        for mesh in mesh_list:
+            if mesh.alpha > 0.0:
+                mesh.render_border()
+
+        glPopMatrix()
+
+        glFlush()
+
+    def resizeGL(self, width, height):
+        pass  # glViewport(0, 0, width, height)
+
+def exceptionHook(cls, exc, tb):
+    sys.__excepthook__(cls, exc, tb)
+
+def run_gl_menu(size, puzzle_file_list):
+    # Render the given puzzles and return their menu entries.
+    sys.excepthook = exceptionHook
+
+    app = QtGui.QGuiApplication(sys.argv[:1])
+
+    win = Window(puzzle_file_list)
+    win.resize(size, size)
+    win.show()
+
+    app.exec_()
+    return win.entry_list
@@ -0,0 +1,220 @@
+# puzzle_metrics.py
+
+import os
+import json
+import time
+import bisect
+import threading
+import cherrypy
+
+# This counts what the server does, for Prometheus to scrape from /metrics.  A CherryPy tool times each request from
+# the start of its resource to the end of its response, and records it under its route all at once, taking one lock,
+# so that the cost per request stays down to a few dictionary updates.  Caches aren't touched per request at all: they
+# keep their own counts, which are only read when the metrics are.  Bytes are counted per puzzle only for puzzles that
+# exist, so that requests for made-up names can't grow the label set without bound.  The rate of 304s comes from the
+# request counts by status.
+#
+# Each worker process counts on its own.  When there are several, each one regularly writes what it has counted to a
+# directory they share, and whichever worker answers a scrape adds up its own counts and the others', so that a scrape
+# covers them all, if a few seconds behind for the others.  When a worker is replaced its counts go with it, which
+# Prometheus takes as a counter reset.  Gauges aren't added up, since a level in one process plus a level in another
+# isn't a level of anything: those that belong to a worker are labeled with its process ID, and those of a cache that
+# all the workers share, such as the memory-mapped archive, are the same in every worker, so the largest is taken.
+
+LATENCY_BUCKET_LIST = [0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0]
+
+METRIC_HELP_MAP = {
+    'puzzle_http_requests_total': ('counter', 'Requests answered, by route and status.'),
+    'puzzle_http_requests_in_flight': ('gauge', 'Requests being answered, by route and worker.'),
+    'puzzle_http_request_duration_seconds': ('histogram', 'Time from the start of a request to the end of its response, by route.'),
+    'puzzle_http_response_bytes_total': ('counter', 'Response body bytes, by route and content encoding.'),
+    'puzzle_puzzle_bytes_total': ('counter', 'Puzzle response body bytes, by puzzle and content encoding.'),
+    'puzzle_cache_hits_total': ('counter', 'Lookups answered from a cache, by cache.'),
+    'puzzle_cache_misses_total': ('counter', 'Lookups that a cache had to fill, by cache.'),
+    'puzzle_cache_evictions_total': ('counter', 'Entries dropped or replaced in a cache, by cache.'),
+    'puzzle_cache_entries': ('gauge', 'Entries held in a cache, by cache, and by worker unless the workers share it.'),
+    'puzzle_cache_bytes': ('gauge', 'Bytes held in a cache, by cache, and by worker unless the workers share it.')
+}
+
+class MetricsRegistry(object):
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.value_map = {}         # (name, labels) -> value, for counters and gauges.
+        self.histogram_map = {}     # (name, labels) -> bucket counts, then the sum and the count.
+        self.cache_map = {}
+        self.shared_cache_set = set()
+        self.share_dir = None
+
+    def add_cache(self, name, cache, shared=False):
+        # A cache is read for its hit_count, miss_count, eviction_count, entry_count and byte_count when scraped.  A
+        # shared cache is one whose entries every worker sees the same of, rather than holding its own.
+        self.cache_map[name] = cache
+        if shared:
+            self.shared_cache_set.add(name)
+
+    def start_request(self, route):
+        key = ('puzzle_http_requests_in_flight', (('route', route),))
+        with self.lock:
+            self.value_map[key] = self.value_map.get(key, 0) + 1
+
+    def end_request(self, route, status, seconds, byte_count, encoding, puzzle_name):
+        route_labels = (('route', route),)
+        bucket_index = bisect.bisect_left(LATENCY_BUCKET_LIST, seconds)
+        with self.lock:
+            value_map = self.value_map
+            key = ('puzzle_http_requests_in_flight', route_labels)
+            value_map[key] = value_map.get(key, 0) - 1
+            key = ('puzzle_http_requests_total', (('route', route), ('status', str(status))))
+            value_map[key] = value_map.get(key, 0) + 1
+            if byte_count > 0:
+                key = ('puzzle_http_response_bytes_total', (('encoding', encoding), ('route', route)))
+                value_map[key] = value_map.get(key, 0) + byte_count
+            if puzzle_name is not None and byte_count > 0:
+                key = ('puzzle_puzzle_bytes_total', (('encoding', encoding), ('puzzle', puzzle_name)))
+                value_map[key] = value_map.get(key, 0) + byte_count
+            key = ('puzzle_http_request_duration_seconds', route_labels)
+            histogram = self.histogram_map.get(key)
+            if histogram is None:
+                histogram = self.histogram_map[key] = [0] * (len(LATENCY_BUCKET_LIST) + 3)
+            histogram[bucket_index] += 1
+            histogram[-2] += seconds
+            histogram[-1] += 1
+
+    def snapshot(self):
+        # Return everything counted so far as a list of [name, labels, value] entries, which can be written as JSON,
+        # and added to those of other workers.  A histogram's value is its list of bucket counts, sum and count.
+        worker_label = ('worker', str(os.getpid()))
+        with self.lock:
+            entry_list = [[name, list(labels) + ([worker_label] if METRIC_HELP_MAP[name][0] == 'gauge' else []), value] for (name, labels), value in self.value_map.items()]
+            entry_list += [[name, list(labels), list(histogram)] for (name, labels), histogram in self.histogram_map.items()]
+        for cache_name, cache in self.cache_map.items():
+            labels = [('cache', cache_name)]
+            gauge_labels = labels if cache_name in self.shared_cache_set else labels + [worker_label]
+            entry_list += [
+                ['puzzle_cache_hits_total', labels, cache.hit_count],
+                ['puzzle_cache_misses_total', labels, cache.miss_count],
+                ['puzzle_cache_evictions_total', labels, cache.eviction_count],
+                ['puzzle_cache_entries', gauge_labels, cache.entry_count],
+                ['puzzle_cache_bytes', gauge_labels, cache.byte_count]
+            ]
+        return entry_list
+
+    def write_share(self):
+        # Write our snapshot for the other workers to read, renaming it into place so that they never see half of it.
+        if self.share_dir is None:
+            return
+        path = os.path.join(self.share_dir, '%d.json' % os.getpid())
+        with open(path + '.tmp', 'w') as handle:
+            handle.write(json.dumps(self.snapshot()))
+        os.replace(path + '.tmp', path)
+
+    def remove_share(self):
+        if self.share_dir is None:
+            return
+        try:
+            os.remove(os.path.join(self.share_dir, '%d.json' % os.getpid()))
+        except OSError:
+            pass
+
+    def read_shares(self):
+        # Return the snapshots of the other workers, skipping any that's gone or in the middle of being replaced.
+        snapshot_list = []
+        if self.share_dir is None:
+            return snapshot_list
+        own_file = '%d.json' % os.getpid()
+        for file in os.listdir(self.share_dir):
+            if not file.endswith('.json') or file == own_file:
+                continue
+            try:
+                with open(os.path.join(self.share_dir, file), 'r') as handle:
+                    snapshot_list.append(json.loads(handle.read()))
+            except (OSError, ValueError):
+                pass
+        return snapshot_list
+
+    def render(self):
+        # Add up the counters of our snapshot and those of the other workers, take the largest of any gauge reported
+        # by more than one of them, and write them out in the Prometheus text format.
+        total_map = {}
+        for entry_list in [self.snapshot()] + self.read_shares():
+            for name, labels, value in entry_list:
+                key = (name, tuple([tuple(label) for label in labels]))
+                total = total_map.get(key)
+                if total is None:
+                    total_map[key] = value
+                elif isinstance(value, list):
+                    total_map[key] = [a + b for a, b in zip(total, value)]
+                elif METRIC_HELP_MAP[name][0] == 'gauge':
+                    total_map[key] = max(total, value)
+                else:
+                    total_map[key] = total + value
+
+        line_list = []
+        for name in sorted(METRIC_HELP_MAP):
+            kind, help_text = METRIC_HELP_MAP[name]
+            key_list = sorted([key for key in total_map if key[0] == name])
+            if len(key_list) == 0:
+                continue
+            line_list.append('# HELP %s %s' % (name, help_text))
+            line_list.append('# TYPE %s %s' % (name, kind))
+            for key in key_list:
+                labels = key[1]
+                value = total_map[key]
+                if kind == 'histogram':
+                    cumulative = 0
+                    for bound, count in zip(LATENCY_BUCKET_LIST + ['+Inf'], value[:-2]):
+                        cumulative += count
+                        line_list.append('%s_bucket%s %d' % (name, format_labels(labels + (('le', str(bound)),)), cumulative))
+                    line_list.append('%s_sum%s %r' % (name, format_labels(labels), float(value[-2])))
+                    line_list.append('%s_count%s %d' % (name, format_labels(labels), value[-1]))
+                else:
+                    line_list.append('%s%s %d' % (name, format_labels(labels), value))
+        return '\n'.join(line_list) + '\n'
+
+def format_labels(labels):
+    if len(labels) == 0:
+        return ''
+    escape = lambda value: value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+    return '{%s}' % ','.join(['%s="%s"' % (name, escape(value)) for name, value in labels])
+
+registry = MetricsRegistry()
+
+class MetricsTool(cherrypy.Tool):
+    # Turned on with tools.metrics.on, this times every request under the path, with two hooks.
+    def __init__(self):
+        cherrypy.Tool.__init__(self, 'on_start_resource', self._start, priority=10)
+
+    def _setup(self):
+        hooks = cherrypy.serving.request.hooks
+        hooks.attach('on_start_resource', self._start, priority=10)
+        hooks.attach('on_end_request', self._end, priority=90)
+
+    def _start(self):
+        request = cherrypy.serving.request
+        request.metrics_start_time = time.perf_counter()
+        request.metrics_route = find_route(request)
+        registry.start_request(request.metrics_route)
+
+    def _end(self):
+        request = cherrypy.serving.request
+        start_time = getattr(request, 'metrics_start_time', None)
+        if start_time is None:
+            return
+        response = cherrypy.serving.response
+        status = int(str(response.status).split()[0])
+        headers = response.headers
+        byte_count = int(headers.get('Content-Length', 0)) if status != 304 and request.method != 'HEAD' else 0
+        encoding = headers.get('Content-Encoding', 'identity')
+        puzzle_name = request.params.get('name') if request.metrics_route == 'puzzle' and status == 200 else None
+        registry.end_request(request.metrics_route, status, time.perf_counter() - start_time, byte_count, encoding, puzzle_name)
+
+def find_route(request):
+    # The page itself is the default handler at the root.  Everything else that falls through to the default handler
+    # is a file served from the static directory, or no file at all.
+    handler = request.handler
+    name = getattr(getattr(handler, 'callable', None), '__name__', None)
+    if name is None or (name == 'default' and request.path_info != '/'):
+        return 'static'
+    return name
+
+cherrypy.tools.metrics = MetricsTool()
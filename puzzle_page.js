@@ -225,12 +225,133 @@ function projection_space_to_screen_space(screen_point, projection_point) {
     screen_point[2] = projection_point[2];
 }
 
+// This holds one interleaved vertex buffer and one index buffer shared by all the pieces of a puzzle.
+// Each piece draws its own range of the index buffer, so the buffers need only be bound once per frame.
+class PuzzleBuffers {
+    constructor(buffer_data) {
+        this.stride = buffer_data.vertex_format.length;
+        let vertex_encoding = buffer_data.vertex_encoding;
+        if(vertex_encoding) {
+            // The components were quantized and stored one after another, so here we restore and interleave them.
+            let count = buffer_data.vertex_count;
+            let planar_list = buffer_data.vertex_buffer;
+            this.vertex_array = new Float32Array(count * this.stride);
+            for(let c = 0; c < this.stride; c++) {
+                let offset = vertex_encoding.offset[c];
+                let scale = vertex_encoding.scale[c];
+                for(let i = 0; i < count; i++)
+                    this.vertex_array[i * this.stride + c] = offset + planar_list[c * count + i] * scale;
+            }
+        } else {
+            // Otherwise the positions were stored exactly, which we keep in double precision for the tests that need
+            // more precision than drawing does, and the rest already rounded to single precision.
+            let count = buffer_data.vertex_count;
+            let planar_list = buffer_data.vertex_buffer;
+            this.vertex_array = new Float32Array(count * this.stride);
+            this.position_array = new Float64Array(count * 3);
+            for(let c = 0; c < this.stride; c++) {
+                for(let i = 0; i < count; i++)
+                    this.vertex_array[i * this.stride + c] = planar_list[c * count + i];
+            }
+            for(let c = 0; c < 3; c++) {
+                for(let i = 0; i < count; i++)
+                    this.position_array[i * 3 + c] = planar_list[c * count + i];
+            }
+        }
+        // Quantized positions are all we have on the CPU too, so the tests that use them have to allow for as much
+        // error as they were stored with: half the diagonal of a quantization cell.
+        this.position_tolerance = 0.0;
+        if(vertex_encoding) {
+            let scale = vertex_encoding.scale;
+            this.position_tolerance = 0.5 * Math.sqrt(scale[0] * scale[0] + scale[1] * scale[1] + scale[2] * scale[2]);
+        }
+        // Each index was stored as the zig-zag encoded difference from the one before it.
+        let delta_array = buffer_data.index_buffer;
+        let index_array = new Uint32Array(delta_array.length);
+        let previous = 0;
+        for(let i = 0; i < delta_array.length; i++) {
+            let delta = delta_array[i];
+            previous += (delta % 2 === 0) ? delta / 2 : -(delta + 1) / 2;
+            index_array[i] = previous;
+        }
+
+        this.vertex_buffer = gl.createBuffer();
+        gl.bindBuffer(gl.ARRAY_BUFFER, this.vertex_buffer);
+        gl.bufferData(gl.ARRAY_BUFFER, this.vertex_array, gl.STATIC_DRAW);
+
+        this.index_buffer = gl.createBuffer();
+        gl.bindBuffer(gl.ELEMENT_ARRAY_BUFFER, this.index_buffer);
+        gl.bufferData(gl.ELEMENT_ARRAY_BUFFER, index_array, gl.STATIC_DRAW);
+    }
+
+    release() {
+        if(this.vertex_buffer) {
+            gl.deleteBuffer(this.vertex_buffer);
+            this.vertex_buffer = undefined;
+        }
+        if(this.index_buffer) {
+            gl.deleteBuffer(this.index_buffer);
+            this.index_buffer = undefined;
+        }
+    }
+
+    bind() {
+        let vertex_loc = gl.getAttribLocation(puzzle_shader.program, 'vertex');
+        let uv_loc = gl.getAttribLocation(puzzle_shader.program, 'vertexUVs');
+        let normal_loc = gl.getAttribLocation(puzzle_shader.program, 'vertexNormals');
+        gl.bindBuffer(gl.ARRAY_BUFFER, this.vertex_buffer);
+        gl.vertexAttribPointer(vertex_loc, 3, gl.FLOAT, false, this.stride * 4, 0);
+        gl.enableVertexAttribArray(vertex_loc);
+        gl.vertexAttribPointer(uv_loc, 2, gl.FLOAT, false, this.stride * 4, 3 * 4);
+        gl.enableVertexAttribArray(uv_loc);
+        gl.vertexAttribPointer(normal_loc, 3, gl.FLOAT, false, this.stride * 4, 5 * 4);
+        gl.enableVertexAttribArray(normal_loc);
+        gl.bindBuffer(gl.ELEMENT_ARRAY_BUFFER, this.index_buffer);
+    }
+
+    make_vertex_list(vertex_range) {
+        let vertex_list = [];
+        for(let i = vertex_range[0]; i < vertex_range[0] + vertex_range[1]; i++) {
+            if(this.position_array) {
+                let j = i * 3;
+                vertex_list.push({x: this.position_array[j], y: this.position_array[j + 1], z: this.position_array[j + 2]});
+            } else {
+                let j = i * this.stride;
+                vertex_list.push({x: this.vertex_array[j], y: this.vertex_array[j + 1], z: this.vertex_array[j + 2]});
+            }
+        }
+        return vertex_list;
+    }
+
+    make_normal_list(vertex_range) {
+        let normal_list = [];
+        for(let i = vertex_range[0]; i < vertex_range[0] + vertex_range[1]; i++) {
+            let j = i * this.stride;
+            normal_list.push({x: this.vertex_array[j + 5], y: this.vertex_array[j + 6], z: this.vertex_array[j + 7]});
+        }
+        return normal_list;
+    }
+}
+
 class PuzzleMesh extends StaticTriangleMesh {
-    constructor(mesh_data) {
+    constructor(mesh_data, puzzle_buffers=undefined) {
         super();
         this.border_length_list = [];
         this.border_vertex_buffer_list = [];
-        this.generate(mesh_data.triangle_list, mesh_data.vertex_list, mesh_data.uv_list, mesh_data.normal_list, mesh_data.border_loop_list);
+        this.puzzle_buffers = puzzle_buffers;
+        if(puzzle_buffers) {
+            // We still keep the vertices of the piece around on the CPU side for the bandaging checks.
+            this.vertex_list = puzzle_buffers.make_vertex_list(mesh_data.vertex_range);
+            mesh_data.normal_list = puzzle_buffers.make_normal_list(mesh_data.vertex_range);
+            this.index_range = mesh_data.index_range;
+            this.border_range = mesh_data.border_range;
+            this.triangle_count = mesh_data.index_range[1] / 3;
+            this.position_tolerance = puzzle_buffers.position_tolerance;
+        } else {
+            this.generate(mesh_data.triangle_list, mesh_data.vertex_list, mesh_data.uv_list, mesh_data.normal_list, mesh_data.border_loop_list);
+            this.triangle_count = mesh_data.triangle_list.length;
+            this.position_tolerance = 0.0;
+        }
         this.texture_number = mesh_data.texture_number;
         this.color = vec3_create(mesh_data.color);
         this.alpha = mesh_data.alpha;
@@ -334,6 +455,16 @@ class PuzzleMesh extends StaticTriangleMesh {
         let animation_transform_matrix_loc = gl.getUniformLocation(puzzle_shader.program, 'animation_transform_matrix');
         gl.uniformMatrix4fv(animation_transform_matrix_loc, false, animation_transform);
 
+        if(this.puzzle_buffers) {
+            // The puzzle has already bound the packed buffers for us.
+            gl.drawElements(gl.TRIANGLES, this.index_range[1], gl.UNSIGNED_INT, this.index_range[0] * 4);
+            gl.uniform3fv(color_loc, vec3_create({'x': 0.0, 'y': 0.0, 'z': 0.0}));
+            gl.uniform1f(blendFactor_loc, 0.0);
+            gl.uniform1f(highlightFactor_loc, 0.0);
+            gl.drawElements(gl.LINES, this.border_range[1], gl.UNSIGNED_INT, this.border_range[0] * 4);
+            return;
+        }
+
         let vertex_loc = gl.getAttribLocation(puzzle_shader.program, 'vertex');
         let uv_loc = gl.getAttribLocation(puzzle_shader.program, 'vertexUVs');
         let normal_loc = gl.getAttribLocation(puzzle_shader.program, 'vertexNormals');
@@ -357,6 +488,7 @@ class PuzzleMesh extends StaticTriangleMesh {
     }
 
     is_captured_by_generator(generator) {
+        // The center is stored exactly with each piece, however its vertices were packed, so this needs no tolerance.
         let transformed_center = vec3.create();
         vec3.transformMat4(transformed_center, this.center, this.permutation_transform);
         let side = generator.calc_side(transformed_center);
@@ -364,6 +496,8 @@ class PuzzleMesh extends StaticTriangleMesh {
     }
     
     straddles_generator(generator, eps=1e-7) {
+        // A vertex on the cut must not be taken for one on either side of it just because of how it was stored.
+        eps = Math.max(eps, this.position_tolerance);
         let found_inside = false;
         let found_outside = false;
         for(let i = 0; i < this.vertex_list.length; i++) {
@@ -408,6 +542,20 @@ class PuzzleGenerator {
             let plane = {'center': center, 'unit_normal': unit_normal}
             this.plane_list.push(plane);
         }
+        // When the generator cut against the exact plane, sphere or cylinder that its planes only approximate, the
+        // cut pieces are on one side or the other of that surface, not of the planes, so we test against it instead.
+        this.surface = undefined;
+        if(generator_data.surface) {
+            let surface_data = generator_data.surface;
+            this.surface = {
+                'type': surface_data.type,
+                'sign': surface_data.sign,
+                'center': vec3_create(surface_data.center),
+                'unit_normal': vec3_create(surface_data.unit_normal),
+                'unit_axis': vec3_create(surface_data.unit_axis),
+                'radius': surface_data.radius
+            };
+        }
         this.special_case_data = 'special_case_data' in generator_data ? generator_data.special_case_data : undefined;
         this.fixed_label = generator_data.fixed_label;
         this.dynamic_label = undefined;
@@ -475,15 +623,35 @@ class PuzzleGenerator {
         this.dynamic_label = undefined;
     }
     
+    calc_surface_distance(point) {
+        let surface = this.surface;
+        let vec = vec3.create();
+        vec3.subtract(vec, point, surface.center);
+        let distance = 0.0;
+        if(surface.type === 'plane')
+            distance = vec3.dot(vec, surface.unit_normal);
+        else if(surface.type === 'sphere')
+            distance = vec3.length(vec) - surface.radius;
+        else if(surface.type === 'cylinder') {
+            vec3.scaleAndAdd(vec, vec, surface.unit_axis, -vec3.dot(vec, surface.unit_axis));
+            distance = vec3.length(vec) - surface.radius;
+        }
+        return surface.sign * distance;
+    }
+    
     calc_side(point, eps=1e-7) {
         let vec = vec3.create();
         let largest_distance = -99999.0;
-        for(let i = 0; i < this.plane_list.length; i++) {
-            let plane = this.plane_list[i];
-            vec3.subtract(vec, point, plane.center);
-            let distance = vec3.dot(vec, plane.unit_normal);
-            if(distance > largest_distance)
-                largest_distance = distance;
+        if(this.surface) {
+            largest_distance = this.calc_surface_distance(point);
+        } else {
+            for(let i = 0; i < this.plane_list.length; i++) {
+                let plane = this.plane_list[i];
+                vec3.subtract(vec, point, plane.center);
+                let distance = vec3.dot(vec, plane.unit_normal);
+                if(distance > largest_distance)
+                    largest_distance = distance;
+            }
         }
         if(largest_distance < -eps)
             return 'inside';
@@ -541,6 +709,9 @@ class Puzzle {
         this.selected_generator = -1;
         this.bandages = false;
         this.custom_texture_list = [];
+        this.full_detail = false;
+        this.full_detail_failed = false;
+        this.puzzle_buffers = undefined;
     }
     
     get_permutation_state() {
@@ -576,6 +747,11 @@ class Puzzle {
             mesh.release();
         }
         this.mesh_list = [];
+
+        if(this.puzzle_buffers) {
+            this.puzzle_buffers.release();
+            this.puzzle_buffers = undefined;
+        }
         
         for(let i = 0; i < this.custom_texture_list.length; i++) {
             let texture = this.custom_texture_list[i];
@@ -587,39 +763,61 @@ class Puzzle {
     }
     
     promise() {
+        // We first load the coarsest level of detail so that the puzzle becomes interactive as soon as possible,
+        // and then swap in the full-detail geometry once it arrives in the background.  The generator only keeps
+        // a level of detail that is much smaller than the full-detail puzzle, and where it kept none, the server
+        // answers with the full-detail puzzle itself, so that is all we download.
         return new Promise((resolve, reject) => {
+            this.puzzle_data_promise(0).then(puzzle_data => {
+                this.release();
+                this.bandages = puzzle_data.bandages || false;
+                this.full_detail = !('lod' in puzzle_data);
+                if('packed_buffers' in puzzle_data)
+                    this.puzzle_buffers = new PuzzleBuffers(puzzle_data['packed_buffers']);
+                let mesh_list = puzzle_data['mesh_list'];
+                for(let i = 0; i < mesh_list.length; i++) {
+                    let mesh_data = mesh_list[i];
+                    let mesh = new PuzzleMesh(mesh_data, this.puzzle_buffers);
+                    this.mesh_list.push(mesh);
+                }
+                let generator_list = puzzle_data['generator_mesh_list'];
+                for(let i = 0; i < generator_list.length; i++) {
+                    let generator_data = generator_list[i];
+                    let generator = new PuzzleGenerator(generator_data);
+                    this.generator_list.push(generator);
+                }
+                let custom_texture_promise_list = [];
+                let custom_texture_path_list = puzzle_data['custom_texture_path_list'];
+                if(Array.isArray(custom_texture_path_list)) {
+                    for(let i = 0; i < custom_texture_path_list.length; i++) {
+                        this.custom_texture_list.push(new Texture(custom_texture_path_list[i]));
+                        custom_texture_promise_list.push(this.custom_texture_list[i].promise());
+                    }
+                }
+                Promise.all(custom_texture_promise_list).then(() => {
+                    resolve();
+                    if(!this.full_detail)
+                        this.load_full_detail();
+                });
+            }, reject);
+        });
+    }
+
+    puzzle_data_promise(lod) {
+        return new Promise((resolve, reject) => {
+            let data = {'name': this.name};
+            if(lod !== undefined)
+                data['lod'] = lod;
             $.ajax({
                 url: 'puzzle',
-                data: {'name': this.name},
+                data: data,
                 dataType: 'json',
                 success: puzzle_data => {
                     if('error' in puzzle_data) {
                         alert(puzzle_data['error']);
                         reject();
                     } else {
-                        this.release();
-                        this.bandages = puzzle_data.bandages || false;
-                        let mesh_list = puzzle_data['mesh_list'];
-                        for(let i = 0; i < mesh_list.length; i++) {
-                            let mesh_data = mesh_list[i];
-                            let mesh = new PuzzleMesh(mesh_data);
-                            this.mesh_list.push(mesh);
-                        }
-                        let generator_list = puzzle_data['generator_mesh_list'];
-                        for(let i = 0; i < generator_list.length; i++) {
-                            let generator_data = generator_list[i];
-                            let generator = new PuzzleGenerator(generator_data);
-                            this.generator_list.push(generator);
-                        }
-                        let custom_texture_promise_list = [];
-                        let custom_texture_path_list = puzzle_data['custom_texture_path_list'];
-                        if(Array.isArray(custom_texture_path_list)) {
-                            for(let i = 0; i < custom_texture_path_list.length; i++) {
-                                this.custom_texture_list.push(new Texture(custom_texture_path_list[i]));
-                                custom_texture_promise_list.push(this.custom_texture_list[i].promise());
-                            }
-                        }
-                        Promise.all(custom_texture_promise_list).then(resolve);
+                        resolve(puzzle_data);
                     }
                 },
                 error: function(request, status, error) {
@@ -629,6 +827,48 @@ class Puzzle {
             });
         });
     }
+
+    load_full_detail() {
+        this.puzzle_data_promise().then(puzzle_data => {
+            // The user may have moved on to another puzzle while we were waiting.
+            if(puzzle !== this)
+                return;
+            if(this.mesh_list.length !== puzzle_data.mesh_list.length) {
+                alert('Error: The full-detail puzzle does not match the one loaded.');
+                this.give_up_full_detail();
+                return;
+            }
+            // The pieces and generators are the same at every level of detail, so the state of each piece carries over as is.
+            let old_puzzle_buffers = this.puzzle_buffers;
+            this.puzzle_buffers = ('packed_buffers' in puzzle_data) ? new PuzzleBuffers(puzzle_data['packed_buffers']) : undefined;
+            for(let i = 0; i < this.mesh_list.length; i++) {
+                let old_mesh = this.mesh_list[i];
+                let mesh = new PuzzleMesh(puzzle_data.mesh_list[i], this.puzzle_buffers);
+                mat4.copy(mesh.permutation_transform, old_mesh.permutation_transform);
+                vec3.copy(mesh.animation_center, old_mesh.animation_center);
+                vec3.copy(mesh.animation_axis, old_mesh.animation_axis);
+                mesh.animation_angle = old_mesh.animation_angle;
+                mesh.highlight = old_mesh.highlight;
+                old_mesh.release();
+                this.mesh_list[i] = mesh;
+            }
+            if(old_puzzle_buffers)
+                old_puzzle_buffers.release();
+            this.full_detail = true;
+            render_scene();
+        }, () => {
+            // The request already told the user what went wrong.
+            if(puzzle === this)
+                this.give_up_full_detail();
+        });
+    }
+
+    give_up_full_detail() {
+        // Rather than leave queued moves waiting forever for geometry that isn't coming, we carry on with the coarse
+        // pieces.  Their outlines are exactly those of the full-detail pieces, so bandaging comes out the same.
+        console.log('Carrying on with the coarse level of detail of ' + this.name + '.');
+        this.full_detail_failed = true;
+    }
     
     render(reflect) {
         gl.useProgram(puzzle_shader.program);
@@ -638,6 +878,9 @@ class Puzzle {
         let transform_matrix_loc = gl.getUniformLocation(puzzle_shader.program, 'transform_matrix');
         gl.uniformMatrix4fv(transform_matrix_loc, false, transform_matrix);
 
+        if(this.puzzle_buffers)
+            this.puzzle_buffers.bind();
+
         for(let i = 0; i < this.mesh_list.length; i++) {
             let mesh = this.mesh_list[i];
             mesh.render(this.custom_texture_list);
@@ -804,7 +1047,8 @@ class Puzzle {
         });
         let capture_core_too = false;
         captured_mesh_set.forEach(mesh => {
-            if(mesh.triangle_list.length === 1)
+            // The core is marked in the puzzle file, or, in files from before it was, is the only single triangle.
+            if(mesh.special_case_data ? mesh.special_case_data.core : mesh.triangle_count === 1)
                 capture_core_too = true;
         });
         if(capture_core_too) {
@@ -933,6 +1177,10 @@ class Puzzle {
                 mesh.advance_animation();
             });
             return true;
+        } else if(this.bandages && !this.full_detail && !this.full_detail_failed) {
+            // Bandaging is checked against the vertices of each piece, and a coarse piece has fewer of those.
+            // Queued moves wait for the full-detail geometry so that they're constrained exactly as they'd otherwise be.
+            return false;
         } else {
             return viewModel.process_move_queue(); 
         }
@@ -0,0 +1,161 @@
+# puzzle_playback.py
+
+import math
+import time
+import random
+
+import numpy
+
+# This applies moves to a puzzle the way the page does, from nothing more than the puzzle's file.  Each piece keeps a
+# permutation transform, starting at the identity, and a move multiplies the transforms of the pieces its generator
+# captures by the generator's rotation.  A piece is captured when its center, as transformed so far, is inside all the
+# planes of the generator, or the exact surface it was cut against, or as decided by the generator's capture tree.  The
+# rotations for each generator, and their inverses, are worked out once up front, and the transformed piece centers
+# are kept up to date as moves are applied, so that applying a move is a few array operations.  Puzzle-specific capture
+# rules on the page, such as the WormHoleII's core and bandaging, aren't reproduced here.
+
+def make_rotation_about_center(center, axis, angle):
+    # The same 4x4 matrix, for column vectors, as mat4_rotate_about_center in the page.
+    axis = numpy.array(axis, dtype=numpy.float64)
+    axis /= numpy.linalg.norm(axis)
+    x, y, z = axis
+    c = math.cos(angle)
+    s = math.sin(angle)
+    t = 1.0 - c
+    rotation = numpy.array([
+        [t * x * x + c, t * x * y - s * z, t * x * z + s * y],
+        [t * x * y + s * z, t * y * y + c, t * y * z - s * x],
+        [t * x * z - s * y, t * y * z + s * x, t * z * z + c]
+    ])
+    center = numpy.array(center, dtype=numpy.float64)
+    matrix = numpy.identity(4)
+    matrix[:3, :3] = rotation
+    matrix[:3, 3] = center - rotation @ center
+    return matrix
+
+def _to_array(vector_data):
+    return numpy.array([vector_data['x'], vector_data['y'], vector_data['z']], dtype=numpy.float64)
+
+class PlaybackGenerator(object):
+    def __init__(self, generator_data):
+        self.fixed_label = generator_data.get('fixed_label', '')
+        self.pick_point = generator_data.get('pick_point')
+        self.capture_tree_root = generator_data.get('capture_tree_root')
+        self.center = _to_array(generator_data['center'])
+        self.axis = _to_array(generator_data['axis'])
+        self.angle = generator_data['angle']
+        plane_list = generator_data.get('plane_list', [])
+        self.plane_center_array = numpy.array([_to_array(plane['center']) for plane in plane_list]).reshape((-1, 3))
+        self.plane_normal_array = numpy.array([_to_array(plane['unit_normal']) for plane in plane_list]).reshape((-1, 3))
+        # Generators cut against an exact surface are tested against that surface, not their planes, as on the page.
+        self.surface = generator_data.get('surface')
+        # A move rotates by the negative of the generator's angle, and its inverse by the angle itself, as on the page.
+        self.transform = make_rotation_about_center(self.center, self.axis, -self.angle)
+        self.inverse_transform = make_rotation_about_center(self.center, self.axis, self.angle)
+
+    def find_inside(self, point_array, eps=1e-7):
+        # Tell which of the given points are inside the convex region bounded by our planes, or inside our surface.
+        if self.surface is not None:
+            return self.calc_surface_distance(point_array) < -eps
+        if len(self.plane_center_array) == 0:
+            return numpy.zeros(len(point_array), dtype=bool)
+        distance_array = numpy.einsum('npk,pk->np', point_array[:, None, :] - self.plane_center_array[None, :, :], self.plane_normal_array)
+        return distance_array.max(axis=1) < -eps
+
+    def calc_surface_distance(self, point_array):
+        surface = self.surface
+        vector_array = point_array - _to_array(surface['center'])
+        if surface['type'] == 'plane':
+            distance_array = vector_array @ _to_array(surface['unit_normal'])
+        else:
+            if surface['type'] == 'cylinder':
+                unit_axis = _to_array(surface['unit_axis'])
+                vector_array = vector_array - numpy.outer(vector_array @ unit_axis, unit_axis)
+            distance_array = numpy.linalg.norm(vector_array, axis=1) - surface['radius']
+        return surface['sign'] * distance_array
+
+class PuzzlePlayback(object):
+    def __init__(self, puzzle_data):
+        self.generator_list = [PlaybackGenerator(generator_data) for generator_data in puzzle_data.get('generator_mesh_list', [])]
+        self.center_array = numpy.zeros((0, 3))
+        self.transform_array = numpy.zeros((0, 4, 4))
+        self.move_time_list = []
+        self.add_mesh_data_list(puzzle_data.get('mesh_list', []))
+
+    def add_mesh_data_list(self, mesh_data_list):
+        # Pieces can be added as they're loaded, in order, but only before any move is applied.
+        center_array = numpy.array([_to_array(mesh_data['center']) for mesh_data in mesh_data_list]).reshape((-1, 3))
+        self.center_array = numpy.concatenate([self.center_array, center_array])
+        self.transform_array = numpy.concatenate([self.transform_array, numpy.tile(numpy.identity(4), (len(center_array), 1, 1))])
+
+    def find_generator(self, label):
+        for i, generator in enumerate(self.generator_list):
+            if generator.fixed_label == label:
+                return i
+        raise Exception('No generator is labeled "%s".' % label)
+
+    def parse_move_sequence(self, sequence_text):
+        # Moves are generator labels separated by commas, each optionally preceded by a count and followed by a
+        # prime for the inverse, as in "R, 2U, F'".  The page's fuller sequence language isn't supported here.
+        move_list = []
+        for token in sequence_text.replace(' ', '').split(','):
+            if len(token) == 0:
+                continue
+            inverse = token.endswith("'")
+            token = token.rstrip("'")
+            digit_count = len(token) - len(token.lstrip('0123456789'))
+            move_count = int(token[:digit_count]) if digit_count > 0 else 1
+            move_list += [(self.find_generator(token[digit_count:]), inverse)] * move_count
+        return move_list
+
+    def make_scramble(self, move_count, seed=None):
+        # Random moves of generators that can be picked on the page, never the same generator twice in a row.
+        rng = random.Random(seed)
+        pickable_list = [i for i, generator in enumerate(self.generator_list) if generator.pick_point is not None]
+        move_list = []
+        for j in range(move_count):
+            choice_list = [i for i in pickable_list if len(move_list) == 0 or i != move_list[-1][0]]
+            if len(choice_list) == 0:
+                break
+            move_list.append((rng.choice(choice_list), rng.random() > 0.5))
+        return move_list
+
+    def find_captured_meshes(self, generator_index):
+        generator = self.generator_list[generator_index]
+        if generator.capture_tree_root is not None:
+            return sorted(self._execute_capture_tree(generator.capture_tree_root))
+        return numpy.nonzero(generator.find_inside(self.center_array))[0].tolist()
+
+    def _execute_capture_tree(self, node):
+        if node.get('op') is not None:
+            child_set_list = [self._execute_capture_tree(child) for child in node['children']]
+            if len(child_set_list) == 0:
+                return set()
+            if node['op'] == 'union':
+                return set().union(*child_set_list)
+            if node['op'] == 'intersection':
+                return child_set_list[0].intersection(*child_set_list[1:])
+            if node['op'] == 'subtract':
+                return child_set_list[0].difference(*child_set_list[1:])
+            raise Exception('Unknown capture tree operation: %s' % node['op'])
+        if isinstance(node.get('mesh'), int):
+            return set(numpy.nonzero(self.generator_list[node['mesh']].find_inside(self.center_array))[0].tolist())
+        return set()
+
+    def apply_move(self, generator_index, inverse=False):
+        # Return the indices of the pieces moved.  The time taken is kept, so that it can be reported.
+        start_time = time.perf_counter()
+        generator = self.generator_list[generator_index]
+        captured_list = self.find_captured_meshes(generator_index)
+        if len(captured_list) > 0:
+            transform = generator.inverse_transform if inverse else generator.transform
+            self.transform_array[captured_list] = transform @ self.transform_array[captured_list]
+            self.center_array[captured_list] = self.center_array[captured_list] @ transform[:3, :3].T + transform[:3, 3]
+        self.move_time_list.append(time.perf_counter() - start_time)
+        return captured_list
+
+    def calc_animation_transform(self, generator_index, inverse, fraction_left):
+        # The rotation still to go, with the given fraction of the move left, about the generator's axis.
+        generator = self.generator_list[generator_index]
+        move_angle = generator.angle if inverse else -generator.angle
+        return make_rotation_about_center(generator.center, generator.axis, -move_angle * fraction_left)
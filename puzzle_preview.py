@@ -4,6 +4,9 @@ import argparse
 import sys
 import json
 import gzip
+import math
+import time
+import threading
 
 sys.path.append(r'c:\dev\pyMath3d')
 
@@ -18,40 +21,229 @@ from math3d_transform import AffineTransform, LinearTransform
 from math3d_point_cloud import PointCloud
 
 class PuzzlePreview(object):
-    def __init__(self, puzzle_class_name):
-        from puzzle_generator import ColoredMesh
-
+    # The puzzle is loaded by a worker thread, so that the window comes up right away.  The file has to be parsed as a
+    # whole, but the meshes are built one at a time after that, which is most of the work, and handed over as they're
+    # done.  The window takes whatever meshes are ready each time it ticks, so the puzzle fills in as it loads.
+    def __init__(self, puzzle_class_name, use_buffers=True):
         self.mesh_list = []
+        self.pending_mesh_list = []
+        self.pending_lock = threading.Lock()
+        self.loaded = False
+        self.load_error = None
+        self.start_time = time.perf_counter()
+        self.first_frame_seconds = None
+        self.load_seconds = None
+
+        # Moves are queued, and only played once the whole puzzle is here, since they may capture any piece.
+        self.playback = None
+        self.move_request = None
+        self.move_queue = []
+        self.moved = False
+        self.current_move = None
+        self.animate = True
+        self.radians_per_second = math.pi
+
+        # The buffers can only be made once there's a GL context, so that waits for the first frame.
+        self.use_buffers = use_buffers
+        self.vertex_buffer_renderer = None
+        self.buffers_stale = True
+
         puzzle_path = 'puzzles/' + puzzle_class_name + '.json.gz'
-        with gzip.open(puzzle_path, 'rb') as handle:
-            json_bytes = handle.read()
+        self.load_thread = threading.Thread(target=self._load, args=(puzzle_path,), daemon=True)
+        self.load_thread.start()
+
+    def _load(self, puzzle_path):
+        from puzzle_generator import ColoredMesh
+        from puzzle_buffers import unpack_puzzle_data
+        from puzzle_playback import PuzzlePlayback
+
+        try:
+            with gzip.open(puzzle_path, 'rb') as handle:
+                json_bytes = handle.read()
             json_text = json_bytes.decode('utf-8')
-            puzzle_data = json.loads(json_text)
-            for mesh_data in puzzle_data.get('mesh_list', []):
+            puzzle_data = unpack_puzzle_data(json.loads(json_text))
+            print('Parsed %s in %f seconds.' % (puzzle_path, time.perf_counter() - self.start_time))
+            mesh_data_list = puzzle_data.get('mesh_list', [])
+            self.playback = PuzzlePlayback({'generator_mesh_list': puzzle_data.get('generator_mesh_list', [])})
+            self.playback.add_mesh_data_list(mesh_data_list)
+            for mesh_data in mesh_data_list:
                 mesh = ColoredMesh().from_dict(mesh_data)
-                self.mesh_list.append(mesh)
+                with self.pending_lock:
+                    self.pending_mesh_list.append(mesh)
+        except Exception as error:
+            self.load_error = error
+            raise
+        finally:
+            with self.pending_lock:
+                self.loaded = True
+
+    def take_pending_meshes(self):
+        # Return the number of meshes newly taken over from the loader.
+        with self.pending_lock:
+            mesh_list = self.pending_mesh_list
+            self.pending_mesh_list = []
+            loaded = self.loaded
+        self.mesh_list += mesh_list
+        if len(mesh_list) > 0:
+            self.buffers_stale = True
+        if loaded and self.load_seconds is None and self.load_error is None:
+            self.load_seconds = time.perf_counter() - self.start_time
+            print('Loaded %d meshes in %f seconds.' % (len(self.mesh_list), self.load_seconds))
+            if self.move_request is not None:
+                sequence_text, scramble_count, seed = self.move_request
+                if scramble_count > 0:
+                    self.move_queue += self.playback.make_scramble(scramble_count, seed)
+                if sequence_text:
+                    self.move_queue += self.playback.parse_move_sequence(sequence_text)
+        return len(mesh_list)
+
+    def is_loaded(self):
+        return self.load_seconds is not None
+
+    def queue_moves(self, sequence_text=None, scramble_count=0, seed=None, animate=True):
+        # The moves are worked out once the generators have been loaded.  A scramble comes before any given sequence.
+        self.move_request = (sequence_text, scramble_count, seed)
+        self.animate = animate
+
+    def advance(self, seconds):
+        # Carry on with the current move, or start on the next, and tell whether anything needs redrawing.
+        if not self.is_loaded():
+            return False
+        if self.current_move is not None:
+            generator_index, inverse, captured_list, fraction_left = self.current_move
+            angle = math.fabs(self.playback.generator_list[generator_index].angle)
+            fraction_left -= self.radians_per_second * seconds / angle if angle > 0.0 else 1.0
+            self.current_move = (generator_index, inverse, captured_list, fraction_left) if fraction_left > 0.0 else None
+            return True
+        if len(self.move_queue) == 0:
+            return False
+        while len(self.move_queue) > 0:
+            generator_index, inverse = self.move_queue.pop(0)
+            captured_list = self.playback.apply_move(generator_index, inverse)
+            self.moved = True
+            label = self.playback.generator_list[generator_index].fixed_label + ("'" if inverse else '')
+            print('Applied move %s to %d pieces in %f ms.' % (label, len(captured_list), self.playback.move_time_list[-1] * 1000.0))
+            if self.animate:
+                self.current_move = (generator_index, inverse, captured_list, 1.0)
+                break
+        if len(self.move_queue) == 0:
+            move_time_list = self.playback.move_time_list
+            print('Applied %d moves, taking %f ms on average and %f ms at most.' % (
+                len(move_time_list), 1000.0 * sum(move_time_list) / len(move_time_list), 1000.0 * max(move_time_list)))
+        return True
+
+    def make_transform_list(self):
+        # Each mesh is drawn under its permutation transform, and any of those being animated, under what's left of
+        # the move's rotation too.  Until a move is made, everything is drawn where it is.
+        if not self.moved:
+            return None
+        transform_array = self.playback.transform_array
+        if self.current_move is not None:
+            generator_index, inverse, captured_list, fraction_left = self.current_move
+            animation_transform = self.playback.calc_animation_transform(generator_index, inverse, fraction_left)
+            transform_array = transform_array.copy()
+            transform_array[captured_list] = animation_transform @ transform_array[captured_list]
+        return transform_array
 
     def render(self):
+        if len(self.mesh_list) > 0 and self.first_frame_seconds is None:
+            self.first_frame_seconds = time.perf_counter() - self.start_time
+            print('Drew the first frame, with %d meshes, after %f seconds.' % (len(self.mesh_list), self.first_frame_seconds))
+
+        transform_list = self.make_transform_list()
+
+        if self.use_buffers:
+            if self.vertex_buffer_renderer is None:
+                from puzzle_vbo import VertexBufferRenderer
+                self.vertex_buffer_renderer = VertexBufferRenderer()
+            if self.buffers_stale:
+                self.vertex_buffer_renderer.upload(self.mesh_list)
+                self.buffers_stale = False
+            self.vertex_buffer_renderer.render(transform_list)
+            return
+
         glEnable(GL_LIGHTING)
 
-        for mesh in self.mesh_list:
-            mesh.render()
+        for i, mesh in enumerate(self.mesh_list):
+            self._render_mesh(mesh, transform_list, i, mesh.render)
 
         glDisable(GL_LIGHTING)
 
-        for mesh in self.mesh_list:
-            mesh.render_border()
+        for i, mesh in enumerate(self.mesh_list):
+            self._render_mesh(mesh, transform_list, i, mesh.render_border)
+
+    def _render_mesh(self, mesh, transform_list, i, render_func):
+        if transform_list is None:
+            render_func()
+            return
+        glPushMatrix()
+        try:
+            glMultMatrixd(transform_list[i].T.ravel())
+            render_func()
+        finally:
+            glPopMatrix()
+
+class FrameTimer(object):
+    # Keep the times taken to draw the last so many frames, and the times at which they were drawn, to report both
+    # how long a frame takes us and how many frames we actually get per second.
+    def __init__(self, frame_count=60):
+        self.frame_count = frame_count
+        self.draw_time_list = []
+        self.frame_time_list = []
+
+    def add_frame(self, draw_seconds):
+        self.draw_time_list = (self.draw_time_list + [draw_seconds])[-self.frame_count:]
+        self.frame_time_list = (self.frame_time_list + [time.perf_counter()])[-self.frame_count:]
+
+    def calc_fps(self):
+        if len(self.frame_time_list) < 2:
+            return 0.0
+        return (len(self.frame_time_list) - 1) / (self.frame_time_list[-1] - self.frame_time_list[0])
+
+    def calc_draw_milliseconds(self):
+        if len(self.draw_time_list) == 0:
+            return 0.0
+        return 1000.0 * sum(self.draw_time_list) / len(self.draw_time_list)
+
+    def make_label(self):
+        return '%.1f FPS, %.2f ms/frame' % (self.calc_fps(), self.calc_draw_milliseconds())
 
 class PreviewWindow(QtGui.QOpenGLWindow):
-    def __init__(self, puzzle_class_name, parent=None):
+    def __init__(self, puzzle_class_name, use_buffers=True, spin=False, sequence_text=None, scramble_count=0, seed=None, animate=True, parent=None):
         super().__init__(parent)
 
         self.orient = Vector(0.0, 0.0, 0.0)
         self.dragging_mouse = False
         self.drag_pos = None
         self.zoom = 5.0
+        self.frame_timer = FrameTimer()
         
-        self.puzzle_preview = PuzzlePreview(puzzle_class_name)
+        self.puzzle_preview = PuzzlePreview(puzzle_class_name, use_buffers)
+        self.puzzle_preview.queue_moves(sequence_text, scramble_count, seed, animate)
+
+        # Each tick takes on whatever has loaded since the last, and moves any animation along.
+        self.tick_time = time.perf_counter()
+        self.tick_timer = QtCore.QTimer()
+        self.tick_timer.timeout.connect(self.tick)
+        self.tick_timer.start(16)
+
+        # Spinning the puzzle redraws it as fast as we can, which is what we want when measuring the frame rate.
+        self.spin = spin
+        if self.spin:
+            self.frameSwapped.connect(self.spin_puzzle)
+
+    def spin_puzzle(self):
+        self.orient.y += 1.0
+        self.update()
+
+    def tick(self):
+        tick_time = time.perf_counter()
+        seconds = tick_time - self.tick_time
+        self.tick_time = tick_time
+        changed = self.puzzle_preview.take_pending_meshes() > 0
+        changed = self.puzzle_preview.advance(seconds) or changed
+        if changed:
+            self.update()
 
     def initializeGL(self):
         glEnable(GL_DEPTH_TEST)
@@ -73,6 +265,14 @@ class PreviewWindow(QtGui.QOpenGLWindow):
         glCullFace(GL_BACK)
 
     def paintGL(self):
+        start_time = time.perf_counter()
+
+        # Painting the overlay last frame will have reset some of our state.
+        glEnable(GL_DEPTH_TEST)
+        glEnable(GL_CULL_FACE)
+        glEnable(GL_BLEND)
+        glBlendFunc(GL_SRC_ALPHA, GL_ONE_MINUS_SRC_ALPHA)
+
         glClear(GL_COLOR_BUFFER_BIT | GL_DEPTH_BUFFER_BIT)
 
         viewport = glGetIntegerv(GL_VIEWPORT)
@@ -98,7 +298,19 @@ class PreviewWindow(QtGui.QOpenGLWindow):
 
         glPopMatrix()
 
-        glFlush()
+        # Wait for the GPU, so that the time we take covers the drawing itself, not just the issuing of the calls.
+        glFinish()
+        self.frame_timer.add_frame(time.perf_counter() - start_time)
+
+        painter = QtGui.QPainter(self)
+        try:
+            painter.setPen(QtGui.QColor(255, 255, 255))
+            label = self.frame_timer.make_label()
+            if not self.puzzle_preview.is_loaded():
+                label += ', loading (%d meshes so far)' % len(self.puzzle_preview.mesh_list)
+            painter.drawText(10, 20, label)
+        finally:
+            painter.end()
 
     def resizeGL(self, width, height):
         pass #glViewport(0, 0, width, height)
@@ -139,11 +351,18 @@ if __name__ == '__main__':
 
     arg_parser = argparse.ArgumentParser()
     arg_parser.add_argument('puzzle', help='Specify which puzzle to preview.', type=str)
+    arg_parser.add_argument('--immediate', help='Draw in immediate mode instead of from vertex buffers.', action='store_true')
+    arg_parser.add_argument('--spin', help='Keep the puzzle spinning, redrawing it continuously.', action='store_true')
+    arg_parser.add_argument('--moves', help='Comma-separated generator labels to play once loaded, as in "a, 2b, c\'".', type=str)
+    arg_parser.add_argument('--scramble', help='Number of random moves to play once loaded, before any others.', type=int, default=0)
+    arg_parser.add_argument('--seed', help='Seed for the random moves.', type=int)
+    arg_parser.add_argument('--no-animate', help='Apply the moves all at once instead of animating them.', action='store_true')
     args = arg_parser.parse_args()
 
     app = QtGui.QGuiApplication(sys.argv)
 
-    win = PreviewWindow(args.puzzle)
+    win = PreviewWindow(args.puzzle, use_buffers=not args.immediate, spin=args.spin, sequence_text=args.moves,
+                        scramble_count=args.scramble, seed=args.seed, animate=not args.no_animate)
     win.resize(640, 480)
     win.show()
 
@@ -0,0 +1,160 @@
+# puzzle_profile.py
+
+import os
+import json
+import time
+
+# Profiling is switched on by setting the PUZZLE_PROFILE environment variable to a comma-separated list of
+# options.  Any non-empty value turns on span tracing.  The "tracemalloc" option also records memory allocated
+# within each span, and the "cprofile" option runs cProfile for each top-level span.  Results are written to the
+# directory named by PUZZLE_PROFILE_DIR, or "profiles" by default, as a Chrome trace-event file (load it in
+# chrome://tracing or Perfetto), a collapsed-stack file (feed it to flamegraph.pl or speedscope), and for
+# cProfile, a stats file.  When profiling is off, spans and counters cost next to nothing.
+
+class _NullSpan(object):
+    def __enter__(self):
+        return self
+
+    def __exit__(self, type, exc, tb):
+        pass
+
+class _Span(object):
+    def __init__(self, profiler, name, args):
+        self.profiler = profiler
+        self.name = name
+        self.args = args
+        self.counter_map = {}
+        self.start_time = None
+        self.child_seconds = 0.0
+        self.memory_start = None
+
+    def __enter__(self):
+        self.profiler.enter_span(self)
+        return self
+
+    def __exit__(self, type, exc, tb):
+        self.profiler.exit_span(self)
+
+class _Profiler(object):
+    def __init__(self, option_list, output_dir):
+        self.output_dir = output_dir
+        self.use_tracemalloc = 'tracemalloc' in option_list
+        self.use_cprofile = 'cprofile' in option_list
+        self.origin_time = time.perf_counter()
+        self.span_stack = []
+        self.event_list = []
+        self.collapsed_map = {}
+        self.cprofile = None
+        if self.use_tracemalloc:
+            import tracemalloc
+            self.tracemalloc = tracemalloc
+            if not tracemalloc.is_tracing():
+                tracemalloc.start()
+
+    def enter_span(self, span):
+        if len(self.span_stack) == 0:
+            self.event_list = []
+            self.collapsed_map = {}
+            if self.use_cprofile:
+                import cProfile
+                self.cprofile = cProfile.Profile()
+                self.cprofile.enable()
+        self.span_stack.append(span)
+        if self.use_tracemalloc:
+            span.memory_start = self.tracemalloc.get_traced_memory()[0]
+        span.start_time = time.perf_counter()
+
+    def exit_span(self, span):
+        stop_time = time.perf_counter()
+        seconds = stop_time - span.start_time
+        stack_name = ';'.join([entry.name for entry in self.span_stack])
+        self.span_stack.pop()
+        args = dict(span.args)
+        args.update(span.counter_map)
+        if self.use_tracemalloc:
+            args['allocated_bytes'] = self.tracemalloc.get_traced_memory()[0] - span.memory_start
+        self.event_list.append({
+            'name': span.name,
+            'ph': 'X',
+            'ts': (span.start_time - self.origin_time) * 1e6,
+            'dur': seconds * 1e6,
+            'pid': os.getpid(),
+            'tid': 0,
+            'args': args
+        })
+        self.collapsed_map[stack_name] = self.collapsed_map.get(stack_name, 0.0) + seconds - span.child_seconds
+        if len(self.span_stack) > 0:
+            parent = self.span_stack[-1]
+            parent.child_seconds += seconds
+            # Counters roll up, so that each span reports the totals for everything beneath it.
+            for name, value in span.counter_map.items():
+                parent.counter_map[name] = parent.counter_map.get(name, 0) + value
+        else:
+            self.write_output(span.name)
+
+    def count(self, name, value):
+        if len(self.span_stack) > 0:
+            counter_map = self.span_stack[-1].counter_map
+            counter_map[name] = counter_map.get(name, 0) + value
+
+    def write_output(self, name):
+        os.makedirs(self.output_dir, exist_ok=True)
+        path = os.path.join(self.output_dir, name)
+        with open(path + '.trace.json', 'w') as handle:
+            handle.write(json.dumps({'traceEvents': self.event_list, 'displayTimeUnit': 'ms'}))
+        with open(path + '.collapsed.txt', 'w') as handle:
+            for stack_name in sorted(self.collapsed_map):
+                # Flamegraph tools want integer sample counts, so we use microseconds.
+                handle.write('%s %d\n' % (stack_name, int(self.collapsed_map[stack_name] * 1e6)))
+        if self.cprofile is not None:
+            self.cprofile.disable()
+            self.cprofile.dump_stats(path + '.prof')
+            self.cprofile = None
+        print('Wrote profile: %s.*' % path)
+
+def _make_profiler():
+    option_text = os.environ.get('PUZZLE_PROFILE', '')
+    if option_text == '' or option_text == '0':
+        return None
+    option_list = [option.strip().lower() for option in option_text.split(',')]
+    return _Profiler(option_list, os.environ.get('PUZZLE_PROFILE_DIR', 'profiles'))
+
+_profiler = _make_profiler()
+_null_span = _NullSpan()
+
+def span(name, **args):
+    # Time everything within the returned context as a span nested in whatever span is already open.
+    if _profiler is None:
+        return _null_span
+    return _Span(_profiler, name, args)
+
+def count(name, value=1):
+    # Add to the named counter of the innermost open span.
+    if _profiler is not None:
+        _profiler.count(name, value)
+
+def is_enabled():
+    return _profiler is not None
+
+class ProfileBlock(object):
+    # A phase that is always timed and printed, whether or not profiling is on, and nests like any other span.
+    # When this is set to a list, every block also appends its label and duration to it.
+    record_list = None
+
+    def __init__(self, label):
+        self.label = label
+        self.start_time = None
+        self.span = None
+
+    def __enter__(self):
+        self.span = span(self.label)
+        self.span.__enter__()
+        self.start_time = time.perf_counter()
+        return self
+
+    def __exit__(self, type, exc, tb):
+        total_seconds = time.perf_counter() - self.start_time
+        self.span.__exit__(type, exc, tb)
+        print('%s: %f seconds' % (self.label, total_seconds))
+        if ProfileBlock.record_list is not None:
+            ProfileBlock.record_list.append((self.label, total_seconds))
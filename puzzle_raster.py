@@ -0,0 +1,256 @@
+# puzzle_raster.py
+
+import math
+import zlib
+import struct
+
+import numpy
+
+# This draws a list of colored meshes, and their border loops, the way the menu's GL window does, but entirely on the
+# CPU, so that thumbnails can be made without a display or a GPU.  Triangles are rasterized in batches with numpy:
+# those with bounding boxes of about the same size are stamped out together, every covered pixel becomes a fragment,
+# and the nearest fragment at each pixel wins.  Depth is compared as the reciprocal of distance from the eye, which
+# unlike distance itself, varies linearly across a triangle on the screen.
+
+def make_rotation_matrix(orient):
+    # The same rotations, in the same order, as glRotatef about the X, Y and Z axes, given in degrees.
+    x, y, z = [math.radians(angle) for angle in orient]
+    x_matrix = numpy.array([[1.0, 0.0, 0.0], [0.0, math.cos(x), -math.sin(x)], [0.0, math.sin(x), math.cos(x)]])
+    y_matrix = numpy.array([[math.cos(y), 0.0, math.sin(y)], [0.0, 1.0, 0.0], [-math.sin(y), 0.0, math.cos(y)]])
+    z_matrix = numpy.array([[math.cos(z), -math.sin(z), 0.0], [math.sin(z), math.cos(z), 0.0], [0.0, 0.0, 1.0]])
+    return x_matrix @ y_matrix @ z_matrix
+
+class Camera(object):
+    # A camera looking down the negative Z axis from the given distance, as set up by gluLookAt and gluPerspective.
+    def __init__(self, width, height, orient=(35.0, -45.0, 0.0), eye_distance=4.0, fovy=60.0, near=0.1):
+        self.width = width
+        self.height = height
+        self.rotation = make_rotation_matrix(orient)
+        self.eye_distance = eye_distance
+        self.focal_length = 1.0 / math.tan(math.radians(fovy) / 2.0)
+        self.near = near
+
+    def project(self, point_array):
+        # Return screen X and Y, with Y down as in the image, along with the reciprocal of the distance along the view.
+        view_array = point_array @ self.rotation.T
+        distance = self.eye_distance - view_array[:, 2]
+        inverse_distance = 1.0 / numpy.maximum(distance, self.near)
+        aspect_ratio = float(self.width) / float(self.height)
+        x = (1.0 + self.focal_length / aspect_ratio * view_array[:, 0] * inverse_distance) * self.width / 2.0
+        y = (1.0 - self.focal_length * view_array[:, 1] * inverse_distance) * self.height / 2.0
+        return x, y, inverse_distance, distance >= self.near
+
+def render_mesh_list(mesh_list, width=512, height=512, line_width=4.0, background=(0.0, 0.0, 0.0), max_fragments=1 << 20):
+    # Return an RGB image as a height by width by 3 array of bytes.  Meshes with zero alpha are hidden, just as in GL.
+    camera = Camera(width, height)
+    depth_buffer = numpy.zeros(width * height)
+    color_buffer = numpy.tile(numpy.array(_to_bytes(background), dtype=numpy.uint8), (width * height, 1))
+
+    mesh_list = [mesh for mesh in mesh_list if mesh.alpha > 0.0 and len(mesh.triangle_list) > 0]
+    if len(mesh_list) > 0:
+        _rasterize_triangles(camera, mesh_list, depth_buffer, color_buffer, max_fragments)
+        _rasterize_borders(camera, mesh_list, depth_buffer, color_buffer, line_width)
+
+    return color_buffer.reshape((height, width, 3))
+
+def _rasterize_triangles(camera, mesh_list, depth_buffer, color_buffer, max_fragments):
+    point_list = []
+    index_list = []
+    color_list = []
+    base = 0
+    for mesh in mesh_list:
+        point_list += [(vertex.x, vertex.y, vertex.z) for vertex in mesh.vertex_list]
+        index_list += [(triangle[0] + base, triangle[1] + base, triangle[2] + base) for triangle in mesh.triangle_list]
+        color_list += [_to_bytes((mesh.color.x, mesh.color.y, mesh.color.z))] * len(mesh.triangle_list)
+        base += len(mesh.vertex_list)
+    x, y, inverse_distance, visible = camera.project(numpy.array(point_list, dtype=numpy.float64))
+    index_array = numpy.array(index_list, dtype=numpy.int64)
+    color_array = numpy.array(color_list, dtype=numpy.uint8)
+
+    # Cull triangles behind the eye, and those facing away.  Counter-clockwise is front-facing in GL, but our Y is down.
+    keep = visible[index_array].all(axis=1)
+    x0, x1, x2 = [x[index_array[:, j]] for j in range(3)]
+    y0, y1, y2 = [y[index_array[:, j]] for j in range(3)]
+    area = (x1 - x0) * (y2 - y0) - (x2 - x0) * (y1 - y0)
+    keep &= area < 0.0
+    index_array = index_array[keep]
+    color_array = color_array[keep]
+    # Swap two corners so that the remaining triangles wind the way the edge functions below expect.
+    index_array = index_array[:, [0, 2, 1]]
+
+    # Find the range of pixel centers each triangle covers, and bucket the triangles by the size of that range.
+    triangle_x = x[index_array]
+    triangle_y = y[index_array]
+    min_x = numpy.maximum(numpy.ceil(triangle_x.min(axis=1) - 0.5), 0).astype(numpy.int64)
+    max_x = numpy.minimum(numpy.floor(triangle_x.max(axis=1) - 0.5), camera.width - 1).astype(numpy.int64)
+    min_y = numpy.maximum(numpy.ceil(triangle_y.min(axis=1) - 0.5), 0).astype(numpy.int64)
+    max_y = numpy.minimum(numpy.floor(triangle_y.max(axis=1) - 0.5), camera.height - 1).astype(numpy.int64)
+    triangle_depth = inverse_distance[index_array]
+    size = numpy.maximum(max_x - min_x, max_y - min_y) + 1
+    bucket = numpy.ceil(numpy.log2(numpy.maximum(size, 1))).astype(numpy.int64)
+
+    pixel_list = []
+    depth_list = []
+    triangle_list = []
+    for level in numpy.unique(bucket[size > 0]):
+        side = 1 << int(level)
+        selection = numpy.nonzero((bucket == level) & (size > 0))[0]
+        chunk_size = max(1, max_fragments // (side * side))
+        for start in range(0, len(selection), chunk_size):
+            chunk = selection[start:start + chunk_size]
+            pixel, depth, triangle = _stamp_triangles(chunk, side, triangle_x, triangle_y, triangle_depth, min_x, min_y, max_x, max_y, camera.width)
+            pixel_list.append(pixel)
+            depth_list.append(depth)
+            triangle_list.append(triangle)
+    if len(pixel_list) == 0:
+        return
+
+    pixel = numpy.concatenate(pixel_list)
+    depth = numpy.concatenate(depth_list)
+    triangle = numpy.concatenate(triangle_list)
+    order = numpy.lexsort((-depth, pixel))
+    pixel = pixel[order]
+    first = numpy.ones(len(pixel), dtype=bool)
+    first[1:] = pixel[1:] != pixel[:-1]
+    pixel = pixel[first]
+    depth_buffer[pixel] = depth[order][first]
+    color_buffer[pixel] = color_array[triangle[order][first]]
+
+def _stamp_triangles(chunk, side, triangle_x, triangle_y, triangle_depth, min_x, min_y, max_x, max_y, width):
+    offset = numpy.arange(side)
+    pixel_x = min_x[chunk][:, None, None] + offset[None, None, :]
+    pixel_y = min_y[chunk][:, None, None] + offset[None, :, None]
+    center_x = pixel_x + 0.5
+    center_y = pixel_y + 0.5
+    x0, x1, x2 = [triangle_x[chunk, j][:, None, None] for j in range(3)]
+    y0, y1, y2 = [triangle_y[chunk, j][:, None, None] for j in range(3)]
+    area = (x1 - x0) * (y2 - y0) - (x2 - x0) * (y1 - y0)
+    weight0 = ((x2 - x1) * (center_y - y1) - (y2 - y1) * (center_x - x1)) / area
+    weight1 = ((x0 - x2) * (center_y - y2) - (y0 - y2) * (center_x - x2)) / area
+    weight2 = 1.0 - weight0 - weight1
+    inside = (weight0 >= 0.0) & (weight1 >= 0.0) & (weight2 >= 0.0)
+    inside &= (pixel_x <= max_x[chunk][:, None, None]) & (pixel_y <= max_y[chunk][:, None, None])
+    depth = weight0 * triangle_depth[chunk, 0][:, None, None] + weight1 * triangle_depth[chunk, 1][:, None, None] + weight2 * triangle_depth[chunk, 2][:, None, None]
+    triangle = numpy.broadcast_to(chunk[:, None, None], inside.shape)
+    return (pixel_y * width + pixel_x)[inside], depth[inside], triangle[inside]
+
+def _rasterize_borders(camera, mesh_list, depth_buffer, color_buffer, line_width, scale=1.001, spacing=0.5):
+    # Border loops are drawn as black lines, pushed out a little so that they win the depth test against the faces
+    # they lie on.  Each segment is sampled finely enough on the screen that stamping a disc at each sample leaves
+    # no gaps.
+    start_list = []
+    end_list = []
+    for mesh in mesh_list:
+        for border_loop in mesh.border_loop_list:
+            for j in range(len(border_loop)):
+                start = mesh.vertex_list[border_loop[j]]
+                end = mesh.vertex_list[border_loop[(j + 1) % len(border_loop)]]
+                start_list.append((start.x * scale, start.y * scale, start.z * scale))
+                end_list.append((end.x * scale, end.y * scale, end.z * scale))
+    if len(start_list) == 0:
+        return
+    start_array = numpy.array(start_list)
+    end_array = numpy.array(end_list)
+
+    start_x, start_y, start_depth, start_visible = camera.project(start_array)
+    end_x, end_y, end_depth, end_visible = camera.project(end_array)
+    sample_count = numpy.ceil(numpy.hypot(end_x - start_x, end_y - start_y) / spacing).astype(numpy.int64) + 1
+    segment = numpy.repeat(numpy.arange(len(start_array)), sample_count)
+    first_sample = numpy.cumsum(sample_count) - sample_count
+    t = (numpy.arange(len(segment)) - first_sample[segment]) / numpy.maximum(sample_count[segment] - 1, 1)
+    sample_array = start_array[segment] + (end_array[segment] - start_array[segment]) * t[:, None]
+    x, y, depth, visible = camera.project(sample_array)
+    x, y, depth = x[visible], y[visible], depth[visible]
+
+    radius = line_width / 2.0
+    reach = int(math.ceil(radius))
+    offset_list = [(i, j) for i in range(-reach, reach + 1) for j in range(-reach, reach + 1) if i * i + j * j < radius * radius]
+    offset_x = numpy.array([offset[0] for offset in offset_list])
+    offset_y = numpy.array([offset[1] for offset in offset_list])
+    pixel_x = (numpy.floor(x)[:, None] + offset_x[None, :]).astype(numpy.int64).ravel()
+    pixel_y = (numpy.floor(y)[:, None] + offset_y[None, :]).astype(numpy.int64).ravel()
+    depth = numpy.repeat(depth, len(offset_list))
+    inside = (pixel_x >= 0) & (pixel_x < camera.width) & (pixel_y >= 0) & (pixel_y < camera.height)
+    pixel = pixel_y[inside] * camera.width + pixel_x[inside]
+    depth = depth[inside]
+    passed = depth >= depth_buffer[pixel]
+    color_buffer[pixel[passed]] = 0
+
+def write_png(path, image):
+    # Write an RGB image, given as a height by width by 3 array of bytes, using nothing but zlib.
+    height, width = image.shape[:2]
+    raw = numpy.zeros((height, width * 3 + 1), dtype=numpy.uint8)
+    raw[:, 1:] = image.reshape((height, width * 3))     # Each row starts with a zero byte for no filtering.
+    def chunk(kind, data):
+        return struct.pack('>I', len(data)) + kind + data + struct.pack('>I', zlib.crc32(kind + data) & 0xFFFFFFFF)
+    with open(path, 'wb') as handle:
+        handle.write(b'\x89PNG\r\n\x1a\n')
+        handle.write(chunk(b'IHDR', struct.pack('>IIBBBBB', width, height, 8, 2, 0, 0, 0)))
+        handle.write(chunk(b'IDAT', zlib.compress(raw.tobytes(), 9)))
+        handle.write(chunk(b'IEND', b''))
+
+def read_png(path):
+    # Read an 8-bit RGB or RGBA image, without interlacing, into a height by width by 3 array of bytes.  Any alpha is
+    # dropped.  Rows filtered by difference from the left or above are undone with numpy; the other two filters depend
+    # on the pixel to the left as it comes out, so they're undone a byte at a time.
+    with open(path, 'rb') as handle:
+        data = handle.read()
+    if data[:8] != b'\x89PNG\r\n\x1a\n':
+        raise Exception('Not a PNG file: %s' % path)
+    header = None
+    idat = b''
+    i = 8
+    while i < len(data):
+        length, = struct.unpack('>I', data[i:i + 4])
+        kind = data[i + 4:i + 8]
+        if kind == b'IHDR':
+            header = struct.unpack('>IIBBBBB', data[i + 8:i + 8 + length])
+        elif kind == b'IDAT':
+            idat += data[i + 8:i + 8 + length]
+        i += 12 + length
+    width, height, bit_depth, color_type, compression, filter_method, interlace = header
+    if bit_depth != 8 or color_type not in (2, 6) or interlace != 0:
+        raise Exception('Unsupported PNG format in %s' % path)
+    bpp = 3 if color_type == 2 else 4
+    raw = numpy.frombuffer(zlib.decompress(idat), dtype=numpy.uint8).reshape((height, width * bpp + 1))
+    image = numpy.zeros((height, width * bpp), dtype=numpy.uint8)
+    previous = numpy.zeros(width * bpp, dtype=numpy.uint8)
+    for y in range(height):
+        kind = raw[y, 0]
+        row = raw[y, 1:]
+        if kind == 0:
+            image[y] = row
+        elif kind == 1:
+            image[y] = numpy.cumsum(row.reshape((width, bpp)), axis=0, dtype=numpy.uint8).ravel()
+        elif kind == 2:
+            image[y] = row + previous
+        else:
+            image[y] = _unfilter_row(kind, row.tolist(), previous.tolist(), bpp)
+        previous = image[y]
+    return numpy.ascontiguousarray(image.reshape((height, width, bpp))[:, :, :3])
+
+def _unfilter_row(kind, row, previous, bpp):
+    for x in range(len(row)):
+        left = row[x - bpp] if x >= bpp else 0
+        up = previous[x]
+        if kind == 3:
+            row[x] = (row[x] + ((left + up) >> 1)) & 0xFF
+        elif kind == 4:
+            up_left = previous[x - bpp] if x >= bpp else 0
+            estimate = left + up - up_left
+            left_distance = abs(estimate - left)
+            up_distance = abs(estimate - up)
+            up_left_distance = abs(estimate - up_left)
+            if left_distance <= up_distance and left_distance <= up_left_distance:
+                predictor = left
+            elif up_distance <= up_left_distance:
+                predictor = up
+            else:
+                predictor = up_left
+            row[x] = (row[x] + predictor) & 0xFF
+        else:
+            raise Exception('Unknown PNG filter type: %d' % kind)
+    return row
+
+def _to_bytes(color):
+    return [int(round(min(max(component, 0.0), 1.0) * 255.0)) for component in color]
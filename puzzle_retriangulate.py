@@ -0,0 +1,218 @@
+# puzzle_retriangulate.py
+
+import math
+
+from puzzle_geometry import edge_key
+
+def retriangulate_coplanar_regions(mesh, eps=1e-6, removable_set=None):
+    # Repeated cutting leaves flat regions of a mesh covered by fans of slivers.  Here we find each maximal
+    # edge-connected region of coplanar triangles, walk its boundary, drop any vertex along that boundary
+    # that is collinear with its neighbors and not needed by the rest of the mesh, and then ear-clip the
+    # resulting polygon.  A simple polygon of n vertices always needs exactly n - 2 triangles.  Regions we
+    # can't handle losslessly (holes, pinched boundaries, degenerate polygons) are left untouched.
+    # Boundary vertices in the given removable set are dropped even if they aren't collinear; that is lossy,
+    # and is how the decimator simplifies outlines.  Returns the number of triangles removed from the mesh.
+    if removable_set is None:
+        removable_set = set()
+    vertex_list = mesh.vertex_list
+    triangle_list = mesh.triangle_list
+    if len(triangle_list) < 2:
+        return 0
+
+    normal_list = []
+    for triangle in triangle_list:
+        normal = (vertex_list[triangle[1]] - vertex_list[triangle[0]]).cross(vertex_list[triangle[2]] - vertex_list[triangle[0]])
+        length = normal.length()
+        normal_list.append(normal / length if length > eps * eps else None)
+
+    edge_map = {}
+    vertex_triangle_map = {}
+    for i, triangle in enumerate(triangle_list):
+        for j in range(3):
+            edge_map.setdefault(edge_key(triangle[j], triangle[(j + 1) % 3]), []).append(i)
+            vertex_triangle_map.setdefault(triangle[j], set()).add(i)
+
+    region_map = {}
+    region_list = []
+    for seed in range(len(triangle_list)):
+        if seed in region_map or normal_list[seed] is None:
+            continue
+        normal = normal_list[seed]
+        origin = vertex_list[triangle_list[seed][0]]
+        region = [seed]
+        region_map[seed] = len(region_list)
+        queue = [seed]
+        while len(queue) > 0:
+            i = queue.pop()
+            triangle = triangle_list[i]
+            for j in range(3):
+                for k in edge_map[edge_key(triangle[j], triangle[(j + 1) % 3])]:
+                    if k in region_map:
+                        continue
+                    if normal_list[k] is not None and normal_list[k].dot(normal) < 1.0 - eps:
+                        continue
+                    if any([math.fabs((vertex_list[index] - origin).dot(normal)) > eps for index in triangle_list[k]]):
+                        continue
+                    region_map[k] = len(region_list)
+                    region.append(k)
+                    queue.append(k)
+        region_list.append((region, normal))
+
+    new_triangle_list = []
+    handled_set = set()
+    for i in range(len(triangle_list)):
+        if i in handled_set:
+            continue
+        if i not in region_map:
+            new_triangle_list.append(triangle_list[i])
+            continue
+        region, normal = region_list[region_map[i]]
+        handled_set.update(region)
+        region_triangle_list = [triangle_list[j] for j in region]
+        result_list = None
+        if len(region) > 1:
+            result_list = _retriangulate_region(vertex_list, region_triangle_list, set(region), normal, vertex_triangle_map, removable_set, eps)
+        if result_list is not None and len(result_list) < len(region_triangle_list):
+            new_triangle_list += result_list
+        else:
+            new_triangle_list += region_triangle_list
+
+    removed_count = len(triangle_list) - len(new_triangle_list)
+    if removed_count > 0:
+        compact_mesh(mesh, new_triangle_list)
+    return removed_count
+
+def compact_mesh(mesh, triangle_list):
+    # Replace the triangles of the given mesh, dropping any vertices no longer referenced.
+    index_map = {}
+    vertex_list = []
+    new_triangle_list = []
+    for triangle in triangle_list:
+        new_triangle = []
+        for index in triangle:
+            if index not in index_map:
+                index_map[index] = len(vertex_list)
+                vertex_list.append(mesh.vertex_list[index])
+            new_triangle.append(index_map[index])
+        new_triangle_list.append(tuple(new_triangle))
+    mesh.vertex_list = vertex_list
+    mesh.triangle_list = new_triangle_list
+
+def _retriangulate_region(vertex_list, region_triangle_list, region_set, normal, vertex_triangle_map, removable_set, eps):
+    edge_set = set()
+    for triangle in region_triangle_list:
+        for j in range(3):
+            edge = (triangle[j], triangle[(j + 1) % 3])
+            if edge in edge_set:
+                return None     # The region isn't consistently wound.
+            edge_set.add(edge)
+
+    next_map = {}
+    for edge in edge_set:
+        if (edge[1], edge[0]) not in edge_set:
+            if edge[0] in next_map:
+                return None     # The boundary pinches at this vertex.
+            next_map[edge[0]] = edge[1]
+
+    if len(next_map) < 3:
+        return None
+
+    loop = [next(iter(next_map))]
+    while True:
+        index = next_map.get(loop[-1])
+        if index is None:
+            return None
+        if index == loop[0]:
+            break
+        if len(loop) > len(next_map):
+            return None
+        loop.append(index)
+
+    if len(loop) != len(next_map):
+        return None     # More than one boundary loop means the region has holes.
+
+    x_axis = vertex_list[region_triangle_list[0][1]] - vertex_list[region_triangle_list[0][0]]
+    x_axis = (x_axis - normal * x_axis.dot(normal)).normalized()
+    y_axis = normal.cross(x_axis)
+    point_map = {index: (vertex_list[index].dot(x_axis), vertex_list[index].dot(y_axis)) for index in loop}
+
+    # Drop collinear boundary vertices, but only those that no triangle outside this region depends upon.
+    lossless = True
+    while len(loop) > 3:
+        for j in range(len(loop)):
+            index = loop[j]
+            if not vertex_triangle_map[index].issubset(region_set):
+                continue
+            if index in removable_set:
+                lossless = False
+                del loop[j]
+                break
+            a, b, c = point_map[loop[j - 1]], point_map[index], point_map[loop[(j + 1) % len(loop)]]
+            if math.fabs(_cross(a, b, c)) <= eps * eps and (b[0] - a[0]) * (c[0] - b[0]) + (b[1] - a[1]) * (c[1] - b[1]) > 0.0:
+                del loop[j]
+                break
+        else:
+            break
+
+    result_list = _ear_clip(loop, point_map, eps)
+    if result_list is None:
+        return None
+
+    if lossless:
+        area = sum([_triangle_area(vertex_list, triangle) for triangle in region_triangle_list])
+    else:
+        area = math.fabs(sum([_cross((0.0, 0.0), point_map[loop[j - 1]], point_map[loop[j]]) for j in range(len(loop))])) / 2.0
+    new_area = sum([_triangle_area(vertex_list, triangle) for triangle in result_list])
+    if math.fabs(area - new_area) > eps * max(area, 1.0):
+        return None
+
+    return result_list
+
+def _ear_clip(loop, point_map, eps, best_ear_limit=64):
+    loop = list(loop)
+    result_list = []
+    while len(loop) > 3:
+        best_j = None
+        best_quality = -1.0
+        for j in range(len(loop)):
+            a, b, c = loop[j - 1], loop[j], loop[(j + 1) % len(loop)]
+            if _cross(point_map[a], point_map[b], point_map[c]) <= eps * eps:
+                continue
+            if any([_point_in_triangle(point_map[index], point_map[a], point_map[b], point_map[c], eps) for index in loop if index not in (a, b, c)]):
+                continue
+            # Prefer fat ears so that we don't just trade one set of slivers for another.
+            if len(loop) > best_ear_limit:
+                best_j = j
+                break
+            quality = _min_angle(point_map[a], point_map[b], point_map[c])
+            if quality > best_quality:
+                best_quality = quality
+                best_j = j
+        if best_j is None:
+            return None
+        result_list.append((loop[best_j - 1], loop[best_j], loop[(best_j + 1) % len(loop)]))
+        del loop[best_j]
+    if _cross(point_map[loop[0]], point_map[loop[1]], point_map[loop[2]]) <= eps * eps:
+        return None
+    result_list.append((loop[0], loop[1], loop[2]))
+    return result_list
+
+def _cross(a, b, c):
+    return (b[0] - a[0]) * (c[1] - a[1]) - (b[1] - a[1]) * (c[0] - a[0])
+
+def _point_in_triangle(p, a, b, c, eps):
+    return _cross(a, b, p) > -eps * eps and _cross(b, c, p) > -eps * eps and _cross(c, a, p) > -eps * eps
+
+def _min_angle(a, b, c):
+    angle_list = []
+    for p, q, r in [(a, b, c), (b, c, a), (c, a, b)]:
+        u = (q[0] - p[0], q[1] - p[1])
+        v = (r[0] - p[0], r[1] - p[1])
+        length = math.sqrt(u[0] * u[0] + u[1] * u[1]) * math.sqrt(v[0] * v[0] + v[1] * v[1])
+        if length == 0.0:
+            return 0.0
+        angle_list.append(math.acos(min(max((u[0] * v[0] + u[1] * v[1]) / length, -1.0), 1.0)))
+    return min(angle_list)
+
+def _triangle_area(vertex_list, triangle):
+    return (vertex_list[triangle[1]] - vertex_list[triangle[0]]).cross(vertex_list[triangle[2]] - vertex_list[triangle[0]]).length() / 2.0
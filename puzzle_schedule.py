@@ -0,0 +1,64 @@
+# puzzle_schedule.py
+
+import math
+
+# A cut schedule is a declarative alternative to overriding transform_meshes_for_more_cutting and
+# can_apply_cutmesh_for_pass.  It is a list of steps, each of which is one of the following.  Generators are
+# referred to by their index in the puzzle's generator mesh list.  Because the engine can see the whole schedule,
+# it can cancel and fuse rotations, skip cuts that could not change anything, and cut pieces in parallel.  The engine
+# itself is in puzzle_cutting.py, so that schedules can be written and simplified without pyMath3d.
+
+class Cut(object):
+    # Cut every piece against each of the given generators, in order, or against all of them if none are given.
+    # Pieces whose area falls below the puzzle's minimum are culled afterward, just as after a cut pass.
+    def __init__(self, generator_list=None):
+        self.generator_list = generator_list
+
+    def __repr__(self):
+        return 'Cut(%s)' % ('' if self.generator_list is None else repr(self.generator_list))
+
+class Apply(object):
+    # Apply the given generator to the pieces, the given number of times.
+    def __init__(self, generator, inverse=False, count=1):
+        self.generator = generator
+        self.inverse = inverse
+        self.count = count
+
+    def __repr__(self):
+        return 'Apply(%d%s%s)' % (self.generator, ', inverse=True' if self.inverse else '', ', count=%d' % self.count if self.count != 1 else '')
+
+def simplify_cut_schedule(schedule, generator_mesh_list, symmetric_set=frozenset()):
+    # Within each run of consecutive applications, merge neighboring applications of the same generator.  Turns in
+    # opposite directions cancel, and whole turns are dropped, only for generators in the given symmetric set, as
+    # found by find_symmetric_generators in puzzle_cutting.py.  Any other generator may capture different pieces
+    # after it turns than before, so turning it back, or all the way around, need not put them back where they were.
+    # Whether a piece is captured also depends on where earlier turns put it, so applications of different
+    # generators are never reordered.
+    simple_schedule = []
+    for step in schedule:
+        if isinstance(step, Cut):
+            simple_schedule.append(Cut(list(step.generator_list) if step.generator_list is not None else list(range(len(generator_mesh_list)))))
+            continue
+        symmetric = step.generator in symmetric_set
+        turns = -step.count if step.inverse else step.count
+        if len(simple_schedule) > 0 and isinstance(simple_schedule[-1], Apply) and simple_schedule[-1].generator == step.generator:
+            previous = simple_schedule[-1]
+            if symmetric or previous.inverse == step.inverse:
+                simple_schedule.pop()
+                turns += -previous.count if previous.inverse else previous.count
+        period = _calc_period(generator_mesh_list[step.generator].angle) if symmetric else None
+        if period is not None:
+            turns = turns % period
+            if turns > period // 2:
+                turns -= period
+        if turns != 0:
+            simple_schedule.append(Apply(step.generator, inverse=turns < 0, count=abs(turns)))
+    return simple_schedule
+
+def _calc_period(angle, eps=1e-6):
+    if angle == 0.0:
+        return None
+    period = 2.0 * math.pi / math.fabs(angle)
+    if math.fabs(period - round(period)) > eps:
+        return None
+    return int(round(period))
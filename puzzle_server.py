@@ -1,40 +1,406 @@
 # puzzle_server.py
 
+import argparse
 import os
-import cherrypy
+import sys
+import time
 import json
+import signal
+import socket
+import shutil
+import tempfile
+import threading
+import multiprocessing
+import cherrypy
+import cheroot.server
+import cheroot.wsgi
+
+from puzzle_bundle import BUNDLE_DIR, read_bundle_manifest, is_bundle_current
+from puzzle_metrics import registry
+from puzzle_archive import ARCHIVE_PATH, PuzzleArchive
+
+# In production, a master process binds the listening socket once and forks worker processes that each run their own
+# HTTP server, accepting from that one socket, and the master keeps the workers running.  A SIGHUP to the master, or a
+# change to the deployed files it's watching, replaces the workers one at a time, each new one serving before an old
+# one is told to finish its requests and go.  The socket stays open in the master all the while, so no connection is
+# refused along the way.  Where there's SO_REUSEPORT, workers can instead each bind a socket of their own to the same
+# port, which lets the kernel spread connections across them more evenly.  Without fork, as on Windows, there's just
+# the one worker.
+
+class PayloadCache(object):
+    # Puzzle files are served from memory, since neither CherryPy nor cheroot can hand a file to sendfile, and reading
+    # each from disk on every request is the next most expensive thing.  A file is read again whenever its time stamp
+    # or size changes, so that newly deployed puzzles are served without a restart.  Replacing a stale entry counts as
+    # an eviction.
+    def __init__(self):
+        self.payload_map = {}
+        self.lock = threading.Lock()
+        self.hit_count = 0
+        self.miss_count = 0
+        self.eviction_count = 0
+        self.byte_count = 0
+
+    @property
+    def entry_count(self):
+        return len(self.payload_map)
+
+    def get(self, path):
+        # Return the file's contents and modification time, or None if there's no such file.
+        try:
+            stat = os.stat(path)
+        except OSError:
+            return None
+        key = (stat.st_mtime_ns, stat.st_size)
+        with self.lock:
+            entry = self.payload_map.get(path)
+            if entry is not None and entry[0] == key:
+                self.hit_count += 1
+                return entry[1], entry[2]
+            self.miss_count += 1
+        with open(path, 'rb') as handle:
+            entry = (key, handle.read(), stat.st_mtime)
+        with self.lock:
+            old_entry = self.payload_map.get(path)
+            if old_entry is not None:
+                self.eviction_count += 1
+                self.byte_count -= len(old_entry[1])
+            self.payload_map[path] = entry
+            self.byte_count += len(entry[1])
+        return entry[1], entry[2]
 
 class PuzzleServer(object):
     def __init__(self, root_dir):
         self.root_dir = root_dir
+        self.payload_cache = PayloadCache()
+        registry.add_cache('payload', self.payload_cache)
+        # Puzzles are served from the archive built by puzzle_archive.py when it has them, and from their own files otherwise.
+        self.archive = PuzzleArchive(root_dir + '/' + ARCHIVE_PATH)
+        registry.add_cache('archive', self.archive, shared=True)
+        # The bundle built by puzzle_bundle.py is served in place of the loose page, but only while it matches its sources.
+        cwd = os.getcwd()
+        os.chdir(root_dir)
+        try:
+            self.bundle_manifest = read_bundle_manifest()
+            if self.bundle_manifest is not None and not is_bundle_current(self.bundle_manifest):
+                print('The bundle is out of date with its sources, so the page will be served unbundled.')
+                self.bundle_manifest = None
+        finally:
+            os.chdir(cwd)
 
     @cherrypy.expose
     def default(self, **kwargs):
+        if self.bundle_manifest is not None:
+            cherrypy.response.headers['Cache-Control'] = 'no-cache'
+            return self._serve_precompressed(self.root_dir + '/' + BUNDLE_DIR + '/' + self.bundle_manifest['html'], 'text/html')
         return cherrypy.lib.static.serve_file(self.root_dir + '/puzzle_page.html', content_type='text/html')
+
+    @cherrypy.expose
+    def bundle(self, name, **kwargs):
+        # The bundled script is named after a hash of its contents, so it never changes, and can be cached for good.
+        if self.bundle_manifest is None or name != self.bundle_manifest['script']:
+            raise cherrypy.NotFound()
+        cherrypy.response.headers['Cache-Control'] = 'public, max-age=31536000, immutable'
+        return self._serve_precompressed(self.root_dir + '/' + BUNDLE_DIR + '/' + name, 'application/javascript')
+
+    def _serve_precompressed(self, path, content_type):
+        # Serve whichever compressed copy the client takes, if it was made, and the file itself otherwise.
+        cherrypy.response.headers['Vary'] = 'Accept-Encoding'
+        accepted_set = set([element.value for element in cherrypy.request.headers.elements('Accept-Encoding') if element.qvalue > 0])
+        for encoding, suffix in [('br', '.br'), ('gzip', '.gz')]:
+            if encoding in accepted_set and os.path.exists(path + suffix):
+                cherrypy.response.headers['Content-Encoding'] = encoding
+                return cherrypy.lib.static.serve_file(path + suffix, content_type=content_type)
+        return cherrypy.lib.static.serve_file(path, content_type=content_type)
     
     @cherrypy.expose
     def puzzle(self, **kwargs):
         name = kwargs['name']
+        # Levels of detail are numbered coarsest first.  Whatever level isn't there, the full-detail puzzle stands in for it.
+        lod = kwargs.get('lod')
+        if lod is not None:
+            try:
+                lod = int(lod)
+            except ValueError:
+                raise cherrypy.HTTPError(400, 'Invalid LOD: %s' % lod)
+        archived = self.archive.get([name] if lod is None else ['%s.lod%d' % (name, lod), name])
+        if archived is not None:
+            data, entry = archived
+            mtime = entry['mtime']
+            cherrypy.response.headers['ETag'] = '"%s"' % entry['hash'][:32]
+            cherrypy.lib.cptools.validate_etags()
+        else:
+            puzzle_path = self.root_dir + '/puzzles/%s.json.gz' % name
+            if lod is not None:
+                lod_path = self.root_dir + '/puzzles/%s.lod%d.json.gz' % (name, lod)
+                if os.path.exists(lod_path):
+                    puzzle_path = lod_path
+            payload = self.payload_cache.get(puzzle_path)
+            if payload is None:
+                raise cherrypy.NotFound()
+            data, mtime = payload
+        cherrypy.response.headers['Content-Type'] = 'json'
+        cherrypy.response.headers['Last-Modified'] = cherrypy.lib.httputil.HTTPDate(mtime)
+        cherrypy.lib.cptools.validate_since()
         cherrypy.response.headers['Content-Encoding'] = 'gzip'
-        return cherrypy.lib.static.serve_file(self.root_dir + '/puzzles/%s.json.gz' % name, content_type='json')
+        return data
 
-if __name__ == '__main__':
-    root_dir = os.path.dirname(os.path.abspath(__file__))
-    port = int(os.environ.get('PORT', 5100))
-    server = PuzzleServer(root_dir)
-    config = {
-        'global': {
-            'server.socket_host': '127.0.0.1', #'0.0.0.0',
-            'server.socket_port': port,
-        },
+    @cherrypy.expose
+    def metrics(self, **kwargs):
+        cherrypy.response.headers['Content-Type'] = 'text/plain; version=0.0.4; charset=utf-8'
+        cherrypy.response.headers['Cache-Control'] = 'no-store'
+        return registry.render().encode('utf-8')
+
+def make_config(root_dir):
+    return {
         '/': {
             'tools.staticdir.root': root_dir,
             'tools.staticdir.on': True,
             'tools.staticdir.dir': '',
+            'tools.metrics.on': True,
         },
         '/puzzles': {
             'tools.staticdir.on': False,
             'tools.staticfile.on': False,
+        },
+        '/bundle': {
+            'tools.staticdir.on': False,
+        },
+        # Atlases are named after a hash of their contents, so they never change, and can be cached for good.  The
+        # menu data that names them has to be checked each time, but it compresses very well.
+        '/images/atlas': {
+            'tools.response_headers.on': True,
+            'tools.response_headers.headers': [('Cache-Control', 'public, max-age=31536000, immutable')],
+        },
+        '/puzzle_menu.json': {
+            'tools.response_headers.on': True,
+            'tools.response_headers.headers': [('Cache-Control', 'no-cache')],
+            'tools.gzip.on': True,
+            'tools.gzip.mime_types': ['application/json'],
         }
     }
-    cherrypy.quickstart(server, '/', config=config)
\ No newline at end of file
+
+class WorkerServer(cheroot.wsgi.Server):
+    # A server that accepts from the given socket, already bound by the master, instead of binding one of its own.
+    # The server still sets the socket up to listen and closes it when it stops, which only closes our copy of it.
+    def __init__(self, listen_socket, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.listen_socket = listen_socket
+
+    def bind(self, family, type, proto=0):
+        if self.listen_socket is None:
+            return super().bind(family, type, proto)
+        self.socket = self.listen_socket
+        self.bind_addr = self.resolve_real_bind_addr(self.socket)
+        return self.socket
+
+def make_listening_socket(args, reuse_port=False):
+    # Bind the socket the way cheroot would, so that it behaves the same whether a worker binds it or the master.
+    family, socket_type, proto, canonical_name, address = socket.getaddrinfo(args.host, args.port, socket.AF_UNSPEC, socket.SOCK_STREAM, 0, socket.AI_PASSIVE)[0]
+    listen_socket = cheroot.server.HTTPServer.prepare_socket((args.host, args.port), family, socket_type, proto, True, None, reuse_port)
+    listen_socket = cheroot.server.HTTPServer.bind_socket(listen_socket, address)
+    listen_socket.listen(args.socket_queue_size)
+    return listen_socket
+
+def run_worker(root_dir, args, listen_socket=None, reuse_port=False):
+    # Run the application under a cheroot server of our own making, rather than the one CherryPy's engine would
+    # start, since that one can't accept from a socket bound by another process, or share its port.
+    cherrypy.config.update({
+        'environment': 'production',
+        'engine.autoreload.on': False,
+    })
+    cherrypy.tree.mount(PuzzleServer(root_dir), '/', config=make_config(root_dir))
+    cherrypy.server.unsubscribe()
+    if args.metrics_dir is not None:
+        registry.share_dir = args.metrics_dir
+        cherrypy.process.plugins.Monitor(cherrypy.engine, registry.write_share, args.metrics_interval, name='MetricsShare').subscribe()
+    server = WorkerServer(
+        listen_socket,
+        (args.host, args.port),
+        cherrypy.tree,
+        numthreads=args.thread_pool,
+        max=args.thread_pool_max,
+        request_queue_size=args.socket_queue_size,
+        timeout=args.socket_timeout,
+        shutdown_timeout=args.shutdown_timeout,
+        accepted_queue_size=args.accepted_queue_size,
+        reuse_port=reuse_port
+    )
+    server.keep_alive_conn_limit = args.keep_alive_limit
+
+    # On SIGTERM, the server stops accepting, finishes what it's doing, and then we're done.
+    def handle_term(signum, frame):
+        raise SystemExit(0)
+    signal.signal(signal.SIGTERM, handle_term)
+
+    cherrypy.engine.start()
+    print('Worker %d serving on %s:%d with %d threads.' % (os.getpid(), args.host, args.port, args.thread_pool))
+    sys.stdout.flush()
+    try:
+        server.safe_start()
+    except (SystemExit, KeyboardInterrupt):
+        pass
+    finally:
+        cherrypy.engine.exit()
+        registry.remove_share()
+
+def calc_deploy_signature(root_dir):
+    # The bundle and the menu are read when a worker starts, so a new deployment of either needs new workers.
+    # Puzzles are checked on each request, so they don't figure here.
+    signature = []
+    for path in ['bundle/manifest.json', 'puzzle_menu.json']:
+        try:
+            stat = os.stat(os.path.join(root_dir, path))
+            signature.append((path, stat.st_mtime_ns, stat.st_size))
+        except OSError:
+            signature.append((path, None, None))
+    return signature
+
+def run_master(root_dir, args, worker_count):
+    # Unless the workers are to bind their own sockets, they all accept from this one, which they get by forking.
+    listen_socket = None if args.reuse_port else make_listening_socket(args)
+    state = {'stop': False, 'reload': False}
+    def handle_stop(signum, frame):
+        state['stop'] = True
+    def handle_reload(signum, frame):
+        state['reload'] = True
+    signal.signal(signal.SIGTERM, handle_stop)
+    signal.signal(signal.SIGINT, handle_stop)
+    signal.signal(signal.SIGHUP, handle_reload)
+
+    def spawn_worker():
+        pid = os.fork()
+        if pid == 0:
+            signal.signal(signal.SIGINT, signal.SIG_IGN)    # The master passes on a Ctrl+C as SIGTERM.
+            signal.signal(signal.SIGHUP, signal.SIG_DFL)
+            exit_code = 0
+            try:
+                run_worker(root_dir, args, listen_socket, args.reuse_port)
+            except Exception:
+                exit_code = 1
+                import traceback
+                traceback.print_exc()
+            finally:
+                sys.stdout.flush()
+                sys.stderr.flush()
+                os._exit(exit_code)
+        return pid
+
+    def remove_metrics_share(pid):
+        try:
+            os.remove(os.path.join(args.metrics_dir, '%d.json' % pid))
+        except OSError:
+            pass
+
+    def stop_worker(pid):
+        try:
+            os.kill(pid, signal.SIGTERM)
+            os.waitpid(pid, 0)
+        except (OSError, ChildProcessError):
+            pass
+
+    # The workers share what they've counted through a directory, which is ours to clean up unless we were given it.
+    made_metrics_dir = args.metrics_dir is None
+    if made_metrics_dir:
+        args.metrics_dir = tempfile.mkdtemp(prefix='puzzle_metrics_')
+
+    print('Master %d starting %d workers.' % (os.getpid(), worker_count))
+    sys.stdout.flush()
+    pid_list = [spawn_worker() for i in range(worker_count)]
+    signature = calc_deploy_signature(root_dir)
+    watch_time = time.monotonic()
+    while not state['stop']:
+        time.sleep(0.2)
+
+        # Replace any worker that died on its own.
+        while True:
+            try:
+                pid, status = os.waitpid(-1, os.WNOHANG)
+            except ChildProcessError:
+                break
+            if pid == 0:
+                break
+            if pid in pid_list and not state['stop']:
+                print('Worker %d exited with status %d; starting another.' % (pid, status))
+                remove_metrics_share(pid)
+                pid_list[pid_list.index(pid)] = spawn_worker()
+
+        if args.watch > 0 and time.monotonic() - watch_time >= args.watch:
+            watch_time = time.monotonic()
+            new_signature = calc_deploy_signature(root_dir)
+            if new_signature != signature:
+                print('Deployed files changed.')
+                signature = new_signature
+                state['reload'] = True
+
+        if state['reload'] and not state['stop']:
+            state['reload'] = False
+            print('Replacing %d workers.' % len(pid_list))
+            for i, old_pid in enumerate(list(pid_list)):
+                pid_list[i] = spawn_worker()
+                time.sleep(args.reload_delay)
+                stop_worker(old_pid)
+        sys.stdout.flush()
+
+    print('Stopping %d workers.' % len(pid_list))
+    for pid in pid_list:
+        try:
+            os.kill(pid, signal.SIGTERM)
+        except OSError:
+            pass
+    for pid in pid_list:
+        try:
+            os.waitpid(pid, 0)
+        except ChildProcessError:
+            pass
+    if made_metrics_dir:
+        shutil.rmtree(args.metrics_dir, ignore_errors=True)
+    if listen_socket is not None:
+        listen_socket.close()
+
+def main():
+    arg_parser = argparse.ArgumentParser(description='Serve the puzzle page.')
+    arg_parser.add_argument('--production', help='Serve from tuned worker processes instead of the development server.', action='store_true')
+    arg_parser.add_argument('--host', help='Address to bind.  Defaults to all interfaces in production, and to localhost otherwise.', type=str)
+    arg_parser.add_argument('--port', help='Port to bind.  Defaults to $PORT, or 5100.', type=int, default=int(os.environ.get('PORT', 5100)))
+    arg_parser.add_argument('--workers', help='Number of worker processes in production, or 0 for one per CPU.  Defaults to $WEB_CONCURRENCY, or 1.', type=int, default=int(os.environ.get('WEB_CONCURRENCY', 1)))
+    arg_parser.add_argument('--thread-pool', help='Number of request threads per worker.', type=int, default=20)
+    arg_parser.add_argument('--thread-pool-max', help='Most request threads per worker, or -1 for no limit.', type=int, default=-1)
+    arg_parser.add_argument('--socket-queue-size', help='Backlog of connections waiting to be accepted.', type=int, default=128)
+    arg_parser.add_argument('--accepted-queue-size', help='Accepted connections waiting for a thread, or -1 for no limit.', type=int, default=-1)
+    arg_parser.add_argument('--socket-timeout', help='Seconds an idle connection, including a kept-alive one, is kept open.', type=float, default=10.0)
+    arg_parser.add_argument('--keep-alive-limit', help='Idle kept-alive connections per worker before new ones are closed after each request.', type=int, default=10)
+    arg_parser.add_argument('--shutdown-timeout', help='Seconds a stopping worker waits for requests in progress.', type=float, default=5.0)
+    arg_parser.add_argument('--watch', help='Seconds between checks for a new deployment of the bundle or menu, or 0 not to check.', type=float, default=0.0)
+    arg_parser.add_argument('--metrics-dir', help='Directory where workers share their metrics.  Defaults to a temporary one.', type=str)
+    arg_parser.add_argument('--metrics-interval', help='Seconds between each worker\'s sharing of its metrics.', type=float, default=5.0)
+    arg_parser.add_argument('--reuse-port', help='Have each worker bind its own socket with SO_REUSEPORT, instead of all accepting from one.', action='store_true')
+    arg_parser.add_argument('--reload-delay', help='Seconds a new worker is given to start before an old one is stopped.', type=float, default=1.0)
+    args = arg_parser.parse_args()
+
+    root_dir = os.path.dirname(os.path.abspath(__file__))
+
+    if not args.production:
+        config = make_config(root_dir)
+        config['global'] = {
+            'server.socket_host': args.host or '127.0.0.1', #'0.0.0.0',
+            'server.socket_port': args.port,
+        }
+        cherrypy.quickstart(PuzzleServer(root_dir), '/', config=config)
+        return 0
+
+    if args.host is None:
+        args.host = '0.0.0.0'
+    worker_count = args.workers if args.workers > 0 else multiprocessing.cpu_count()
+    if args.reuse_port and not hasattr(socket, 'SO_REUSEPORT'):
+        print('There\'s no SO_REUSEPORT here, so the workers will share one socket.')
+        args.reuse_port = False
+    if not hasattr(os, 'fork'):
+        if worker_count > 1:
+            print('Worker processes need fork, so there will be just the one.')
+        run_worker(root_dir, args)
+    else:
+        run_master(root_dir, args, worker_count)
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,124 @@
+# puzzle_tessellation.py
+
+import math
+
+from math3d_triangle_mesh import TriangleMesh
+from math3d_vector import Vector
+from puzzle_geometry import edge_key
+
+def make_icosahedron(center, radius):
+    # Note that the triangles here are wound counter-clockwise when viewed from outside the sphere.
+    phi = (1.0 + math.sqrt(5.0)) / 2.0
+    point_list = [
+        Vector(-1.0, phi, 0.0), Vector(1.0, phi, 0.0), Vector(-1.0, -phi, 0.0), Vector(1.0, -phi, 0.0),
+        Vector(0.0, -1.0, phi), Vector(0.0, 1.0, phi), Vector(0.0, -1.0, -phi), Vector(0.0, 1.0, -phi),
+        Vector(phi, 0.0, -1.0), Vector(phi, 0.0, 1.0), Vector(-phi, 0.0, -1.0), Vector(-phi, 0.0, 1.0)
+    ]
+    vertex_list = [center + point.normalized() * radius for point in point_list]
+    triangle_list = [
+        (0, 11, 5), (0, 5, 1), (0, 1, 7), (0, 7, 10), (0, 10, 11),
+        (1, 5, 9), (5, 11, 4), (11, 10, 2), (10, 7, 6), (7, 1, 8),
+        (3, 9, 4), (3, 4, 2), (3, 2, 6), (3, 6, 8), (3, 8, 9),
+        (4, 9, 5), (2, 4, 11), (6, 2, 10), (8, 6, 7), (9, 8, 1)
+    ]
+    return vertex_list, triangle_list
+
+def refine_triangles(vertex_list, triangle_list, should_refine, project):
+    # This performs one level of conforming midpoint refinement.  Every triangle for which the given
+    # predicate holds is split 1-to-4, and any neighbor left with a single split edge is bisected so that
+    # no T-junctions are introduced.  A neighbor with two split edges is promoted to a 1-to-4 split.
+    # New vertices are placed on the surface using the given projection function.  The vertex list
+    # is appended to in place; the new triangle list is returned along with the number of refined triangles.
+    split_edge_set = set()
+    for triangle in triangle_list:
+        if should_refine(triangle):
+            for i in range(3):
+                split_edge_set.add(edge_key(triangle[i], triangle[(i + 1) % 3]))
+
+    refined_count = 0
+    while True:
+        promoted = False
+        for triangle in triangle_list:
+            edge_list = [edge_key(triangle[i], triangle[(i + 1) % 3]) for i in range(3)]
+            count = sum([1 if edge in split_edge_set else 0 for edge in edge_list])
+            if count == 2:
+                for edge in edge_list:
+                    split_edge_set.add(edge)
+                promoted = True
+        if not promoted:
+            break
+
+    if len(split_edge_set) == 0:
+        return triangle_list, refined_count
+
+    midpoint_map = {}
+    for edge in sorted(split_edge_set):
+        point = (vertex_list[edge[0]] + vertex_list[edge[1]]) / 2.0
+        midpoint_map[edge] = len(vertex_list)
+        vertex_list.append(project(point))
+
+    new_triangle_list = []
+    for triangle in triangle_list:
+        midpoint_list = [midpoint_map.get(edge_key(triangle[i], triangle[(i + 1) % 3])) for i in range(3)]
+        count = sum([1 if midpoint is not None else 0 for midpoint in midpoint_list])
+        if count == 0:
+            new_triangle_list.append(triangle)
+        elif count == 3:
+            a, b, c = triangle
+            ab, bc, ca = midpoint_list
+            new_triangle_list += [(a, ab, ca), (ab, b, bc), (ca, bc, c), (ab, bc, ca)]
+            refined_count += 1
+        else:
+            i = [j for j in range(3) if midpoint_list[j] is not None][0]
+            a, b, c = triangle[i], triangle[(i + 1) % 3], triangle[(i + 2) % 3]
+            m = midpoint_list[i]
+            new_triangle_list += [(a, m, c), (m, b, c)]
+
+    return new_triangle_list, refined_count
+
+def make_adaptive_sphere_mesh(center, radius, max_chord_error, bounds=None, max_level=6):
+    # Tessellate the given sphere, starting from an icosahedron, refining only those triangles that
+    # (1) deviate from the true sphere by more than the given chord error, and (2) could possibly touch
+    # the given bounding sphere, given as a (center, radius) pair.  Triangles nowhere near the puzzle
+    # never participate in a cut, so they are left coarse.  If no bounds are given, we refine everywhere.
+    vertex_list, triangle_list = make_icosahedron(center, radius)
+
+    def project(point):
+        return center + (point - center).resized(radius)
+
+    def should_refine(triangle):
+        point_a = vertex_list[triangle[0]]
+        point_b = vertex_list[triangle[1]]
+        point_c = vertex_list[triangle[2]]
+        normal = (point_b - point_a).cross(point_c - point_a)
+        if normal.length() == 0.0:
+            return False
+        chord_error = radius - math.fabs((center - point_a).dot(normal.normalized()))
+        if chord_error <= max_chord_error:
+            return False
+        if bounds is not None:
+            centroid = (point_a + point_b + point_c) / 3.0
+            triangle_radius = max([(point - centroid).length() for point in [point_a, point_b, point_c]]) + chord_error
+            bounds_center, bounds_radius = bounds
+            if (centroid - bounds_center).length() > triangle_radius + bounds_radius:
+                return False
+        return True
+
+    for level in range(max_level):
+        triangle_list, refined_count = refine_triangles(vertex_list, triangle_list, should_refine, project)
+        if refined_count == 0:
+            break
+
+    mesh = TriangleMesh()
+    mesh.vertex_list = vertex_list
+    mesh.triangle_list = triangle_list
+    return mesh
+
+def calc_bounding_sphere(mesh_list, margin=0.05):
+    # The returned sphere is centered at the origin, because most puzzles turn about axes through the origin,
+    # and such a sphere contains the puzzle no matter what state it's in.
+    radius = 0.0
+    for mesh in mesh_list:
+        for vertex in mesh.vertex_list:
+            radius = max(radius, vertex.length())
+    return Vector(0.0, 0.0, 0.0), radius * (1.0 + margin)
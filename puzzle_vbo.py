@@ -0,0 +1,166 @@
+# puzzle_vbo.py
+
+import ctypes
+
+import numpy
+
+from OpenGL.GL import *
+
+# This draws a whole puzzle out of a few buffers on the GPU, where the immediate-mode path in ColoredMesh makes a
+# call per vertex, every frame.  The faces of every mesh go into one vertex buffer, with a position, normal and color
+# per vertex, drawn with one index buffer, and the border loops of every mesh go into one buffer of line segments.
+# The buffers are filled once, and again only when the meshes change.  The index buffer keeps the meshes in their
+# original order, so blending comes out just as it did when they were drawn one at a time.  When the meshes have
+# been moved, each is drawn from its own ranges of the buffers under its own transform, which still beats immediate
+# mode by a wide margin.
+
+VERTEX_STRIDE = 10 * 4     # Position, normal and RGBA color, all as 32-bit floats.
+
+class VertexBufferRenderer(object):
+    def __init__(self):
+        self.vertex_buffer = None
+        self.index_buffer = None
+        self.line_buffer = None
+        self.index_count = 0
+        self.line_vertex_count = 0
+        self.vertex_count = 0
+        self.range_list = []
+
+    def upload(self, mesh_list, border_scale=1.001):
+        # A mesh without a normal per vertex is given a copy of each vertex per triangle, with the triangle's normal.
+        vertex_array_list = []
+        index_array_list = []
+        line_array_list = []
+        range_list = []
+        base = 0
+        index_start = 0
+        line_start = 0
+        for mesh in mesh_list:
+            if len(mesh.triangle_list) == 0:
+                range_list.append((index_start, 0, line_start, 0))
+                continue
+            color = [mesh.color.x, mesh.color.y, mesh.color.z, mesh.alpha]
+            point_array = numpy.array([(vertex.x, vertex.y, vertex.z) for vertex in mesh.vertex_list], dtype=numpy.float32)
+            triangle_array = numpy.array(mesh.triangle_list, dtype=numpy.uint32)
+            if len(mesh.normal_list) == len(mesh.vertex_list):
+                normal_array = numpy.array([(normal.x, normal.y, normal.z) for normal in mesh.normal_list], dtype=numpy.float32)
+                index_array = triangle_array
+            else:
+                point_array = point_array[triangle_array.ravel()]
+                corner_array = point_array.reshape((-1, 3, 3))
+                normal_array = numpy.cross(corner_array[:, 1] - corner_array[:, 0], corner_array[:, 2] - corner_array[:, 0])
+                normal_array /= numpy.maximum(numpy.linalg.norm(normal_array, axis=1), 1e-12)[:, None]
+                normal_array = numpy.repeat(normal_array, 3, axis=0)
+                index_array = numpy.arange(len(point_array), dtype=numpy.uint32).reshape((-1, 3))
+            vertex_array = numpy.empty((len(point_array), 10), dtype=numpy.float32)
+            vertex_array[:, 0:3] = point_array
+            vertex_array[:, 3:6] = normal_array
+            vertex_array[:, 6:10] = color
+            vertex_array_list.append(vertex_array)
+            index_array_list.append(index_array.ravel() + base)
+            base += len(vertex_array)
+
+            line_count = 0
+            for border_loop in mesh.border_loop_list:
+                loop_array = numpy.array([(mesh.vertex_list[i].x, mesh.vertex_list[i].y, mesh.vertex_list[i].z) for i in border_loop], dtype=numpy.float32)
+                segment_array = numpy.empty((len(loop_array) * 2, 3), dtype=numpy.float32)
+                segment_array[0::2] = loop_array
+                segment_array[1::2] = numpy.roll(loop_array, -1, axis=0)
+                line_array_list.append(segment_array * border_scale)
+                line_count += len(segment_array)
+
+            range_list.append((index_start, index_array.size, line_start, line_count))
+            index_start += index_array.size
+            line_start += line_count
+
+        self.release()
+        self.range_list = range_list
+        if len(vertex_array_list) == 0:
+            return
+        vertex_array = numpy.ascontiguousarray(numpy.concatenate(vertex_array_list))
+        index_array = numpy.ascontiguousarray(numpy.concatenate(index_array_list))
+        self.vertex_count = len(vertex_array)
+        self.index_count = len(index_array)
+        self.vertex_buffer = self._make_buffer(GL_ARRAY_BUFFER, vertex_array)
+        self.index_buffer = self._make_buffer(GL_ELEMENT_ARRAY_BUFFER, index_array)
+        if len(line_array_list) > 0:
+            line_array = numpy.ascontiguousarray(numpy.concatenate(line_array_list))
+            self.line_vertex_count = len(line_array)
+            self.line_buffer = self._make_buffer(GL_ARRAY_BUFFER, line_array)
+
+    def _make_buffer(self, target, array):
+        buffer = glGenBuffers(1)
+        glBindBuffer(target, buffer)
+        glBufferData(target, array.nbytes, array, GL_STATIC_DRAW)
+        glBindBuffer(target, 0)
+        return buffer
+
+    def release(self):
+        for buffer in [self.vertex_buffer, self.index_buffer, self.line_buffer]:
+            if buffer is not None:
+                glDeleteBuffers(1, [buffer])
+        self.vertex_buffer = None
+        self.index_buffer = None
+        self.line_buffer = None
+        self.index_count = 0
+        self.line_vertex_count = 0
+        self.vertex_count = 0
+        self.range_list = []
+
+    def render(self, transform_list=None):
+        # When given, the transforms are 4x4 matrices for column vectors, one per mesh uploaded.
+        if self.vertex_buffer is None:
+            return
+
+        # The immediate-mode path sets the ambient material to a third of the color, lit by a white ambient light.
+        # Tracking the color for both instead, and dimming the light to match, gives the same shade.
+        glPushAttrib(GL_LIGHTING_BIT)
+        glEnable(GL_LIGHTING)
+        glEnable(GL_COLOR_MATERIAL)
+        glColorMaterial(GL_FRONT, GL_AMBIENT_AND_DIFFUSE)
+        glMaterialfv(GL_FRONT, GL_SPECULAR, [1.0, 1.0, 1.0, 1.0])
+        glMaterialfv(GL_FRONT, GL_SHININESS, [30.0])
+        glLightfv(GL_LIGHT0, GL_AMBIENT, [0.3, 0.3, 0.3, 1.0])
+        glLightModelfv(GL_LIGHT_MODEL_AMBIENT, [0.06, 0.06, 0.06, 1.0])
+
+        glBindBuffer(GL_ARRAY_BUFFER, self.vertex_buffer)
+        glBindBuffer(GL_ELEMENT_ARRAY_BUFFER, self.index_buffer)
+        glEnableClientState(GL_VERTEX_ARRAY)
+        glEnableClientState(GL_NORMAL_ARRAY)
+        glEnableClientState(GL_COLOR_ARRAY)
+        try:
+            glVertexPointer(3, GL_FLOAT, VERTEX_STRIDE, ctypes.c_void_p(0))
+            glNormalPointer(GL_FLOAT, VERTEX_STRIDE, ctypes.c_void_p(3 * 4))
+            glColorPointer(4, GL_FLOAT, VERTEX_STRIDE, ctypes.c_void_p(6 * 4))
+            if transform_list is None:
+                glDrawElements(GL_TRIANGLES, self.index_count, GL_UNSIGNED_INT, ctypes.c_void_p(0))
+            else:
+                for (index_start, index_count, line_start, line_count), transform in zip(self.range_list, transform_list):
+                    if index_count > 0:
+                        glPushMatrix()
+                        glMultMatrixd(transform.T.ravel())
+                        glDrawElements(GL_TRIANGLES, index_count, GL_UNSIGNED_INT, ctypes.c_void_p(index_start * 4))
+                        glPopMatrix()
+        finally:
+            glDisableClientState(GL_COLOR_ARRAY)
+            glDisableClientState(GL_NORMAL_ARRAY)
+            glBindBuffer(GL_ELEMENT_ARRAY_BUFFER, 0)
+            glPopAttrib()
+
+        glDisable(GL_LIGHTING)
+        if self.line_buffer is not None:
+            glBindBuffer(GL_ARRAY_BUFFER, self.line_buffer)
+            glColor3f(0.0, 0.0, 0.0)
+            glLineWidth(4.0)
+            glVertexPointer(3, GL_FLOAT, 0, ctypes.c_void_p(0))
+            if transform_list is None:
+                glDrawArrays(GL_LINES, 0, self.line_vertex_count)
+            else:
+                for (index_start, index_count, line_start, line_count), transform in zip(self.range_list, transform_list):
+                    if line_count > 0:
+                        glPushMatrix()
+                        glMultMatrixd(transform.T.ravel())
+                        glDrawArrays(GL_LINES, line_start, line_count)
+                        glPopMatrix()
+        glDisableClientState(GL_VERTEX_ARRAY)
+        glBindBuffer(GL_ARRAY_BUFFER, 0)
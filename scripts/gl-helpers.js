@@ -41,7 +41,10 @@ class ShaderProgram {
     
     _promise_shader(source, type) {
         return new Promise((resolve, reject) => {
-            $.get(source, text => {
+            // The bundled page carries its shaders with it, so only the loose page has to fetch them.
+            let get_source = (typeof puzzle_shader_source_map !== 'undefined' && source in puzzle_shader_source_map) ?
+                (source, callback) => callback(puzzle_shader_source_map[source]) : $.get;
+            get_source(source, text => {
                 let shader = gl.createShader(type);
                 gl.shaderSource(shader, text);
                 gl.compileShader(shader);
@@ -0,0 +1,99 @@
+# test_archive.py
+
+import os
+import gzip
+import hashlib
+
+import pytest
+
+from puzzle_archive import build_archive, find_puzzle_files, PuzzleArchive
+
+def write_puzzle(puzzle_dir, name, text):
+    path = os.path.join(str(puzzle_dir), name + '.json.gz')
+    with gzip.open(path, 'wb') as handle:
+        handle.write(text.encode('utf-8'))
+    with open(path, 'rb') as handle:
+        return handle.read()
+
+@pytest.fixture
+def puzzle_dir(tmp_path):
+    puzzle_dir = tmp_path / 'puzzles'
+    puzzle_dir.mkdir()
+    return puzzle_dir
+
+def test_find_puzzle_files_names_levels_of_detail_apart(puzzle_dir):
+    write_puzzle(puzzle_dir, 'RubiksCube', '{}')
+    write_puzzle(puzzle_dir, 'RubiksCube.lod0', '{}')
+    (puzzle_dir / 'notes.txt').write_text('not a puzzle')
+    assert sorted(find_puzzle_files(str(puzzle_dir))) == ['RubiksCube', 'RubiksCube.lod0']
+
+def test_archive_serves_each_payload_as_it_was(puzzle_dir):
+    payload_map = {
+        'RubiksCube': write_puzzle(puzzle_dir, 'RubiksCube', '{"mesh_list": []}'),
+        'RubiksCube.lod0': write_puzzle(puzzle_dir, 'RubiksCube.lod0', '{"lod": 0}'),
+        'Skewb': write_puzzle(puzzle_dir, 'Skewb', '{"mesh_list": [1, 2, 3]}')
+    }
+    archive_path = str(puzzle_dir / 'puzzles.pack')
+    entry_map = build_archive(str(puzzle_dir), archive_path)
+    assert sorted(entry_map) == sorted(payload_map)
+    assert not os.path.exists(archive_path + '.tmp')
+
+    archive = PuzzleArchive(archive_path)
+    assert archive.entry_count == 3
+    assert archive.byte_count == os.path.getsize(archive_path)
+    for name, payload in payload_map.items():
+        data, entry = archive.get([name])
+        assert data == payload
+        assert entry['encoding'] == 'gzip'
+        assert entry['hash'] == hashlib.sha256(payload).hexdigest()
+
+def test_get_takes_the_first_name_the_archive_has_and_counts_once(puzzle_dir):
+    write_puzzle(puzzle_dir, 'Skewb', '{}')
+    archive_path = str(puzzle_dir / 'puzzles.pack')
+    build_archive(str(puzzle_dir), archive_path)
+    archive = PuzzleArchive(archive_path)
+    data, entry = archive.get(['Skewb.lod0', 'Skewb'])
+    assert entry is archive.entry_map['Skewb']
+    assert archive.get(['Megaminx.lod0', 'Megaminx']) is None
+    assert (archive.hit_count, archive.miss_count) == (1, 1)
+
+def test_replaced_archive_is_mapped_in_place_of_the_old(puzzle_dir):
+    write_puzzle(puzzle_dir, 'Skewb', '{"version": 1}')
+    archive_path = str(puzzle_dir / 'puzzles.pack')
+    build_archive(str(puzzle_dir), archive_path)
+    archive = PuzzleArchive(archive_path, check_interval=0.0)
+    old_data, old_entry = archive.get(['Skewb'])
+
+    new_payload = write_puzzle(puzzle_dir, 'Skewb', '{"version": 2, "more": true}')
+    write_puzzle(puzzle_dir, 'Dogic', '{}')
+    build_archive(str(puzzle_dir), archive_path)
+    data, entry = archive.get(['Skewb'])
+    assert data == new_payload
+    assert archive.entry_count == 2
+    assert archive.eviction_count == 1
+    # What was read from the old mapping is still good.
+    assert old_data != data and len(old_data) == old_entry['length']
+
+def test_missing_archive_misses_until_one_is_built(puzzle_dir):
+    archive_path = str(puzzle_dir / 'puzzles.pack')
+    archive = PuzzleArchive(archive_path, check_interval=0.0)
+    assert archive.entry_count == 0
+    assert archive.byte_count == 0
+    assert archive.get(['Skewb']) is None
+    assert archive.miss_count == 1
+
+    payload = write_puzzle(puzzle_dir, 'Skewb', '{}')
+    build_archive(str(puzzle_dir), archive_path)
+    assert archive.get(['Skewb'])[0] == payload
+
+    os.remove(archive_path)
+    assert archive.get(['Skewb']) is None
+    assert archive.entry_count == 0
+    assert archive.eviction_count == 1
+
+def test_file_that_is_not_an_archive_is_refused(puzzle_dir):
+    archive_path = str(puzzle_dir / 'puzzles.pack')
+    with open(archive_path, 'wb') as handle:
+        handle.write(b'NOTAPACK' + b'\0' * 16)
+    with pytest.raises(Exception):
+        PuzzleArchive(archive_path)
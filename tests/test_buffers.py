@@ -0,0 +1,157 @@
+# test_buffers.py
+
+import json
+import math
+import zlib
+import struct
+
+import pytest
+
+from types import SimpleNamespace
+
+from puzzle_buffers import make_packed_buffers, unpack_puzzle_data
+
+def vector(x, y, z=0.0):
+    return SimpleNamespace(x=x, y=y, z=z)
+
+def make_piece(offset):
+    # A unit square split into two triangles, with a triangle apart from it, so that the piece has two border loops.
+    # Positions are deliberately ones that neither single precision nor quantization can hold exactly.
+    third = 1.0 / 3.0
+    vertex_list = [vector(offset, 0.0, third), vector(offset + 1.0, 0.0, third), vector(offset + 1.0, 1.0, third), vector(offset, 1.0, third),
+                   vector(offset + 2.0, 1e-9, -third), vector(offset + 3.0, 1e-9, -third), vector(offset + 2.5, 0.7, -third)]
+    uv_list = [vector(vertex.x / 4.0, vertex.y) for vertex in vertex_list]
+    normal_list = [vector(0.0, 0.0, 1.0)] * 4 + [vector(0.0, 0.0, -1.0)] * 3
+    return SimpleNamespace(
+        vertex_list=vertex_list,
+        uv_list=uv_list,
+        normal_list=normal_list,
+        triangle_list=[(0, 1, 2), (0, 2, 3), (4, 5, 6)],
+        border_loop_list=[[0, 1, 2, 3], [4, 5, 6]]
+    )
+
+def position(vertex):
+    return (vertex['x'], vertex['y'], vertex['z']) if isinstance(vertex, dict) else (vertex.x, vertex.y, vertex.z)
+
+def rotate_to_least(item_list):
+    k = item_list.index(min(item_list))
+    return tuple(item_list[k:] + item_list[:k])
+
+def triangle_set(vertex_list, triangle_list):
+    # Triangles by their corner positions, in winding order, whatever the numbering of the vertices.
+    return set([rotate_to_least([position(vertex_list[i]) for i in triangle]) for triangle in triangle_list])
+
+def loop_set(vertex_list, loop_list):
+    return set([rotate_to_least([position(vertex_list[i]) for i in loop]) for loop in loop_list])
+
+def make_dome(offset, n=24):
+    # A finely tessellated curved patch on a grid turned off the axes, so that its positions, UVs and normals hardly
+    # ever repeat a value, as on the puzzles that quantization is for.
+    vertex_list = []
+    normal_list = []
+    c, s = math.cos(0.3), math.sin(0.3)
+    for j in range(n + 1):
+        for i in range(n + 1):
+            u, v = i / float(n) - 0.5, j / float(n) - 0.5
+            x, y = c * u - s * v, s * u + c * v
+            z = math.sqrt(2.0 - x * x - y * y)
+            vertex_list.append(vector(offset + x, y, z))
+            normal_list.append(vector(x / math.sqrt(2.0), y / math.sqrt(2.0), z / math.sqrt(2.0)))
+    triangle_list = []
+    for j in range(n):
+        for i in range(n):
+            k = j * (n + 1) + i
+            triangle_list += [(k, k + 1, k + n + 2), (k, k + n + 2, k + n + 1)]
+    border_loop = list(range(n + 1)) + [j * (n + 1) + n for j in range(1, n + 1)] + [n * (n + 1) + i for i in range(n - 1, -1, -1)] + [j * (n + 1) for j in range(n - 1, 0, -1)]
+    return SimpleNamespace(
+        vertex_list=vertex_list,
+        uv_list=[vector(vertex.x - offset + 0.5, vertex.y + 0.5) for vertex in vertex_list],
+        normal_list=normal_list,
+        triangle_list=triangle_list,
+        border_loop_list=[border_loop]
+    )
+
+def quantization_tolerance(buffer_data):
+    scale = buffer_data['vertex_encoding']['scale']
+    return 0.5 * math.sqrt(scale[0] ** 2 + scale[1] ** 2 + scale[2] ** 2)
+
+def snap(vertex_list, exact_list, tolerance):
+    # Map each decoded position to the exact one it came from, checking that it's within the given tolerance.
+    snapped_list = []
+    for vertex in vertex_list:
+        exact = min(exact_list, key=lambda exact: max([abs(a - b) for a, b in zip(position(vertex), position(exact))]))
+        assert math.sqrt(sum([(a - b) ** 2 for a, b in zip(position(vertex), position(exact))])) <= tolerance
+        snapped_list.append(exact)
+    return snapped_list
+
+def pack_and_unpack(mesh_list, quantization_bits):
+    buffer_data, range_list = make_packed_buffers(mesh_list, quantization_bits)
+    puzzle_data = {'mesh_list': [dict(mesh_range) for mesh_range in range_list], 'packed_buffers': buffer_data}
+    # Go through JSON, as a puzzle file does.
+    return buffer_data, range_list, unpack_puzzle_data(json.loads(json.dumps(puzzle_data)))
+
+@pytest.mark.parametrize('make_mesh', [make_piece, make_dome])
+@pytest.mark.parametrize('quantization_bits', [None, (16, 10, 12)])
+def test_round_trip_keeps_positions_triangles_and_border_loops(make_mesh, quantization_bits):
+    mesh_list = [make_mesh(0.0), make_mesh(10.0)]
+    buffer_data, range_list, puzzle_data = pack_and_unpack(mesh_list, quantization_bits)
+    assert 'packed_buffers' not in puzzle_data
+    # Positions come back exactly unless they were quantized, and then to within half a quantization cell.
+    tolerance = quantization_tolerance(buffer_data) if 'vertex_encoding' in buffer_data else 0.0
+    for mesh, mesh_data, mesh_range in zip(mesh_list, puzzle_data['mesh_list'], range_list):
+        vertex_list = snap(mesh_data['vertex_list'], mesh.vertex_list, tolerance)
+        assert set([position(vertex) for vertex in vertex_list]) == set([position(vertex) for vertex in mesh.vertex_list])
+        assert triangle_set(vertex_list, mesh_data['triangle_list']) == triangle_set(mesh.vertex_list, mesh.triangle_list)
+        assert loop_set(vertex_list, mesh_data['border_loop_list']) == loop_set(mesh.vertex_list, mesh.border_loop_list)
+        # The page counts a piece's triangles from its index range, since it has no triangle list of its own.
+        assert mesh_range['index_range'][1] // 3 == len(mesh.triangle_list)
+
+def test_quantization_is_kept_only_where_it_makes_the_buffers_smaller():
+    def size(buffer_data):
+        return len(zlib.compress(json.dumps(buffer_data, indent=4, separators=(',', ': '), sort_keys=True).encode('utf-8')))
+    for mesh_list, quantized in [([make_piece(0.0), make_piece(10.0)], False), ([make_dome(0.0), make_dome(10.0)], True)]:
+        buffer_data, range_list = make_packed_buffers(mesh_list, (16, 10, 12))
+        assert ('vertex_encoding' in buffer_data) == quantized
+        assert size(buffer_data) <= size(make_packed_buffers(mesh_list)[0])
+
+def test_quantized_uvs_and_normals_are_within_a_step():
+    mesh_list = [make_dome(0.0)]
+    buffer_data, range_list, puzzle_data = pack_and_unpack(mesh_list, (16, 10, 12))
+    assert 'vertex_encoding' in buffer_data
+    mesh = mesh_list[0]
+    mesh_data = puzzle_data['mesh_list'][0]
+    vertex_list = snap(mesh_data['vertex_list'], mesh.vertex_list, quantization_tolerance(buffer_data))
+    index_map = dict([(position(vertex), i) for i, vertex in enumerate(mesh.vertex_list)])
+    for vertex, uv, normal in zip(vertex_list, mesh_data['uv_list'], mesh_data['normal_list']):
+        i = index_map[position(vertex)]
+        assert math.fabs(uv['x'] - mesh.uv_list[i].x) <= 1.0 / (1 << 12)
+        assert math.fabs(uv['y'] - mesh.uv_list[i].y) <= 1.0 / (1 << 12)
+        for c in ['x', 'y', 'z']:
+            assert math.fabs(normal[c] - getattr(mesh.normal_list[i], c)) <= 2.0 / (1 << 10)
+
+def test_unquantized_uvs_are_written_as_short_single_precision_numbers():
+    mesh_list = [make_piece(0.0)]
+    buffer_data, range_list = make_packed_buffers(mesh_list)
+    assert 'position_buffer' not in buffer_data
+    count = buffer_data['vertex_count']
+    single = lambda value: struct.unpack('<f', struct.pack('<f', value))[0]
+    for value, vertex in zip(buffer_data['vertex_buffer'][3 * count:4 * count], mesh_list[0].vertex_list):
+        assert single(value) == single(vertex.x / 4.0)
+        assert len(repr(value)) <= len(repr(single(vertex.x / 4.0)))
+    buffer_data, range_list, puzzle_data = pack_and_unpack(mesh_list, None)
+    assert [uv['x'] for uv in puzzle_data['mesh_list'][0]['uv_list']] == buffer_data['vertex_buffer'][3 * count:4 * count]
+
+def test_vertices_that_agree_in_everything_are_welded_within_a_piece_only():
+    mesh = make_piece(0.0)
+    # Repeat the first vertex under a new index.
+    mesh.vertex_list.append(mesh.vertex_list[0])
+    mesh.uv_list.append(mesh.uv_list[0])
+    mesh.normal_list.append(mesh.normal_list[0])
+    mesh.triangle_list[1] = (7, 2, 3)
+    buffer_data, range_list = make_packed_buffers([mesh, make_piece(0.0)])
+    assert [mesh_range['vertex_range'][1] for mesh_range in range_list] == [7, 7]
+    assert buffer_data['vertex_count'] == 14
+
+def test_unpacked_puzzle_data_passes_through():
+    puzzle_data = {'mesh_list': [{'vertex_list': []}]}
+    assert unpack_puzzle_data(puzzle_data) is puzzle_data
@@ -0,0 +1,63 @@
+# test_bundle.py
+
+import os
+import shutil
+import subprocess
+
+import pytest
+
+from puzzle_bundle import minify_js
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+requires_node = pytest.mark.skipif(shutil.which('node') is None, reason='node is not installed')
+
+def run_node(tmp_path, source, name='script.js'):
+    path = tmp_path / name
+    path.write_text(source)
+    return subprocess.run(['node', str(path)], capture_output=True, text=True, check=True).stdout
+
+def test_comments_and_indentation_go_but_line_breaks_stay():
+    source = '// A comment.\nfunction f(a) {\n    /* Another. */\n    let b = a + 1;  // Trailing.\n\n\n    return b;\n}\n'
+    assert minify_js(source) == 'function f(a) {\nlet b = a + 1;\nreturn b;\n}\n'
+
+def test_block_comment_within_a_line_leaves_a_space():
+    assert minify_js('let a = 1;/* between */let b = 2;\n') == 'let a = 1; let b = 2;\n'
+
+def test_license_comments_are_kept():
+    source = '/*! Copyright someone. */\nlet a = 1;\n'
+    assert minify_js(source) == source
+
+def test_strings_and_templates_are_copied_as_they_are():
+    source = 'let a = "// not a comment";\nlet b = \'/* nor this */\';\nlet c = `${a}  //  ${ {x: "}"}.x }`;\nlet d = "escaped \\" // quote";\n'
+    assert minify_js(source) == source
+
+def test_regular_expressions_are_copied_but_division_is_not_taken_for_one():
+    source = 'let r = text.replace(/\\/\\/.*$/g, "");\nlet s = [/[/]/, 1];\nlet q = a / b / c; // Divided.\n'
+    assert minify_js(source) == 'let r = text.replace(/\\/\\/.*$/g, "");\nlet s = [/[/]/, 1];\nlet q = a / b / c;\n'
+
+@requires_node
+def test_minified_script_behaves_the_same(tmp_path):
+    source = '\n'.join([
+        '// Semicolons are left out on purpose, to lean on their insertion at line breaks.',
+        'let a = 6',
+        'let b = 3',
+        'let list = [a / b, /x\\/y/.test("x/y"), `${a} // ${b}`, "/* kept */"]',
+        '/* A block',
+        '   comment. */',
+        'let c = a',
+        '++b',
+        'console.log(JSON.stringify([list, c, b]))',
+        ''
+    ])
+    assert run_node(tmp_path, minify_js(source), 'minified.js') == run_node(tmp_path, source)
+
+@requires_node
+@pytest.mark.parametrize('name', ['puzzle_page.js', 'puzzle_menu.js', 'puzzle_sequence.js'])
+def test_minified_page_scripts_still_parse(tmp_path, name):
+    with open(os.path.join(REPO_DIR, name), 'r') as handle:
+        source = handle.read()
+    path = tmp_path / name
+    path.write_text(minify_js(source))
+    result = subprocess.run(['node', '--check', str(path)], capture_output=True, text=True)
+    assert result.returncode == 0, result.stderr
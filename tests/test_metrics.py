@@ -0,0 +1,98 @@
+# test_metrics.py
+
+import os
+import json
+from types import SimpleNamespace
+
+from puzzle_metrics import MetricsRegistry, LATENCY_BUCKET_LIST, format_labels
+
+OTHER_PID = '999999999'
+
+def make_cache(entry_count=0, byte_count=0, hit_count=0):
+    return SimpleNamespace(hit_count=hit_count, miss_count=0, eviction_count=0, entry_count=entry_count, byte_count=byte_count)
+
+def make_registry(tmp_path, other_entry_list=None):
+    registry = MetricsRegistry()
+    registry.share_dir = str(tmp_path)
+    if other_entry_list is not None:
+        (tmp_path / (OTHER_PID + '.json')).write_text(json.dumps(other_entry_list))
+    return registry
+
+def find_value(text, line_start):
+    line_list = [line for line in text.splitlines() if line.startswith(line_start + ' ')]
+    assert len(line_list) == 1, text
+    return line_list[0].split(' ')[-1]
+
+def test_counters_are_added_up_across_workers(tmp_path):
+    registry = make_registry(tmp_path, [
+        ['puzzle_http_requests_total', [['route', 'puzzle'], ['status', '200']], 2],
+        ['puzzle_cache_hits_total', [['cache', 'archive']], 10]
+    ])
+    registry.add_cache('archive', make_cache(hit_count=5), shared=True)
+    registry.start_request('puzzle')
+    registry.end_request('puzzle', 200, 0.01, 100, 'gzip', 'RubiksCube')
+    text = registry.render()
+    assert find_value(text, 'puzzle_http_requests_total{route="puzzle",status="200"}') == '3'
+    assert find_value(text, 'puzzle_cache_hits_total{cache="archive"}') == '15'
+    assert find_value(text, 'puzzle_puzzle_bytes_total{encoding="gzip",puzzle="RubiksCube"}') == '100'
+
+def test_shared_cache_gauges_take_the_largest(tmp_path):
+    registry = make_registry(tmp_path, [
+        ['puzzle_cache_entries', [['cache', 'archive']], 7],
+        ['puzzle_cache_bytes', [['cache', 'archive']], 1000]
+    ])
+    registry.add_cache('archive', make_cache(entry_count=9, byte_count=800), shared=True)
+    text = registry.render()
+    assert find_value(text, 'puzzle_cache_entries{cache="archive"}') == '9'
+    assert find_value(text, 'puzzle_cache_bytes{cache="archive"}') == '1000'
+
+def test_worker_gauges_are_labeled_rather_than_added_up(tmp_path):
+    registry = make_registry(tmp_path, [
+        ['puzzle_http_requests_in_flight', [['route', 'puzzle'], ['worker', OTHER_PID]], 3],
+        ['puzzle_cache_entries', [['cache', 'page'], ['worker', OTHER_PID]], 4]
+    ])
+    registry.add_cache('page', make_cache(entry_count=2))
+    registry.start_request('puzzle')
+    text = registry.render()
+    own_pid = str(os.getpid())
+    assert find_value(text, 'puzzle_http_requests_in_flight{route="puzzle",worker="%s"}' % own_pid) == '1'
+    assert find_value(text, 'puzzle_http_requests_in_flight{route="puzzle",worker="%s"}' % OTHER_PID) == '3'
+    assert find_value(text, 'puzzle_cache_entries{cache="page",worker="%s"}' % own_pid) == '2'
+    assert find_value(text, 'puzzle_cache_entries{cache="page",worker="%s"}' % OTHER_PID) == '4'
+
+def test_histogram_buckets_are_cumulative_and_added_up(tmp_path):
+    other_histogram = [0] * (len(LATENCY_BUCKET_LIST) + 3)
+    other_histogram[-3] = 1     # One request slower than the largest bound.
+    other_histogram[-2] = 20.0
+    other_histogram[-1] = 1
+    registry = make_registry(tmp_path, [['puzzle_http_request_duration_seconds', [['route', 'page']], other_histogram]])
+    for seconds in [0.003, 0.2]:
+        registry.start_request('page')
+        registry.end_request('page', 200, seconds, 0, 'identity', None)
+    text = registry.render()
+    name = 'puzzle_http_request_duration_seconds'
+    assert find_value(text, name + '_bucket{route="page",le="0.001"}') == '0'
+    assert find_value(text, name + '_bucket{route="page",le="0.005"}') == '1'
+    assert find_value(text, name + '_bucket{route="page",le="0.1"}') == '1'
+    assert find_value(text, name + '_bucket{route="page",le="0.25"}') == '2'
+    assert find_value(text, name + '_bucket{route="page",le="10.0"}') == '2'
+    assert find_value(text, name + '_bucket{route="page",le="+Inf"}') == '3'
+    assert find_value(text, name + '_count{route="page"}') == '3'
+    assert abs(float(find_value(text, name + '_sum{route="page"}')) - 20.203) < 1e-9
+    assert '# TYPE %s histogram' % name in text
+
+def test_broken_shares_and_our_own_are_skipped(tmp_path):
+    registry = make_registry(tmp_path)
+    registry.start_request('page')
+    registry.end_request('page', 200, 0.01, 10, 'identity', None)
+    registry.write_share()
+    (tmp_path / (OTHER_PID + '.json')).write_text('[["puzzle_http_requests_total", [["rou')
+    (tmp_path / (OTHER_PID + '.json.tmp')).write_text('not a share')
+    text = registry.render()
+    assert find_value(text, 'puzzle_http_requests_total{route="page",status="200"}') == '1'
+    registry.remove_share()
+    assert not os.path.exists(os.path.join(str(tmp_path), '%d.json' % os.getpid()))
+
+def test_format_labels_escapes_values():
+    assert format_labels(()) == ''
+    assert format_labels((('puzzle', 'a"b\\c\nd'),)) == '{puzzle="a\\"b\\\\c\\nd"}'
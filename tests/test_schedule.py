@@ -0,0 +1,59 @@
+# test_schedule.py
+
+import math
+
+from types import SimpleNamespace
+
+from puzzle_schedule import Cut, Apply, simplify_cut_schedule
+
+# Only the angle of a generator matters to the simplification.
+def make_generator_list(*angle_list):
+    return [SimpleNamespace(angle=angle) for angle in angle_list]
+
+def describe(schedule):
+    return [repr(step) for step in schedule]
+
+def test_cut_of_all_generators_is_made_explicit():
+    schedule = simplify_cut_schedule([Cut(), Cut([1])], make_generator_list(math.pi / 2.0, math.pi / 2.0))
+    assert describe(schedule) == ['Cut([0, 1])', 'Cut([1])']
+
+def test_turns_in_the_same_direction_merge_without_symmetry():
+    schedule = simplify_cut_schedule([Apply(0), Apply(0), Apply(0, inverse=True, count=2), Apply(0, inverse=True)], make_generator_list(math.pi / 2.0))
+    assert describe(schedule) == ['Apply(0, count=2)', 'Apply(0, inverse=True, count=3)']
+
+def test_opposite_turns_are_kept_without_symmetry():
+    schedule = simplify_cut_schedule([Cut(), Apply(0), Apply(0, inverse=True), Cut()], make_generator_list(math.pi / 2.0))
+    assert describe(schedule) == ['Cut([0])', 'Apply(0)', 'Apply(0, inverse=True)', 'Cut([0])']
+
+def test_whole_turns_are_kept_without_symmetry():
+    schedule = simplify_cut_schedule([Apply(0, count=4)], make_generator_list(math.pi / 2.0))
+    assert describe(schedule) == ['Apply(0, count=4)']
+
+def test_opposite_turns_cancel_with_symmetry():
+    schedule = simplify_cut_schedule([Cut(), Apply(0), Apply(0, inverse=True), Cut()], make_generator_list(math.pi / 2.0), {0})
+    assert describe(schedule) == ['Cut([0])', 'Cut([0])']
+
+def test_whole_turns_drop_and_long_ways_round_shorten_with_symmetry():
+    generator_list = make_generator_list(math.pi / 2.0, 2.0 * math.pi / 3.0)
+    assert describe(simplify_cut_schedule([Apply(0, count=4)], generator_list, {0})) == []
+    assert describe(simplify_cut_schedule([Apply(0, count=3)], generator_list, {0})) == ['Apply(0, inverse=True)']
+    assert describe(simplify_cut_schedule([Apply(1), Apply(1)], generator_list, {1})) == ['Apply(1, inverse=True)']
+
+def test_turns_of_an_angle_that_does_not_divide_a_full_turn_never_wrap():
+    schedule = simplify_cut_schedule([Apply(0, count=20)], make_generator_list(1.0), {0})
+    assert describe(schedule) == ['Apply(0, count=20)']
+
+def test_different_generators_are_never_reordered_or_merged_across():
+    generator_list = make_generator_list(math.pi / 2.0, math.pi / 2.0)
+    schedule = simplify_cut_schedule([Apply(0), Apply(1), Apply(0, inverse=True)], generator_list, {0, 1})
+    assert describe(schedule) == ['Apply(0)', 'Apply(1)', 'Apply(0, inverse=True)']
+
+def test_turns_are_not_merged_across_cuts():
+    generator_list = make_generator_list(math.pi / 2.0)
+    schedule = simplify_cut_schedule([Apply(0), Cut(), Apply(0, inverse=True)], generator_list, {0})
+    assert describe(schedule) == ['Apply(0)', 'Cut([0])', 'Apply(0, inverse=True)']
+
+def test_only_the_symmetric_generator_of_a_run_cancels():
+    generator_list = make_generator_list(math.pi / 2.0, math.pi / 2.0)
+    schedule = [Apply(0), Apply(0, inverse=True), Apply(1), Apply(1, inverse=True)]
+    assert describe(simplify_cut_schedule(schedule, generator_list, {1})) == ['Apply(0)', 'Apply(0, inverse=True)']